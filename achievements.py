@@ -0,0 +1,236 @@
+"""
+Rule-based achievement engine.
+
+Trade and friendship handlers only ``publish(user_id, event)`` onto an
+in-process queue. A background thread drains the queue in batches, looks up
+each user's earned achievements in a cached bitmap, evaluates only the rules
+that the event can affect and that the user hasn't already earned, and
+inserts all new awards for the batch in one statement.
+
+The achievement catalog is loaded once and cached; call
+``invalidate_catalog()`` after changing the Achievement table.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from functools import cached_property
+
+from sqlalchemy import func, insert, select, update
+
+logger = logging.getLogger(__name__)
+
+TRADE = 'trade'
+FRIENDSHIP = 'friendship'
+PROFILE = 'profile'
+
+
+class UserFacts:
+    """Lazily computed per-user facts; each query runs at most once per evaluation"""
+
+    def __init__(self, db, models, user_id):
+        self.db = db
+        self.m = models
+        self.user_id = user_id
+
+    @cached_property
+    def user(self):
+        User = self.m['User']
+        return self.db.session.execute(
+            select(User.trades_made, User.portfolio_value, User.friends_count, User.tutorial_completed)
+            .where(User.id == self.user_id)
+        ).one()
+
+    @cached_property
+    def symbols_held(self):
+        Holding = self.m['Holding']
+        return self.db.session.execute(
+            select(func.count(Holding.id)).where(Holding.user_id == self.user_id, Holding.shares > 0)
+        ).scalar()
+
+    @cached_property
+    def symbols_traded(self):
+        Transaction = self.m['Transaction']
+        return self.db.session.execute(
+            select(func.count(func.distinct(Transaction.symbol))).where(Transaction.user_id == self.user_id)
+        ).scalar()
+
+    @cached_property
+    def trading_streak(self):
+        """Consecutive calendar days with at least one trade, ending on the latest trading day"""
+        Transaction = self.m['Transaction']
+        day = func.date(Transaction.timestamp)
+        days = [d if isinstance(d, date) else date.fromisoformat(str(d)) for (d,) in self.db.session.execute(
+            select(day).where(Transaction.user_id == self.user_id).group_by(day).order_by(day.desc()).limit(31)
+        )]
+        streak = 1 if days else 0
+        for newer, older in zip(days, days[1:]):
+            if newer - older != timedelta(days=1):
+                break
+            streak += 1
+        return streak
+
+
+# Achievement name -> (events that can change the outcome, predicate over UserFacts).
+# "Diversifier" has no industry data to go on, so it counts distinct symbols held.
+# "Risk Taker" and "Profit Hunter" need per-trade risk/P&L history that isn't recorded yet.
+RULES = {
+    'First Trade': ((TRADE,), lambda f: (f.user.trades_made or 0) >= 1),
+    'Diversifier': ((TRADE,), lambda f: f.symbols_held >= 5),
+    'Market Master': ((TRADE,), lambda f: f.symbols_traded >= 50),
+    'Streak Master': ((TRADE,), lambda f: f.trading_streak >= 7),
+    'Doubled Money': ((TRADE,), lambda f: (f.user.portfolio_value or 0) >= 20000),
+    'Millionaire': ((TRADE,), lambda f: (f.user.portfolio_value or 0) >= 1000000),
+    'Social Trader': ((FRIENDSHIP,), lambda f: (f.user.friends_count or 0) >= 10),
+    'Quick Learner': ((PROFILE,), lambda f: bool(f.user.tutorial_completed)),
+}
+
+
+class AchievementEngine:
+    def __init__(self, app, db, User, Achievement, UserAchievement, Holding, Transaction,
+                 batch_size=200, batch_wait=0.5, max_cached_users=100000, on_awarded=None):
+        self.app = app
+        self.db = db
+        self.models = {'User': User, 'Achievement': Achievement, 'UserAchievement': UserAchievement,
+                       'Holding': Holding, 'Transaction': Transaction}
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_cached_users = max_cached_users
+        self.on_awarded = on_awarded  # called with the ids whose achievements_count changed
+        self._queue = queue.Queue()
+        self._catalog = None          # name -> (achievement_id, bit)
+        self._bitmaps = OrderedDict()  # user_id -> int bitmask of earned achievements
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {'events': 0, 'evaluations': 0, 'awards': 0}
+
+    # --- catalog and bitmaps -------------------------------------------------
+
+    def catalog(self):
+        if self._catalog is None:
+            Achievement = self.models['Achievement']
+            rows = self.db.session.execute(select(Achievement.id, Achievement.name).order_by(Achievement.id)).all()
+            self._catalog = {name: (achievement_id, 1 << achievement_id) for achievement_id, name in rows}
+        return self._catalog
+
+    def invalidate_catalog(self):
+        self._catalog = None
+
+    def earned_bitmap(self, user_id):
+        with self._lock:
+            if user_id in self._bitmaps:
+                self._bitmaps.move_to_end(user_id)
+                return self._bitmaps[user_id]
+        UserAchievement = self.models['UserAchievement']
+        bitmap = 0
+        for (achievement_id,) in self.db.session.execute(
+                select(UserAchievement.achievement_id).where(UserAchievement.user_id == user_id)):
+            bitmap |= 1 << achievement_id
+        self._remember(user_id, bitmap)
+        return bitmap
+
+    def _remember(self, user_id, bitmap):
+        with self._lock:
+            self._bitmaps[user_id] = self._bitmaps.get(user_id, 0) | bitmap
+            self._bitmaps.move_to_end(user_id)
+            while len(self._bitmaps) > self.max_cached_users:
+                self._bitmaps.popitem(last=False)
+
+    # --- event intake ----------------------------------------------------------
+
+    def publish(self, user_id, event):
+        """Queue an event for asynchronous evaluation; never blocks the request"""
+        self._queue.put((user_id, event))
+        self.stats['events'] += 1
+
+    def start(self):
+        """Start the background consumer (idempotent, call after fork)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='achievement-engine', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            with self.app.app_context():
+                try:
+                    self.process(batch)
+                except Exception:
+                    self.db.session.rollback()
+                    logger.exception("Achievement evaluation failed for %d events", len(batch))
+
+    def process_pending(self):
+        """Synchronously drain the queue (for CLI use and tests). Returns awards made."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return self.process(batch) if batch else 0
+
+    # --- evaluation ------------------------------------------------------------
+
+    def process(self, events):
+        """Evaluate a batch of (user_id, event) pairs and insert every new award at once"""
+        catalog = self.catalog()
+        events_by_user = {}
+        for user_id, event in events:
+            events_by_user.setdefault(user_id, set()).add(event)
+
+        awards, bitmaps = [], {}
+        for user_id, kinds in events_by_user.items():
+            earned = self.earned_bitmap(user_id)
+            facts = UserFacts(self.db, self.models, user_id)
+            for name, (triggers, predicate) in RULES.items():
+                entry = catalog.get(name)
+                if entry is None or earned & entry[1] or not kinds.intersection(triggers):
+                    continue
+                self.stats['evaluations'] += 1
+                if predicate(facts):
+                    awards.append({'user_id': user_id, 'achievement_id': entry[0]})
+                    earned |= entry[1]
+            bitmaps[user_id] = earned
+
+        if awards:
+            self._insert_awards(awards)
+            self.stats['awards'] += len(awards)
+        # Only once the awards are committed, or a failed batch would hide them for good
+        for user_id, earned in bitmaps.items():
+            self._remember(user_id, earned)
+        return len(awards)
+
+    def _insert_awards(self, awards):
+        UserAchievement, User = self.models['UserAchievement'], self.models['User']
+        session = self.db.session
+        dialect = session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            stmt = dialect_insert(UserAchievement).on_conflict_do_nothing()
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            stmt = dialect_insert(UserAchievement).on_conflict_do_nothing()
+        else:
+            stmt = insert(UserAchievement)
+        session.execute(stmt, awards)
+
+        # Core inserts skip the ORM counter hooks; set the affected counters exactly
+        user_ids = {a['user_id'] for a in awards}
+        earned = select(func.count(UserAchievement.id)).where(UserAchievement.user_id == User.id).scalar_subquery()
+        session.execute(
+            update(User).where(User.id.in_(user_ids))
+            .values(achievements_count=earned, data_version=User.data_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        if self.on_awarded:
+            self.on_awarded(user_ids)
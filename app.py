@@ -1,21 +1,41 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash
+import base64
+import json
 import os
-from datetime import datetime, timedelta, timezone
-from sqlalchemy import or_
-try:
-    import requests
-except ImportError:
-    requests = None
+import threading
+import time
+from datetime import datetime, timezone
+from sqlalchemy import or_, case, event, func, select, insert, update, literal, text, tuple_, union
+from sqlalchemy.orm import configure_mappers, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from rankings import RankIndex, FriendsRankingCache
+from friends import FriendGraph, canonical_edge
+from quotes import QuoteCache
+from quote_client import QuoteClient, CircuitBreaker
+from symbols import SymbolIndex, DEFAULT_SYMBOLS_FILE
+from trading import TradeEngine
+from achievements import AchievementEngine, TRADE, FRIENDSHIP, PROFILE
+from streaming import PriceStream
+from timeseries import PortfolioHistory
+from analytics import PortfolioAnalytics
+from seeding import Seeder, DEFAULT_PASSWORD, DEMO_USERNAMES
+from instrumentation import Instrumentation
+from principals import UserCache, SharedUserCache
+from passwords import PasswordHasher, PasswordPoolBusy
+from replicas import ReplicaRouter, RoutingSession
+from etags import PayloadCache
+import migrations
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-production')
 
-# Database configuration - supports both SQLite (local) and PostgreSQL (production)
-database_url = os.environ.get('DATABASE_URL', '').strip()
-if database_url:
+def normalize_database_url(database_url):
+    """The SQLAlchemy spelling of a DATABASE_URL-style connection string"""
     # Render and other services use postgres://, but SQLAlchemy needs postgresql://
     if database_url.startswith('postgres://'):
         database_url = database_url.replace('postgres://', 'postgresql://', 1)
@@ -33,22 +53,56 @@ if database_url:
                     pass
         except:
             pass
-    # Validate the URL is not empty after processing
-    if database_url:
-        app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-    else:
-        # Fallback to SQLite if DATABASE_URL is invalid
-        os.makedirs(app.instance_path, exist_ok=True)
-        default_sqlite_path = os.path.join(app.instance_path, 'investify.db')
-        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{default_sqlite_path}'
+    return database_url
+
+def pool_options(prefix, defaults=None):
+    """create_engine() pool arguments from <prefix>_POOL_SIZE, _MAX_OVERFLOW, _POOL_TIMEOUT, _POOL_RECYCLE and _POOL_PRE_PING"""
+    options = dict(defaults or {})
+    for key, name, cast in (('pool_size', 'POOL_SIZE', int), ('max_overflow', 'MAX_OVERFLOW', int),
+                            ('pool_timeout', 'POOL_TIMEOUT', float), ('pool_recycle', 'POOL_RECYCLE', int)):
+        value = os.environ.get(f'{prefix}_{name}', '').strip()
+        if value:
+            options[key] = cast(value)
+    pre_ping = os.environ.get(f'{prefix}_POOL_PRE_PING', '').strip()
+    if pre_ping:
+        options['pool_pre_ping'] = pre_ping != '0'
+    return options
+
+# Database configuration - supports both SQLite (local) and PostgreSQL (production)
+database_url = normalize_database_url(os.environ.get('DATABASE_URL', '').strip())
+if database_url:
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 else:
     # Default to SQLite for local development
     os.makedirs(app.instance_path, exist_ok=True)
     default_sqlite_path = os.path.join(app.instance_path, 'investify.db')
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{default_sqlite_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pool_options('DATABASE')
+# Read replicas for the read-only views, as binds replica0, replica1, ...; see replicas.py
+replica_urls = [normalize_database_url(url.strip())
+                for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+app.config['SQLALCHEMY_BINDS'] = {
+    f'replica{i}': dict(pool_options('DATABASE_REPLICA', app.config['SQLALCHEMY_ENGINE_OPTIONS']), url=url)
+    for i, url in enumerate(replica_urls)
+}
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+db_router = ReplicaRouter(app.config['SQLALCHEMY_BINDS'],
+                          sticky_seconds=float(os.environ.get('READ_YOUR_WRITES_SECONDS', 5)))
+db_router.init_app(app, db)
+
+# Per-route latency, SQL and outbound HTTP accounting, served on /metrics.
+# Set PROFILE_DIR to dump sampled stacks for requests slower than SLOW_REQUEST_SECONDS.
+instrumentation = Instrumentation(
+    n_plus_one_threshold=int(os.environ.get('N_PLUS_ONE_THRESHOLD', 20)),
+    slow_request_seconds=float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0)),
+    profile_dir=os.environ.get('PROFILE_DIR') or None,
+    profile_interval=float(os.environ.get('PROFILE_INTERVAL', 0.005)),
+)
+instrumentation.init_app(app)
+instrumentation.watch_sql(Engine)
 
-db = SQLAlchemy(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -56,7 +110,7 @@ login_manager.login_view = 'login'
 @login_manager.unauthorized_handler
 def unauthorized():
     # Return JSON for API calls and redirect otherwise
-    if request.path.startswith('/execute_trade') or request.path.startswith('/get_portfolio_data'):
+    if request.path.startswith(('/execute_trade', '/execute_batch_trade', '/get_portfolio_data', '/get_transactions', '/export_transactions', '/stream', '/get_portfolio_history', '/get_portfolio_analytics', '/get_friends_rankings', '/get_friend_suggestions')):
         return jsonify({'success': False, 'message': 'Please log in to continue'}), 401
     return redirect(url_for('login'))
 
@@ -66,7 +120,7 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
-    portfolio_value = db.Column(db.Float, default=10000.0)
+    portfolio_value = db.Column(db.Float, default=10000.0, index=True)
     cash_balance = db.Column(db.Float, default=10000.0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     global_rank = db.Column(db.Integer, default=0)
@@ -85,9 +139,16 @@ class User(UserMixin, db.Model):
     tutorial_completed = db.Column(db.Boolean, default=False)
     profile_views = db.Column(db.Integer, default=0)
     is_active = db.Column(db.Boolean, default=True)
+    # Bumped with every change to what the user's JSON endpoints return; see etags.py
+    data_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
 
-# Friends Model
+# Friends Model - one row per undirected friendship, stored as
+# canonical_edge(a, b) so user_id < friend_id
 class Friendship(db.Model):
+    __table_args__ = (
+        db.Index('uq_friendship_user_friend', 'user_id', 'friend_id', unique=True),
+        db.Index('ix_friendship_friend_id', 'friend_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     friend_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -104,6 +165,9 @@ class Achievement(db.Model):
 
 # User Achievement Model
 class UserAchievement(db.Model):
+    __table_args__ = (
+        db.Index('uq_user_achievement', 'user_id', 'achievement_id', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     achievement_id = db.Column(db.Integer, db.ForeignKey('achievement.id'), nullable=False)
@@ -111,6 +175,10 @@ class UserAchievement(db.Model):
 
 # Holding Model
 class Holding(db.Model):
+    __table_args__ = (
+        db.Index('uq_holding_user_symbol', 'user_id', 'symbol', unique=True),
+        db.Index('ix_holding_symbol', 'symbol'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     symbol = db.Column(db.String(16), nullable=False)
@@ -121,6 +189,9 @@ class Holding(db.Model):
 
 # Transaction Model
 class Transaction(db.Model):
+    __table_args__ = (
+        db.Index('ix_transaction_user_timestamp', 'user_id', 'timestamp', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     symbol = db.Column(db.String(16), nullable=False)
@@ -129,32 +200,496 @@ class Transaction(db.Model):
     price = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+trade_engine = TradeEngine(db, User, Holding, Transaction)
+
+achievement_engine = AchievementEngine(app, db, User, Achievement, UserAchievement, Holding, Transaction,
+                                       on_awarded=lambda user_ids: user_cache.invalidate(*user_ids))
+
+# The index and graph rebuild from a background thread, so their loaders bring their own context
+def load_portfolio_values():
+    with app.app_context():
+        return db.session.execute(select(User.id, User.portfolio_value)).all()
+
+def load_friendships():
+    with app.app_context():
+        return db.session.execute(select(Friendship.user_id, Friendship.friend_id)).all()
+
+# Per-worker rank index, rebuilt from the user table every RANK_INDEX_TTL seconds
+rank_index = RankIndex(loader=load_portfolio_values, ttl=float(os.environ.get('RANK_INDEX_TTL', 60)))
+
+# Per-worker adjacency sets for friend lookups and suggestions, rebuilt every FRIEND_GRAPH_TTL seconds
+friend_graph = FriendGraph(loader=load_friendships, ttl=float(os.environ.get('FRIEND_GRAPH_TTL', 300)))
+
+# Per-user ranked friends lists; see rank_friends()
+friends_rankings = FriendsRankingCache(ttl=float(os.environ.get('FRIENDS_RANKING_TTL', 30)))
+
+# Snapshots of logged-in users so load_user() skips the DB; USER_CACHE_PATH shares them across workers
+user_cache = UserCache(
+    fields=[column.key for column in User.__table__.columns if column.key != 'password_hash'],
+    ttl=float(os.environ.get('USER_CACHE_TTL', 10)),
+    max_entries=int(os.environ.get('USER_CACHE_SIZE', 10000)),
+    shared=SharedUserCache(os.environ['USER_CACHE_PATH'], ttl=float(os.environ.get('USER_CACHE_SHARED_TTL', 300)))
+    if os.environ.get('USER_CACHE_PATH') else None,
+)
+user_cache.watch(db.session)
+
+# Serialized JSON bodies per (view, user, data_version); see etags.py
+payload_cache = PayloadCache(max_bytes=int(float(os.environ.get('PAYLOAD_CACHE_MB', 32)) * 1024 * 1024))
+
+# Password KDFs run on a small process pool; logins beyond workers + queue get a fast 503
+password_hasher = PasswordHasher(
+    method=os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'),
+    salt_length=int(os.environ.get('PASSWORD_SALT_LENGTH', 16)),
+    workers=int(os.environ.get('PASSWORD_POOL_WORKERS', 2)),
+    max_queue=int(os.environ.get('PASSWORD_POOL_QUEUE', 8)),
+    timeout=float(os.environ.get('PASSWORD_POOL_TIMEOUT', 10)),
+)
+
+# Leaderboard Snapshot Model - a periodically rebuilt, ranked copy of the
+# user table so leaderboard pages are a primary-key range read
+class LeaderboardSnapshot(db.Model):
+    __tablename__ = 'leaderboard_snapshot'
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    username = db.Column(db.String(80), nullable=False)
+    avatar_color = db.Column(db.String(20), default="#00b8ff")
+    portfolio_value = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime)
+    built_at = db.Column(db.DateTime, nullable=False)
+
+# Same shape; each rebuild fills it, then renames it over leaderboard_snapshot
+LEADERBOARD_STAGING = LeaderboardSnapshot.__table__.to_metadata(db.MetaData(), name='leaderboard_snapshot_staging')
+LEADERBOARD_REBUILD_LOCK = 0x1EADB0A2D   # pg advisory lock key held while rebuilding
+
+# Portfolio value history - packed float32 chunks per user and resolution,
+# see timeseries.py for the layout
+class PortfolioSeries(db.Model):
+    __tablename__ = 'portfolio_series'
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    resolution = db.Column(db.String(8), primary_key=True)
+    chunk_start = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (db.Index('ix_portfolio_series_chunk', 'resolution', 'chunk_start'),)
+
+# How far each coarser history resolution has been rolled up, shared by every
+# process that runs maintain() (the price worker, cron)
+class PortfolioRollup(db.Model):
+    __tablename__ = 'portfolio_rollup'
+    resolution = db.Column(db.String(8), primary_key=True)
+    rolled_until = db.Column(db.Integer, nullable=False)
+
+portfolio_history = PortfolioHistory(db, User, PortfolioSeries, PortfolioRollup, retention={
+    'minute': float(os.environ.get('HISTORY_MINUTE_RETENTION_DAYS', 2)) * 86400,
+    'hour': float(os.environ.get('HISTORY_HOUR_RETENTION_DAYS', 90)) * 86400,
+    'day': float(os.environ.get('HISTORY_DAY_RETENTION_DAYS', 1830)) * 86400,
+})
+
+# Pooled upstream client; QUOTE_API_URL can point at a local stub server
+quote_client = QuoteClient(
+    connect_timeout=float(os.environ.get('QUOTE_CONNECT_TIMEOUT', 1)),
+    read_timeout=float(os.environ.get('QUOTE_READ_TIMEOUT', 2)),
+    deadline=float(os.environ.get('QUOTE_DEADLINE', 3)),
+    retries=int(os.environ.get('QUOTE_RETRIES', 2)),
+    hedge_after=float(os.environ.get('QUOTE_HEDGE_AFTER', 0.5)),
+    max_connections=int(os.environ.get('QUOTE_MAX_CONNECTIONS', 16)),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get('QUOTE_BREAKER_THRESHOLD', 5)),
+        reset_timeout=float(os.environ.get('QUOTE_BREAKER_RESET', 30)),
+    ),
+    metrics=instrumentation.metrics,
+)
+
+def last_known_prices(symbols):
+    """Holdings' last valuation price per symbol, served while the quote API is down"""
+    with app.app_context():
+        return dict(db.session.execute(
+            select(Holding.symbol, func.max(Holding.last_price))
+            .where(Holding.symbol.in_(symbols), Holding.last_price > 0)
+            .group_by(Holding.symbol)
+        ).all())
+
+# Shared per-worker quote cache
+quote_cache = QuoteCache(
+    fetcher=instrumentation.outbound('quotes', quote_client.fetch),
+    ttl=float(os.environ.get('QUOTE_CACHE_TTL', 15)),
+    max_entries=int(os.environ.get('QUOTE_CACHE_SIZE', 5000)),
+    fallback=last_known_prices,
+)
+
+def positions_by_user(user_ids):
+    """``{user_id: ({symbol: shares}, {symbol: last known price})}`` for the users' open holdings"""
+    rows = db.session.execute(
+        select(Holding.user_id, Holding.symbol, Holding.shares, Holding.last_price, Holding.avg_price)
+        .where(Holding.user_id.in_(user_ids), Holding.shares > 0)
+    ).all()
+    result = {user_id: ({}, {}) for user_id in user_ids}
+    for r in rows:
+        positions, prices = result[r.user_id]
+        positions[r.symbol] = r.shares
+        prices[r.symbol] = r.last_price or r.avg_price
+    fresh = quote_cache.peek_many({r.symbol for r in rows})
+    for positions, prices in result.values():
+        prices.update((symbol, fresh[symbol]) for symbol in positions if symbol in fresh)
+    return result
+
+def stream_versions(user_ids):
+    """data_version of each streaming user, in one read (called by the broadcaster every tick)"""
+    with app.app_context():
+        return dict(db.session.execute(select(User.id, User.data_version).where(User.id.in_(user_ids))).all())
+
+def stream_positions(user_ids):
+    """Cash and positions for streams whose user traded, possibly through another worker"""
+    with app.app_context():
+        cash = dict(db.session.execute(select(User.id, User.cash_balance).where(User.id.in_(user_ids))).all())
+        return {user_id: (cash[user_id], positions, prices)
+                for user_id, (positions, prices) in positions_by_user(list(cash)).items()}
+
+# Live price / portfolio push; one shared poll loop per worker feeds every open stream
+price_stream = PriceStream(
+    fetcher=quote_cache.get_many,
+    interval=float(os.environ.get('STREAM_INTERVAL', 5)),
+    max_subscribers=int(os.environ.get('STREAM_MAX_CLIENTS', 5000)),
+    versions=stream_versions,
+    reload=stream_positions,
+)
+
+# P&L, returns and risk metrics per user, cached until their next trade or ANALYTICS_CACHE_TTL
+portfolio_analytics = PortfolioAnalytics(
+    db, User, Holding, Transaction,
+    history=portfolio_history,
+    ttl=float(os.environ.get('ANALYTICS_CACHE_TTL', 60)),
+    risk_free_rate=float(os.environ.get('RISK_FREE_RATE', 0.0)),
+)
+
+# Bulk generator for demo and load-test data; see seed_users()
+seeder = Seeder(db, User, Friendship, Holding, Transaction)
+
+# Cache and queue counters, exported as gauges on /metrics
+instrumentation.metrics.register_collector('quote_cache', lambda: quote_cache.stats)
+instrumentation.metrics.register_collector('quote_client', lambda: quote_client.stats)
+instrumentation.metrics.register_collector('quote_breaker', quote_client.breaker_stats)
+instrumentation.metrics.register_collector('price_stream', price_stream.snapshot_stats)
+instrumentation.metrics.register_collector('analytics_cache', lambda: portfolio_analytics.stats)
+instrumentation.metrics.register_collector('friends_rankings', lambda: friends_rankings.stats)
+instrumentation.metrics.register_collector('friend_graph', friend_graph.stats)
+instrumentation.metrics.register_collector('user_cache', lambda: user_cache.stats)
+instrumentation.metrics.register_collector('password_pool', lambda: password_hasher.stats)
+instrumentation.metrics.register_collector('achievements', lambda: achievement_engine.stats)
+instrumentation.metrics.register_collector('db_router', lambda: db_router.stats)
+instrumentation.metrics.register_collector('payload_cache', lambda: payload_cache.stats)
+
+app.config['LEADERBOARD_SNAPSHOT_TTL'] = float(os.environ.get('LEADERBOARD_SNAPSHOT_TTL', 30))
+app.config['LEADERBOARD_TOP_K'] = int(os.environ.get('LEADERBOARD_TOP_K', 50))
+app.config['LEADERBOARD_WINDOW'] = int(os.environ.get('LEADERBOARD_WINDOW', 5))
+
 @login_manager.user_loader
+@instrumentation.timed('load_user')
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    user = user_cache.principal(int(user_id), load_user_row)
+    if user is not None:
+        # Rank is computed on read; set it without marking the row dirty
+        rank = rank_index.rank(user.id)
+        if rank is not None:
+            user.set_committed('global_rank', rank)
+    return user
 
-def update_user_rankings():
-    """Update global rankings based on portfolio value"""
-    users = User.query.order_by(User.portfolio_value.desc()).all()
-    for i, user in enumerate(users, 1):
-        user.global_rank = i
-    db.session.commit()
+def load_user_row(user_id):
+    """The User row behind a cached principal; write through ``current_user.record()``"""
+    return db.session.get(User, user_id)
+
+@instrumentation.timed('update_user_rank')
+def update_user_rank(user):
+    """Move a single user in the rank index after their portfolio value changed.
+
+    Only the mover's own ``global_rank`` is written (as part of the caller's
+    transaction); everyone else's rank is computed on read from the index.
+    Cached friends boards that list the user are dropped.
+    """
+    user.global_rank = rank_index.update(user.id, user.portfolio_value)
+    user.data_version = User.data_version + 1
+    friends_rankings.invalidate(user.id)
+    user_cache.invalidate_after_commit(db.session, user.id)
+
+def rebuild_leaderboard_snapshot(max_age=None):
+    """Re-rank every user into a staging table and swap it in for leaderboard_snapshot.
+
+    One process rebuilds at a time. On PostgreSQL the rebuild holds an
+    advisory lock and a concurrent caller returns None at once; SQLite has a
+    single writer, so a concurrent caller waits for it. With the lock held,
+    the rebuild is skipped (None) if someone else just built a snapshot
+    younger than ``max_age`` seconds. Readers see the old table until the swap
+    commits. Call outside a transaction; returns the new ``built_at``.
+    """
+    session = db.session
+    postgres = session.get_bind().dialect.name == 'postgresql'
+    if postgres:
+        if not session.execute(text('SELECT pg_try_advisory_xact_lock(:key)'),
+                               {'key': LEADERBOARD_REBUILD_LOCK}).scalar():
+            session.rollback()
+            return None
+    else:
+        # pysqlite doesn't open a transaction for DDL; take the write lock up front
+        session.execute(text('BEGIN IMMEDIATE'))
+    if max_age is not None:
+        age = leaderboard_snapshot_age()
+        if age is not None and age <= max_age:
+            session.rollback()
+            return None
+
+    built_at = datetime.utcnow()
+    ranked = select(
+        func.row_number().over(order_by=(User.portfolio_value.desc(), User.id.asc())),
+        User.id, User.username, User.avatar_color, User.portfolio_value, User.created_at,
+        literal(built_at, db.DateTime),
+    )
+    connection = session.connection()
+    LEADERBOARD_STAGING.drop(connection, checkfirst=True)
+    LEADERBOARD_STAGING.create(connection)
+    connection.execute(insert(LEADERBOARD_STAGING).from_select(
+        ['rank', 'user_id', 'username', 'avatar_color', 'portfolio_value', 'created_at', 'built_at'],
+        ranked,
+    ))
+    LeaderboardSnapshot.__table__.drop(connection, checkfirst=True)
+    connection.execute(text('ALTER TABLE leaderboard_snapshot_staging RENAME TO leaderboard_snapshot'))
+    # The renamed table keeps its staging index names; give it the model's back
+    if postgres:
+        connection.execute(text('ALTER INDEX leaderboard_snapshot_staging_pkey RENAME TO leaderboard_snapshot_pkey'))
+        connection.execute(text('ALTER INDEX ix_leaderboard_snapshot_staging_user_id '
+                                'RENAME TO ix_leaderboard_snapshot_user_id'))
+    else:
+        connection.execute(text('DROP INDEX ix_leaderboard_snapshot_staging_user_id'))
+        connection.execute(text('CREATE INDEX ix_leaderboard_snapshot_user_id ON leaderboard_snapshot (user_id)'))
+    session.commit()
+    return built_at
+
+def leaderboard_snapshot_age():
+    """Seconds since the snapshot was built, or None if there is no snapshot"""
+    built_at = db.session.query(LeaderboardSnapshot.built_at).filter_by(rank=1).scalar()
+    if built_at is None:
+        return None
+    return (datetime.utcnow() - built_at).total_seconds()
+
+def refresh_leaderboard_snapshot_if_stale():
+    """Rebuild the snapshot if it is missing or older than LEADERBOARD_SNAPSHOT_TTL"""
+    age = leaderboard_snapshot_age()
+    if age is None or age > app.config['LEADERBOARD_SNAPSHOT_TTL']:
+        return rebuild_leaderboard_snapshot(max_age=app.config['LEADERBOARD_SNAPSHOT_TTL']) is not None
+    return False
+
+_background_workers_started = False
+_background_workers_lock = threading.Lock()
+
+def _leaderboard_refresher():
+    while True:
+        time.sleep(app.config['LEADERBOARD_SNAPSHOT_TTL'])
+        try:
+            with app.app_context():
+                refresh_leaderboard_snapshot_if_stale()
+        except Exception:
+            app.logger.exception("Leaderboard snapshot refresh failed")
 
-def get_user_friends_count(user_id):
-    """Get the number of friends for a user"""
-    return Friendship.query.filter_by(user_id=user_id).count()
+@app.before_request
+def start_background_workers():
+    """Start this worker process's background threads on its first request.
 
-def get_user_achievements_count(user_id):
-    """Get the number of achievements earned by a user"""
-    return UserAchievement.query.filter_by(user_id=user_id).count()
+    Started lazily rather than at import so they survive gunicorn's fork:
+    the achievement engine's queue consumer, and the leaderboard snapshot
+    refresher. Every worker runs a refresher, but a rebuild only happens when
+    the shared snapshot is actually stale, and only one process at a time
+    rebuilds it. Set LEADERBOARD_REFRESHER=0 to rely on ``flask
+    rebuild-leaderboard`` from cron instead.
+    """
+    global _background_workers_started
+    if _background_workers_started:
+        return
+    with _background_workers_lock:
+        if not _background_workers_started:
+            achievement_engine.start()
+            if os.environ.get('LEADERBOARD_REFRESHER', '1') != '0':
+                threading.Thread(target=_leaderboard_refresher, name='leaderboard-refresher', daemon=True).start()
+            _background_workers_started = True
+
+@app.cli.command('rebuild-leaderboard')
+def rebuild_leaderboard_command():
+    """Rebuild the leaderboard snapshot now"""
+    if rebuild_leaderboard_snapshot() is None:
+        print("Leaderboard snapshot rebuild skipped (lock held / snapshot fresh)")
+        raise SystemExit(1)
+    print(f"Leaderboard snapshot rebuilt ({LeaderboardSnapshot.query.count()} users)")
+
+def get_leaderboard_window(user_id, page=1, per_page=None, window=None):
+    """Top-K page and the ranks around ``user_id``, read only from the snapshot.
+
+    Never writes: until ``flask init-db`` or a refresher has built a snapshot,
+    the board is empty.
+    """
+    per_page = per_page or app.config['LEADERBOARD_TOP_K']
+    window = app.config['LEADERBOARD_WINDOW'] if window is None else window
+
+    # Plain rows (attribute access like the model) - no ORM objects to hydrate
+    entries = select(
+        LeaderboardSnapshot.rank, LeaderboardSnapshot.user_id, LeaderboardSnapshot.username,
+        LeaderboardSnapshot.avatar_color, LeaderboardSnapshot.portfolio_value,
+        LeaderboardSnapshot.created_at, LeaderboardSnapshot.built_at,
+    )
+    first = (page - 1) * per_page + 1
+    top = db.session.execute(
+        entries.where(LeaderboardSnapshot.rank.between(first, first + per_page - 1))
+        .order_by(LeaderboardSnapshot.rank)
+    ).all()
+
+    my_entry = db.session.execute(entries.where(LeaderboardSnapshot.user_id == user_id)).first()
+    neighborhood = []
+    if my_entry is not None:
+        neighborhood = db.session.execute(
+            entries.where(LeaderboardSnapshot.rank.between(max(1, my_entry.rank - window), my_entry.rank + window))
+            .order_by(LeaderboardSnapshot.rank)
+        ).all()
+
+    total = db.session.query(func.max(LeaderboardSnapshot.rank)).scalar() or 0
+    return {
+        'top': top,
+        'neighborhood': neighborhood,
+        'my_rank': my_entry.rank if my_entry else None,
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'built_at': my_entry.built_at if my_entry else (top[0].built_at if top else None),
+    }
+
+def rank_friends(user_id):
+    """The user and everyone they're friends with, in either edge direction, ranked in one query.
+
+    ``rank`` is RANK() over portfolio value within the group (ties share a
+    rank); ``global_rank`` comes from the leaderboard snapshot in the same
+    statement.
+    """
+    members = union(
+        select(Friendship.friend_id.label('id')).where(Friendship.user_id == user_id),
+        select(Friendship.user_id.label('id')).where(Friendship.friend_id == user_id),
+        select(literal(user_id).label('id')),
+    ).subquery()
+    friend_rank = func.rank().over(order_by=User.portfolio_value.desc()).label('friend_rank')
+    rows = db.session.execute(
+        select(friend_rank, User.id, User.username, User.avatar_color, User.created_at,
+               User.portfolio_value, LeaderboardSnapshot.rank.label('global_rank'))
+        .join(members, members.c.id == User.id)
+        .outerjoin(LeaderboardSnapshot, LeaderboardSnapshot.user_id == User.id)
+        .order_by(friend_rank, User.username)
+    ).all()
+    return [{
+        'rank': row.friend_rank,
+        'user_id': row.id,
+        'username': row.username,
+        'avatar_color': row.avatar_color,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'portfolio_value': row.portfolio_value,
+        'global_rank': row.global_rank,
+        'is_me': row.id == user_id,
+    } for row in rows]
+
+# friends_count and achievements_count are maintained incrementally in the same
+# flush that creates or deletes the row, so page views never need to recount.
+# Bulk inserts bypass these hooks; run reconcile_counters() afterwards.
+def _bump_counter(session, connection, column, user_ids, delta):
+    user_cache.invalidate_after_commit(session, *user_ids)
+    users = User.__table__
+    connection.execute(
+        update(users)
+        .where(users.c.id.in_(user_ids))
+        .values({column: func.coalesce(users.c[column], 0) + delta, 'data_version': users.c.data_version + 1})
+    )
+
+@event.listens_for(Friendship, 'after_insert')
+def _friendship_added(mapper, connection, target):
+    _bump_counter(object_session(target), connection, 'friends_count', [target.user_id, target.friend_id], 1)
+
+@event.listens_for(Friendship, 'after_delete')
+def _friendship_removed(mapper, connection, target):
+    _bump_counter(object_session(target), connection, 'friends_count', [target.user_id, target.friend_id], -1)
 
+@event.listens_for(UserAchievement, 'after_insert')
+def _achievement_earned(mapper, connection, target):
+    _bump_counter(object_session(target), connection, 'achievements_count', [target.user_id], 1)
+
+@event.listens_for(UserAchievement, 'after_delete')
+def _achievement_removed(mapper, connection, target):
+    _bump_counter(object_session(target), connection, 'achievements_count', [target.user_id], -1)
+
+def reconcile_counters():
+    """Repair drift in the denormalized counters with two aggregate UPDATEs.
+
+    Returns the number of users whose counters were wrong.
+    """
+    friends = select(func.count(Friendship.id)).where(
+        or_(Friendship.user_id == User.id, Friendship.friend_id == User.id)
+    ).scalar_subquery()
+    earned = select(func.count(UserAchievement.id)).where(UserAchievement.user_id == User.id).scalar_subquery()
+    drifted = db.session.execute(
+        select(func.count(User.id)).where(or_(
+            func.coalesce(User.friends_count, 0) != friends,
+            func.coalesce(User.achievements_count, 0) != earned,
+        ))
+    ).scalar()
+    if drifted:
+        db.session.execute(
+            update(User).values(friends_count=friends, achievements_count=earned, data_version=User.data_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        user_cache.clear()
+    return drifted
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recompute friends_count and achievements_count from the source tables"""
+    print(f"Repaired counters for {reconcile_counters()} users")
+
+@app.cli.command('record-portfolios')
+def record_portfolios_command():
+    """Sample every portfolio value into the history and roll up finished periods (for cron)"""
+    sampled = portfolio_history.record()
+    rolled = portfolio_history.maintain()
+    print(f"Recorded {sampled} portfolios, rolled up {rolled} values")
+
+def seed_users(usernames, password=DEFAULT_PASSWORD, **options):
+    """Bulk-create demo users, then fix counters and ranks with set-based statements.
+
+    Keyword options are passed to Seeder.seed(). Returns its report with
+    the ranking phase added to the timings.
+    """
+    # One hash for every seeded user, made inline with the configured parameters
+    password_hash = generate_password_hash(password, password_hasher.method, password_hasher.salt_length)
+    report = seeder.seed(usernames, password_hash, **options)
+    db.session.commit()
+    started = time.perf_counter()
+    reconcile_counters()
+    rebuild_leaderboard_snapshot()
+    db.session.execute(
+        update(User).values(global_rank=select(LeaderboardSnapshot.rank)
+                            .where(LeaderboardSnapshot.user_id == User.id).scalar_subquery(),
+                            data_version=User.data_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    rank_index.invalidate()
+    friends_rankings.clear()
+    friend_graph.invalidate()
+    user_cache.clear()
+    report['timings']['counters and ranks'] = time.perf_counter() - started
+    return report
+
+@instrumentation.timed('init_database')
 def init_database():
-    """Create all tables and seed initial data when needed.
+    """Create all tables, apply migrations, seed the achievements catalog and rank users.
 
-    This runs at app startup so tables exist regardless of how the server is started
-    (flask run, gunicorn, etc.).
+    A one-shot deploy step (``flask init-db``), not part of worker boot:
+    web workers start without issuing any DDL. Safe to re-run.
     """
     db.create_all()
+    # create_all() can't add indexes to existing tables; migrations can
+    migrations.upgrade(db.engine)
     # Create default achievements if they don't exist
     if not Achievement.query.first():
         achievements = [
@@ -172,16 +707,78 @@ def init_database():
         for achievement in achievements:
             db.session.add(achievement)
         db.session.commit()
+    refresh_leaderboard_snapshot_if_stale()
 
-# Initialize the database at import/startup time
-with app.app_context():
+@app.cli.command('init-db')
+def init_db_command():
+    """Create tables, apply pending migrations and seed the achievements catalog"""
     init_database()
+    print("Database initialized")
 
-@app.route('/init_db', methods=['POST'])
-def init_db():
-    with app.app_context():
-        db.create_all()
-        return jsonify({'success': True})
+def warm_up():
+    """One-off per-process setup, done in the gunicorn master so forked workers share it.
+
+    Configures the ORM mappers, compiles every template and loads the symbol
+    index. Opens no database connections and starts no threads: neither
+    survives a fork.
+    """
+    configure_mappers()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    get_symbol_index()
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Create missing tables and apply pending schema migrations"""
+    db.create_all()
+    applied = migrations.upgrade(db.engine)
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """EXPLAIN every hot query and fail if any of them can't use an index"""
+    failures = 0
+    for name, uses_index, plan in migrations.explain_hot_queries(db.engine):
+        print(f"{'ok  ' if uses_index else 'FAIL'} {name}: {plan}")
+        failures += not uses_index
+    if failures:
+        raise SystemExit(1)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint for this worker; set METRICS_TOKEN to require a bearer token"""
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(instrumentation.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def current_data_version():
+    """The current user's data_version, read from the database (the cached principal's may lag)"""
+    return db.session.execute(select(User.data_version).where(User.id == current_user.id)).scalar_one()
+
+def versioned_json(version, build):
+    """``build()``'s payload for the current user, tagged with ``version``.
+
+    Answers 304 when ``If-None-Match`` already has this version; otherwise the
+    body is memoized per (view, user, query string) until the version moves.
+    See etags.py.
+    """
+    etag = f'{current_user.id}-{version}'
+    if request.if_none_match.contains_weak(etag):
+        payload_cache.not_modified()
+        response = Response(status=304)
+    else:
+        body = payload_cache.get((request.endpoint, current_user.id, request.query_string), version,
+                                 lambda: app.json.dumps(build()))
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag, weak=True)
+    # Browsers keep the body but revalidate every poll, so pages need no changes
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def password_pool_busy():
+    """Shed a login/registration while the hashing pool is saturated"""
+    return jsonify({'success': False, 'message': 'Too many sign-ins right now, please retry in a moment'}), 503, {'Retry-After': '2'}
 
 # Routes
 @app.route('/')
@@ -196,12 +793,27 @@ def login():
         password = data.get('password')
         
         # Allow login by username or email
-        user = User.query.filter(or_(User.username == identifier, User.email == identifier)).first()
-        if user and check_password_hash(user.password_hash, password):
+        account = db.session.execute(
+            select(User.id, User.password_hash).where(or_(User.username == identifier, User.email == identifier))
+        ).first()
+        # Don't hold a pooled connection while the KDF runs
+        db.session.close()
+        try:
+            valid = account is not None and password_hasher.verify(account.password_hash, password or '')
+            new_hash = password_hasher.hash(password) if valid and password_hasher.needs_rehash(account.password_hash) else None
+        except PasswordPoolBusy:
+            return password_pool_busy()
+        if valid:
+            user = db.session.get(User, account.id)
+            if new_hash:
+                # Hash parameters changed since this password was set; upgrade it transparently
+                user.password_hash = new_hash
+                password_hasher.rehashed()
             # Update login analytics
             user.login_count = (user.login_count or 0) + 1
             user.last_login = datetime.now(timezone.utc)
             db.session.commit()
+            user_cache.invalidate(user.id)
             login_user(user)
             return jsonify({'success': True, 'redirect': url_for('dashboard')})
         else:
@@ -225,29 +837,36 @@ def register():
             return jsonify({'success': False, 'message': 'Email already registered'})
         
         # Create new user
-        hashed_password = generate_password_hash(password)
+        db.session.close()
+        try:
+            hashed_password = password_hasher.hash(password)
+        except PasswordPoolBusy:
+            return password_pool_busy()
         new_user = User(username=username, email=email, password_hash=hashed_password)
         db.session.add(new_user)
-        db.session.commit()
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # Someone took the name or email while the password was hashing
+            db.session.rollback()
+            return jsonify({'success': False, 'message': 'Username or email already registered'})
         
-        # Update rankings after adding new user
-        update_user_rankings()
+        # Place the new user in the rankings
+        update_user_rank(new_user)
+        db.session.commit()
         
         return jsonify({'success': True, 'message': 'Registration successful! Please login.'})
     
     return render_template('register.html')
 
 @app.route('/dashboard')
+@db_router.read_only
 @login_required
 def dashboard():
-    # Update user stats
-    current_user.friends_count = get_user_friends_count(current_user.id)
-    current_user.achievements_count = get_user_achievements_count(current_user.id)
-    db.session.commit()
-    
     return render_template('dashboard.html', user=current_user)
 
 @app.route('/profile')
+@db_router.read_only
 @login_required
 def profile():
     return render_template('profile.html', user=current_user)
@@ -259,9 +878,13 @@ def edit_profile():
     bio = data.get('bio', '')
     avatar_color = data.get('avatar_color', '#00b8ff')
     
-    current_user.bio = bio
-    current_user.avatar_color = avatar_color
+    user = current_user.record()
+    user.bio = bio
+    user.avatar_color = avatar_color
+    user.data_version = User.data_version + 1
     db.session.commit()
+    user_cache.invalidate(user.id)
+    achievement_engine.publish(user.id, PROFILE)
     
     return jsonify({'success': True, 'message': 'Profile updated successfully!'})
 
@@ -281,45 +904,111 @@ def add_friend():
     if not friend:
         return jsonify({'success': False, 'message': 'User not found'})
     
-    # Check if already friends
-    existing_friendship = Friendship.query.filter_by(
-        user_id=current_user.id, 
-        friend_id=friend.id
-    ).first()
-    
-    if existing_friendship:
+    # Edges are stored in canonical order, so one unique-index lookup covers both directions
+    user_id, friend_id = canonical_edge(current_user.id, friend.id)
+    if Friendship.query.filter_by(user_id=user_id, friend_id=friend_id).first():
         return jsonify({'success': False, 'message': 'Already friends with this user'})
     
-    # Add friendship
-    friendship = Friendship(user_id=current_user.id, friend_id=friend.id)
-    db.session.add(friendship)
-    db.session.commit()
-    
-    # Update friend counts
-    current_user.friends_count = get_user_friends_count(current_user.id)
-    friend.friends_count = get_user_friends_count(friend.id)
-    db.session.commit()
+    # Add friendship; both users' friends_count is bumped in the same flush
+    db.session.add(Friendship(user_id=user_id, friend_id=friend_id))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request added the same pair first
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Already friends with this user'})
+    friend_graph.add(user_id, friend_id)
+    achievement_engine.publish(current_user.id, FRIENDSHIP)
+    achievement_engine.publish(friend.id, FRIENDSHIP)
+    friends_rankings.invalidate(current_user.id)
+    friends_rankings.invalidate(friend.id)
     
     return jsonify({'success': True, 'message': f'Successfully added {friend_username} as a friend!'})
 
 @app.route('/market')
+@db_router.read_only
 @login_required
 def market():
     return render_template('market.html', user=current_user)
 
 @app.route('/portfolio')
+@db_router.read_only
 @login_required
 def portfolio():
     return render_template('portfolio.html', user=current_user)
 
 @app.route('/leaderboard')
+@db_router.read_only
 @login_required
 def leaderboard():
-    # Get all users ordered by portfolio value
-    users = User.query.order_by(User.portfolio_value.desc()).all()
-    return render_template('leaderboard.html', user=current_user, users=users)
+    # Top-K plus the current user's neighborhood, served from the snapshot
+    board = get_leaderboard_window(current_user.id, page=max(1, request.args.get('page', 1, type=int)))
+    return render_template('leaderboard.html', user=current_user, board=board)
+
+@app.route('/get_leaderboard')
+@db_router.read_only
+@login_required
+def get_leaderboard():
+    """Paginated leaderboard plus the current user's neighborhood as JSON"""
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = min(max(1, request.args.get('per_page', app.config['LEADERBOARD_TOP_K'], type=int)), 200)
+    window = min(max(0, request.args.get('window', app.config['LEADERBOARD_WINDOW'], type=int)), 50)
+    board = get_leaderboard_window(current_user.id, page=page, per_page=per_page, window=window)
+
+    def serialize(entry):
+        return {
+            'rank': entry.rank,
+            'user_id': entry.user_id,
+            'username': entry.username,
+            'avatar_color': entry.avatar_color,
+            'portfolio_value': entry.portfolio_value,
+            'created_at': entry.created_at.isoformat() if entry.created_at else None,
+        }
+
+    return jsonify({
+        'top': [serialize(e) for e in board['top']],
+        'neighborhood': [serialize(e) for e in board['neighborhood']],
+        'my_rank': board['my_rank'],
+        'page': board['page'],
+        'per_page': board['per_page'],
+        'total': board['total'],
+        'built_at': board['built_at'].isoformat() if board['built_at'] else None,
+    })
+
+@app.route('/get_friends_rankings')
+@db_router.read_only
+@login_required
+def get_friends_rankings():
+    """The current user and their friends ranked by portfolio value"""
+    friends = friends_rankings.get(current_user.id)
+    if friends is None:
+        friends = rank_friends(current_user.id)
+        friends_rankings.put(current_user.id, [f['user_id'] for f in friends], friends)
+    return jsonify({'friends': friends})
+
+@app.route('/get_friend_suggestions')
+@db_router.read_only
+@login_required
+def get_friend_suggestions():
+    """Friends of friends the user hasn't added yet, most mutual friends first"""
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    ranked = friend_graph.suggestions(current_user.id, limit=limit)
+    users = {}
+    if ranked:
+        users = {row.id: row for row in db.session.execute(
+            select(User.id, User.username, User.avatar_color, User.portfolio_value)
+            .where(User.id.in_([user_id for user_id, _ in ranked]))
+        )}
+    return jsonify({'suggestions': [{
+        'user_id': user_id,
+        'username': users[user_id].username,
+        'avatar_color': users[user_id].avatar_color,
+        'portfolio_value': users[user_id].portfolio_value,
+        'mutual_friends': mutual,
+    } for user_id, mutual in ranked if user_id in users]})
 
 @app.route('/achievements')
+@db_router.read_only
 @login_required
 def achievements():
     # Get all achievements
@@ -329,26 +1018,61 @@ def achievements():
     user_achievements = UserAchievement.query.filter_by(user_id=current_user.id).all()
     earned_achievement_ids = [ua.achievement_id for ua in user_achievements]
     
-    # Update user's achievement count
-    current_user.achievements_count = len(earned_achievement_ids)
-    db.session.commit()
-    
     return render_template('achievements.html', 
                          user=current_user, 
                          all_achievements=all_achievements,
                          earned_achievement_ids=earned_achievement_ids)
 
 @app.route('/tutorial')
+@db_router.read_only
 @login_required
 def tutorial():
     return render_template('tutorial.html', user=current_user)
 
+TUTORIAL_STEPS = 8  # totalSteps in templates/tutorial.html
+
+@app.route('/get_tutorial_progress')
+@db_router.read_only
+@login_required
+def get_tutorial_progress():
+    # Only completion is stored; the page always reopens at the first step
+    return jsonify({'current_step': 1, 'completed': bool(current_user.tutorial_completed)})
+
+@app.route('/update_tutorial_progress', methods=['POST'])
+@login_required
+def update_tutorial_progress():
+    data = request.get_json(silent=True) or {}
+    try:
+        step = min(max(int(data.get('current_step', 1)), 1), TUTORIAL_STEPS)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid step'}), 400
+
+    if step == TUTORIAL_STEPS and not current_user.tutorial_completed:
+        user = current_user.record()
+        user.tutorial_completed = True
+        user.data_version = User.data_version + 1
+        db.session.commit()
+        user_cache.invalidate(user.id)
+        achievement_engine.publish(user.id, PROFILE)
+
+    return jsonify({'success': True, 'progress_percentage': step * 100 / TUTORIAL_STEPS})
+
 @app.route('/get_portfolio_data')
+@db_router.read_only
 @login_required
 def get_portfolio_data():
-    """Get portfolio data for dashboard and portfolio pages"""
-    user_holdings = Holding.query.filter_by(user_id=current_user.id).all()
-    user_txns = Transaction.query.filter_by(user_id=current_user.id).order_by(Transaction.timestamp.desc()).all()
+    """Get portfolio summary and holdings for dashboard and portfolio pages.
+
+    Transaction history is served separately by /get_transactions.
+    """
+    # Cash comes from the same read as the version, so the memoized body matches its ETag
+    version, cash_balance = db.session.execute(
+        select(User.data_version, User.cash_balance).where(User.id == current_user.id)
+    ).one()
+    return versioned_json(version, lambda: portfolio_payload(current_user.id, cash_balance))
+
+def portfolio_payload(user_id, cash_balance):
+    user_holdings = Holding.query.filter_by(user_id=user_id).all()
 
     holdings_payload = []
     total_stocks_value = 0.0
@@ -369,33 +1093,145 @@ def get_portfolio_data():
         })
         total_stocks_value += total_value
 
+    # Same totals as PortfolioAnalytics (no deposits, so the account started with
+    # today's cash plus everything spent net of sales), from one aggregate instead
+    # of the full history; /get_portfolio_analytics has the rest
+    net_spent = db.session.execute(
+        select(func.coalesce(func.sum(
+            case((Transaction.action == 'SELL', -Transaction.shares), else_=Transaction.shares) * Transaction.price
+        ), 0.0)).where(Transaction.user_id == user_id)
+    ).scalar()
+    starting_value = cash_balance + net_spent
+    total_gain_loss = cash_balance + total_stocks_value - starting_value
     portfolio_stats = {
-        'total_value': current_user.cash_balance + total_stocks_value,
-        'total_gain_loss': 0.0,
-        'total_gain_loss_percent': 0.0,
+        'total_value': cash_balance + total_stocks_value,
+        'total_gain_loss': total_gain_loss,
+        'total_gain_loss_percent': total_gain_loss / starting_value * 100 if starting_value > 0 else 0.0,
         'holdings_count': len(user_holdings)
     }
 
-    transactions_payload = [{
+    return {
+        'portfolio_stats': portfolio_stats,
+        'holdings': holdings_payload
+    }
+
+def serialize_transaction(t):
+    return {
+        'id': t.id,
         'symbol': t.symbol,
         'action': t.action,
         'shares': t.shares,
         'price': t.price,
         'timestamp': t.timestamp.isoformat()
-    } for t in user_txns]
-    
-    return jsonify({
-        'portfolio_stats': portfolio_stats,
-        'holdings': holdings_payload,
-        'transactions': transactions_payload
-    })
+    }
+
+def encode_transaction_cursor(t):
+    raw = f"{t.timestamp.isoformat()}|{t.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_transaction_cursor(cursor):
+    """Return (timestamp, id) from an opaque cursor, raising ValueError if malformed"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    timestamp, txn_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+    return datetime.fromisoformat(timestamp), int(txn_id)
+
+def transactions_page(user_id, limit, after=None):
+    """Newest-first page of a user's transactions strictly after the (timestamp, id) keyset position"""
+    query = Transaction.query.filter(Transaction.user_id == user_id)
+    if after is not None:
+        query = query.filter(tuple_(Transaction.timestamp, Transaction.id) < after)
+    return query.order_by(Transaction.timestamp.desc(), Transaction.id.desc()).limit(limit).all()
+
+@app.route('/get_portfolio_analytics')
+@db_router.read_only
+@login_required
+def get_portfolio_analytics():
+    """Realized/unrealized P&L, time-weighted return, volatility, max drawdown and Sharpe"""
+    return jsonify(portfolio_analytics.summary(current_user.id))
+
+HISTORY_RANGES = {
+    '1d': 86400,
+    '1w': 7 * 86400,
+    '1m': 30 * 86400,
+    '3m': 90 * 86400,
+    '1y': 365 * 86400,
+    'all': 5 * 366 * 86400,
+}
+
+@app.route('/get_portfolio_history')
+@db_router.read_only
+@login_required
+def get_portfolio_history():
+    """Downsampled portfolio value history for charts.
+
+    ``?range=1d|1w|1m|3m|1y|all`` (default 1m) and ``?points=`` (max points,
+    default 300). Points are ``[epoch_ms, value]``; the last point is the
+    current value.
+    """
+    range_name = request.args.get('range', '1m')
+    if range_name not in HISTORY_RANGES:
+        range_name = '1m'
+    max_points = min(max(request.args.get('points', 300, type=int), 10), 1000)
+    now = time.time()
+    resolution, points = portfolio_history.points(
+        current_user.id, now - HISTORY_RANGES[range_name], now, max_points - 1, now=now)
+    points = [[ts * 1000, value] for ts, value in points]
+    points.append([int(now * 1000), round(current_user.portfolio_value or 0.0, 2)])
+    return jsonify({'range': range_name, 'resolution': resolution, 'points': points})
+
+@app.route('/get_transactions')
+@db_router.read_only
+@login_required
+def get_transactions():
+    """Keyset-paginated transaction history, newest first"""
+    limit = min(max(1, request.args.get('limit', 50, type=int)), 500)
+    cursor = request.args.get('cursor')
+    after = None
+    if cursor:
+        try:
+            after = decode_transaction_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+
+    def build():
+        # Fetch one extra row to know whether another page exists
+        rows = transactions_page(current_user.id, limit + 1, after)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            'transactions': [serialize_transaction(t) for t in rows],
+            'next_cursor': encode_transaction_cursor(rows[-1]) if has_more else None
+        }
+
+    return versioned_json(current_data_version(), build)
+
+@app.route('/export_transactions')
+@db_router.read_only
+@login_required
+def export_transactions():
+    """Stream the full transaction history as NDJSON, one keyset page at a time"""
+    user_id = current_user.id
+
+    def generate():
+        after = None
+        while True:
+            rows = transactions_page(user_id, 1000, after)
+            for t in rows:
+                yield json.dumps(serialize_transaction(t)) + '\n'
+            if len(rows) < 1000:
+                break
+            after = (rows[-1].timestamp, rows[-1].id)
+            # Release the identity map between pages so memory stays flat
+            db.session.expunge_all()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=transactions.ndjson'})
+
 
 @app.route('/execute_trade', methods=['POST'])
 @login_required
 def execute_trade():
     try:
-        # Ensure tables exist (helps if DB was created before new models)
-        db.create_all()
         data = request.get_json(silent=True) or {}
         app.logger.info(f"/execute_trade payload: {data}")
         symbol = data.get('symbol')
@@ -404,62 +1240,34 @@ def execute_trade():
         price = float(data.get('price', 0))
         company_name = data.get('company_name', symbol)
 
-        if not symbol or shares <= 0 or price <= 0 or action not in ('BUY', 'SELL'):
-            return jsonify({'success': False, 'message': 'Invalid trade request'})
-
-        holding = Holding.query.filter_by(user_id=current_user.id, symbol=symbol).first()
-
-        if action == 'BUY':
-            cost = shares * price
-            if current_user.cash_balance < cost:
-                return jsonify({'success': False, 'message': 'Insufficient cash balance'})
-
-            if not holding:
-                holding = Holding(user_id=current_user.id, symbol=symbol, company_name=company_name, shares=0, avg_price=0.0, last_price=price)
-                db.session.add(holding)
-
-            total_cost_existing = holding.avg_price * holding.shares
-            total_cost_new = shares * price
-            new_total_shares = holding.shares + shares
-            holding.avg_price = (total_cost_existing + total_cost_new) / new_total_shares
-            holding.shares = new_total_shares
-            holding.last_price = price
-            current_user.cash_balance -= cost
-            db.session.add(Transaction(user_id=current_user.id, symbol=symbol, action='BUY', shares=shares, price=price))
-
-        elif action == 'SELL':
-            if not holding or holding.shares < shares:
-                return jsonify({'success': False, 'message': 'Not enough shares to sell'})
-            proceeds = shares * price
-            holding.shares -= shares
-            holding.last_price = price
-            if holding.shares == 0:
-                holding.avg_price = 0.0
-            current_user.cash_balance += proceeds
-            db.session.add(Transaction(user_id=current_user.id, symbol=symbol, action='SELL', shares=shares, price=price))
+        # Prefer a live server-side quote. Stale and last-known prices are only
+        # for display: without a live quote the client's price is used, flagged
+        quoted = quote_cache.get(symbol, stale_ok=False) if symbol else None
+        price = quoted or price
 
-        user_holdings = Holding.query.filter_by(user_id=current_user.id).all()
-        stocks_value = sum(h.shares * (h.last_price or h.avg_price) for h in user_holdings)
-        current_user.portfolio_value = current_user.cash_balance + stocks_value
+        result = trade_engine.execute(current_user.id, symbol, action, shares, price, company_name)
+        if not result.success:
+            return jsonify({'success': False, 'message': result.message})
 
-        db.session.commit()
-        # Award achievements
-        try:
-            first_trade = Achievement.query.filter_by(name="First Trade").first()
-            if first_trade and not UserAchievement.query.filter_by(user_id=current_user.id, achievement_id=first_trade.id).first():
-                db.session.add(UserAchievement(user_id=current_user.id, achievement_id=first_trade.id))
-                db.session.commit()
-        except Exception:
-            db.session.rollback()
+        # The engine wrote these with SQL; sync the row if it was loaded before the trade
+        user = current_user.record()
+        set_committed_value(user, 'cash_balance', result.cash_balance)
+        set_committed_value(user, 'portfolio_value', result.portfolio_value)
+        update_user_rank(user)
 
-        # Update rankings after portfolio update
-        update_user_rankings()
+        db.session.commit()
+        achievement_engine.publish(current_user.id, TRADE)
+        push_positions(current_user.id, result.cash_balance)
+        portfolio_analytics.invalidate(current_user.id)
 
         return jsonify({
             'success': True,
-            'message': 'Trade executed successfully!',
-            'new_portfolio_value': current_user.portfolio_value,
-            'cash_balance': current_user.cash_balance
+            'message': 'Trade executed successfully!' if quoted else
+                       'Trade executed at your price; a live quote was unavailable',
+            'price': price,
+            'price_verified': quoted is not None,
+            'new_portfolio_value': result.portfolio_value,
+            'cash_balance': result.cash_balance
         })
     except Exception as e:
         db.session.rollback()
@@ -467,22 +1275,84 @@ def execute_trade():
         # Return 200 with success:false so the frontend reliably shows the message
         return jsonify({'success': False, 'message': f'Trade failed: {str(e)}'})
 
+MAX_BATCH_LEGS = 100
+
+@app.route('/execute_batch_trade', methods=['POST'])
+@login_required
+def execute_batch_trade():
+    """Submit many BUY/SELL legs at once.
+
+    Expects ``{"orders": [{symbol, action, shares, price, company_name}, ...],
+    "all_or_nothing": false}``. Legs are validated against one snapshot of
+    cash and holdings and applied in one transaction; revaluation,
+    achievements and ranking run once for the whole batch.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        orders = data.get('orders')
+        if not isinstance(orders, list) or not orders:
+            return jsonify({'success': False, 'message': 'No orders submitted'})
+        if len(orders) > MAX_BATCH_LEGS:
+            return jsonify({'success': False, 'message': f'At most {MAX_BATCH_LEGS} orders per batch'})
+
+        legs = []
+        for order in orders:
+            order = order if isinstance(order, dict) else {}
+            try:
+                shares = int(order.get('shares', 0))
+                price = float(order.get('price', 0))
+            except (TypeError, ValueError):
+                shares, price = 0, 0.0
+            legs.append({
+                'symbol': order.get('symbol'),
+                'action': order.get('action'),
+                'shares': shares,
+                'price': price,
+                'company_name': order.get('company_name', order.get('symbol')),
+            })
+
+        # One batched live-quote lookup for every symbol in the batch; as in
+        # execute_trade, legs without a live quote keep the client's price
+        quotes = quote_cache.get_many([leg['symbol'] for leg in legs if leg['symbol']], stale_ok=False)
+        for leg in legs:
+            leg['price'] = quotes.get(leg['symbol']) or leg['price']
+        unverified = sorted({leg['symbol'] for leg in legs if leg['symbol'] and leg['symbol'] not in quotes})
+
+        batch = trade_engine.execute_batch(current_user.id, legs, bool(data.get('all_or_nothing')))
+        if batch.executed:
+            user = current_user.record()
+            set_committed_value(user, 'cash_balance', batch.cash_balance)
+            set_committed_value(user, 'portfolio_value', batch.portfolio_value)
+            update_user_rank(user)
+            db.session.commit()
+            achievement_engine.publish(current_user.id, TRADE)
+            push_positions(current_user.id, batch.cash_balance)
+            portfolio_analytics.invalidate(current_user.id)
+        else:
+            db.session.rollback()
+
+        return jsonify({
+            'success': batch.executed > 0,
+            'message': f'{batch.executed} of {len(legs)} orders executed',
+            'results': batch.legs,
+            'unverified_symbols': unverified,   # executed at the client's price, no live quote
+            'new_portfolio_value': batch.portfolio_value,
+            'cash_balance': batch.cash_balance
+        })
+    except Exception as e:
+        db.session.rollback()
+        app.logger.exception("Batch trade failed")
+        return jsonify({'success': False, 'message': f'Batch trade failed: {str(e)}'})
+
 @app.route('/refresh_prices', methods=['POST'])
 @login_required
 def refresh_prices():
     try:
-        if not requests:
-            return jsonify({'success': False, 'message': 'requests library not installed. Run: pip install requests'})
         user_holdings = Holding.query.filter_by(user_id=current_user.id).all()
         if not user_holdings:
             return jsonify({'success': True, 'message': 'No holdings to refresh.', 'portfolio_value': current_user.portfolio_value, 'updated': 0})
 
-        symbols = ','.join([h.symbol for h in user_holdings])
-        url = f"https://query1.finance.yahoo.com/v7/finance/quote?symbols={symbols}"
-        r = requests.get(url, timeout=6)
-        data = r.json()
-        result = (data.get('quoteResponse', {}).get('result', []))
-        symbol_to_price = {item.get('symbol'): float(item.get('regularMarketPrice', 0) or 0) for item in result}
+        symbol_to_price = quote_cache.get_many([h.symbol for h in user_holdings])
 
         updates = 0
         for h in user_holdings:
@@ -491,32 +1361,122 @@ def refresh_prices():
                 h.last_price = new_price
                 updates += 1
 
-        # Recompute portfolio
-        stocks_value = sum(h.shares * (h.last_price or h.avg_price) for h in user_holdings)
-        current_user.portfolio_value = current_user.cash_balance + stocks_value
+        # Recompute portfolio in SQL so a concurrent trade's cash change isn't overwritten
+        db.session.flush()
+        trade_engine.revalue(current_user.id)
+        user = current_user.record()
+        db.session.refresh(user, ['cash_balance', 'portfolio_value'])
+        update_user_rank(user)
         db.session.commit()
-
-        # Rankings refresh
-        update_user_rankings()
+        portfolio_analytics.invalidate(current_user.id)
 
         return jsonify({'success': True, 'message': 'Prices refreshed', 'portfolio_value': current_user.portfolio_value, 'updated': updates})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'Price refresh failed: {str(e)}'})
 
+MAX_STREAM_SYMBOLS = 50
+
+def current_positions(user_id):
+    """``({symbol: shares}, {symbol: last known price})`` for a user's open holdings"""
+    return positions_by_user([user_id])[user_id]
+
+def push_positions(user_id, cash_balance):
+    """Re-sync the user's open live streams in this worker right after their holdings changed.
+
+    Streams in other workers catch up on their broadcaster's next tick.
+    """
+    if price_stream.is_watching(user_id):
+        positions, prices = current_positions(user_id)
+        price_stream.update_positions(user_id, cash_balance, positions, prices)
+
+@app.route('/stream')
+@login_required
+def stream():
+    """Server-Sent Events feed of live prices and portfolio value.
+
+    Streams ``prices`` events (``{symbol: price}``) for ``?symbols=`` plus
+    every symbol the user holds, and ``portfolio`` events whenever the
+    user's portfolio value moves.
+    """
+    user_id = current_user.id
+    requested = [s.strip().upper() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    # Read before the positions: a trade committed in between only causes an extra re-sync
+    version, cash_balance = db.session.execute(
+        select(User.data_version, User.cash_balance).where(User.id == user_id)).one()
+    positions, prices = current_positions(user_id)
+    symbols = set(requested[:MAX_STREAM_SYMBOLS]) | set(positions)
+    prices.update(quote_cache.peek_many(symbols))
+    # The stream can stay open for hours; don't pin a pooled connection to it
+    db.session.close()
+
+    subscriber = price_stream.subscribe(user_id, symbols, positions, cash_balance, prices, version)
+    if subscriber is None:
+        return jsonify({'success': False, 'message': 'Live updates are busy, retrying shortly'}), 503, {'Retry-After': '10'}
+    response = Response(price_stream.events(subscriber), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(lambda: price_stream.unsubscribe(subscriber))
+    return response
+
+_symbol_index = None
+
+def get_symbol_index():
+    """Symbol index loaded once per worker from SYMBOLS_FILE (bundled data/symbols.csv by default)"""
+    global _symbol_index
+    if _symbol_index is None:
+        _symbol_index = SymbolIndex.from_csv(os.environ.get('SYMBOLS_FILE', DEFAULT_SYMBOLS_FILE))
+    return _symbol_index
+
+@app.route('/search')
+@login_required
+def search():
+    """Typeahead stock search over the local symbol index.
+
+    Prices are whatever the quote cache already holds (never an upstream
+    call on the request path); misses are prefetched for the next keystroke.
+    """
+    limit = min(max(1, request.args.get('limit', 8, type=int)), 25)
+    matches = get_symbol_index().search(request.args.get('q', ''), limit=limit)
+    symbols = [m['symbol'] for m in matches]
+    prices = quote_cache.peek_many(symbols)
+    quote_cache.prefetch(symbols)
+    for m in matches:
+        m['price'] = prices.get(m['symbol'])
+    return jsonify({'results': matches})
+
+@app.route('/get_quotes')
+@login_required
+def get_quotes():
+    """Current prices for a comma-separated list of symbols, served through the quote cache"""
+    symbols = [s.strip().upper() for s in request.args.get('symbols', '').split(',') if s.strip()][:50]
+    return jsonify({'quotes': quote_cache.get_many(symbols)})
+
 @app.route('/get_user_data')
+@db_router.read_only
 @login_required
 def get_user_data():
     """Get current user data"""
-    return jsonify({
-        'username': current_user.username,
-        'email': current_user.email,
-        'portfolio_value': current_user.portfolio_value,
-        'cash_balance': current_user.cash_balance,
-        'global_rank': current_user.global_rank,
-        'friends_count': current_user.friends_count,
-        'achievements_count': current_user.achievements_count
-    })
+    # The cached principal can lag a change made through another worker, so the
+    # version and the body come from the row; the rank is computed on read
+    version = current_data_version()
+    rank = current_user.global_rank
+
+    def build():
+        user = db.session.execute(
+            select(User.username, User.email, User.portfolio_value, User.cash_balance,
+                   User.friends_count, User.achievements_count).where(User.id == current_user.id)
+        ).one()
+        return {
+            'username': user.username,
+            'email': user.email,
+            'portfolio_value': user.portfolio_value,
+            'cash_balance': user.cash_balance,
+            'global_rank': rank,
+            'friends_count': user.friends_count,
+            'achievements_count': user.achievements_count
+        }
+
+    return versioned_json(f'{version}.{rank}', build)
 
 @app.route('/logout')
 @login_required
@@ -533,98 +1493,22 @@ def seed_database_route():
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        from werkzeug.security import generate_password_hash
-        import random
-        
-        # List of realistic usernames
-        usernames = [
-            "alex_trader", "sarah_invests", "mike_wallstreet", "emma_stocks", "james_market",
-            "lisa_portfolio", "david_trades", "olivia_finance", "chris_investor", "sophia_wealth",
-            "ryan_trading", "mia_stocks", "noah_market", "ava_invests", "ethan_portfolio",
-            "isabella_trader", "lucas_finance", "amelia_stocks", "henry_market", "charlotte_invests",
-            "benjamin_trades", "harper_portfolio", "mason_finance", "ella_stocks", "jackson_market",
-            "luna_invests", "aiden_trader", "zoe_portfolio", "carter_finance"
-        ]
-        
-        users_created = 0
-        friendships_created = 0
-        
-        # Create users
-        for username in usernames:
-            existing = User.query.filter_by(username=username).first()
-            if existing:
-                continue
-            
-            user = User(
-                username=username,
-                email=f"{username}@example.com",
-                password_hash=generate_password_hash("password123"),
-                portfolio_value=random.uniform(8000, 15000),
-                cash_balance=random.uniform(5000, 12000),
-                friends_count=0,
-                achievements_count=random.randint(0, 10),
-                total_achievements=25,
-                created_at=datetime.now() - timedelta(days=random.randint(1, 90)),
-                login_count=random.randint(5, 50),
-                trades_made=random.randint(0, 30),
-                total_trades_value=random.uniform(1000, 5000),
-                achievements_unlocked=random.randint(0, 10),
-                tutorial_completed=random.choice([True, False]),
-                profile_views=random.randint(0, 100),
-                is_active=True
-            )
-            db.session.add(user)
-            users_created += 1
-        
-        db.session.commit()
-        
-        # Get all users
-        all_users = User.query.all()
-        
-        # Create friendships
-        for user in all_users:
-            num_friends = random.randint(2, 5)
-            potential_friends = [u for u in all_users if u.id != user.id]
-            friends = random.sample(potential_friends, min(num_friends, len(potential_friends)))
-            
-            for friend in friends:
-                existing = Friendship.query.filter(
-                    ((Friendship.user_id == user.id) & (Friendship.friend_id == friend.id)) |
-                    ((Friendship.user_id == friend.id) & (Friendship.friend_id == user.id))
-                ).first()
-                
-                if not existing:
-                    friendship = Friendship(
-                        user_id=user.id,
-                        friend_id=friend.id,
-                        created_at=datetime.now() - timedelta(days=random.randint(1, 30))
-                    )
-                    db.session.add(friendship)
-                    friendships_created += 1
-        
-        db.session.commit()
-        
-        # Update friend counts and rankings
-        for user in all_users:
-            user.friends_count = Friendship.query.filter_by(user_id=user.id).count()
-        
-        users_sorted = User.query.order_by(User.portfolio_value.desc()).all()
-        for i, user in enumerate(users_sorted, 1):
-            user.global_rank = i
-        
-        db.session.commit()
-        
+        report = seed_users(DEMO_USERNAMES)
         return jsonify({
             'success': True,
-            'message': f'Database seeded successfully!',
-            'users_created': users_created,
-            'friendships_created': friendships_created,
+            'message': 'Database seeded successfully!',
+            'users_created': report['users'],
+            'friendships_created': report['friendships'],
             'total_users': User.query.count(),
             'total_friendships': Friendship.query.count()
         })
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
+    # The development server sets up its own database; deployments run `flask init-db`
+    with app.app_context():
+        init_database()
     port = int(os.environ.get('PORT', 5002))
     app.run(debug=False, host='0.0.0.0', port=port)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Benchmark portfolio analytics on a user with a long transaction history.
+
+Generates a synthetic history (random-walk prices, buys and sells that
+never oversell), then times:
+
+* a per-trade Python replay of the average-cost book (the reference)
+* ``analytics.analyze()`` on the same arrays, checking it agrees
+* ``PortfolioAnalytics`` end to end against a throwaway SQLite database:
+  loading the rows, computing, and a cached hit
+
+Usage: python benchmarks/analytics_benchmark.py [--transactions 100000] [--symbols 100] [--days 730]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'analytics.db'))
+os.environ.setdefault('LEADERBOARD_REFRESHER', '0')
+
+from analytics import DAY, analyze
+
+STARTING_CASH = 10000.0
+
+
+def generate(n, n_symbols, days, seed=0):
+    """Transactions as parallel lists, oldest first, plus the final book"""
+    rng = random.Random(seed)
+    symbols = [f'S{i:03d}' for i in range(n_symbols)]
+    price = {s: rng.uniform(20, 400) for s in symbols}
+    start = int(time.time() // DAY) * DAY - days * DAY
+    timestamps, syms, signed, prices = [], [], [], []
+    shares = {s: 0 for s in symbols}
+    cash = STARTING_CASH * 1000   # plenty of cash so every generated buy is affordable
+    for i in range(n):
+        ts = start + i * (days * DAY) / n
+        s = rng.choice(symbols)
+        price[s] = max(1.0, price[s] * (1 + rng.gauss(0, 0.01)))
+        if shares[s] and rng.random() < 0.4:
+            q = -rng.randint(1, shares[s])
+        else:
+            q = rng.randint(1, 20)
+        shares[s] += q
+        cash -= q * price[s]
+        timestamps.append(ts)
+        syms.append(s)
+        signed.append(float(q))
+        prices.append(round(price[s], 2))
+    return timestamps, syms, signed, prices, cash
+
+
+def replay(timestamps, symbols, signed, prices, cash_balance):
+    """Per-trade average-cost replay: realized P&L, final average costs and daily closing values"""
+    starting = cash_balance + sum(q * p for q, p in zip(signed, prices))
+    shares, avg, last = {}, {}, {}
+    realized = 0.0
+    cash = starting
+    values = []
+    day = int(timestamps[0] // DAY) if timestamps else 0
+    for ts, s, q, p in zip(timestamps, symbols, signed, prices):
+        while int(ts // DAY) > day:
+            values.append(cash + sum(shares[x] * last[x] for x in shares))
+            day += 1
+        held = shares.get(s, 0.0)
+        if q > 0:
+            avg[s] = (avg.get(s, 0.0) * held + q * p) / (held + q)
+        else:
+            realized += -q * (p - avg[s])
+            if held + q == 0:
+                avg[s] = 0.0
+        shares[s] = held + q
+        last[s] = p
+        cash -= q * p
+    values.append(cash + sum(shares[x] * last[x] for x in shares))
+    return realized, {s: a for s, a in avg.items() if shares[s] > 0}, values
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, statistics.median(samples)
+
+
+def bench_database(timestamps, symbols, signed, prices, cash, avg_prices, last_prices):
+    from sqlalchemy import insert
+    from app import app, db, User, Holding, Transaction, init_database, portfolio_analytics
+
+    with app.app_context():
+        init_database()
+        user = User(username=f'analytics_{time.time_ns()}', email=f'analytics_{time.time_ns()}@example.com',
+                    password_hash='x', cash_balance=cash)
+        db.session.add(user)
+        db.session.commit()
+        rows = [{'user_id': user.id, 'symbol': s, 'action': 'BUY' if q > 0 else 'SELL', 'shares': int(abs(q)),
+                 'price': p, 'timestamp': datetime.utcfromtimestamp(ts)}
+                for ts, s, q, p in zip(timestamps, symbols, signed, prices)]
+        for i in range(0, len(rows), 10000):
+            db.session.execute(insert(Transaction), rows[i:i + 10000])
+        db.session.execute(insert(Holding), [
+            {'user_id': user.id, 'symbol': s, 'company_name': s, 'shares': 1, 'avg_price': a, 'last_price': last_prices[s]}
+            for s, a in avg_prices.items()])
+        db.session.commit()
+
+        portfolio_analytics.invalidate(user.id)
+        start = time.perf_counter()
+        cold = portfolio_analytics.summary(user.id)
+        cold_time = time.perf_counter() - start
+        start = time.perf_counter()
+        portfolio_analytics.summary(user.id)
+        warm_time = time.perf_counter() - start
+    return cold, cold_time, warm_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Portfolio analytics benchmark')
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--skip-db', action='store_true', help='only benchmark the in-memory computation')
+    args = parser.parse_args()
+
+    timestamps, symbols, signed, prices, cash = generate(args.transactions, args.symbols, args.days)
+    last_prices = dict(zip(symbols, prices))
+    print(f"{args.transactions} transactions, {args.symbols} symbols over {args.days} days")
+
+    (realized, avg_prices, values), replay_time = timed(
+        lambda: replay(timestamps, symbols, signed, prices, cash), 1)
+    print(f"  per-trade replay:     {replay_time * 1000:9.1f} ms")
+
+    now = timestamps[-1]
+    result, analyze_time = timed(lambda: analyze(timestamps, symbols, signed, prices, cash, last_prices,
+                                                 avg_prices, now=now), args.repeat)
+    print(f"  analyze():            {analyze_time * 1000:9.1f} ms  ({replay_time / analyze_time:.0f}x)")
+
+    problems = []
+    if abs(result['realized_pnl'] - realized) > 1e-6 * max(1.0, abs(realized)):
+        problems.append(f"realized {result['realized_pnl']:.2f} != replay {realized:.2f}")
+    if result['days'] != len(values) + 1:
+        problems.append(f"{result['days']} days != replay {len(values) + 1}")
+    if abs(result['current_value'] - values[-1]) > 1e-6 * abs(values[-1]):
+        problems.append(f"final value {result['current_value']:.2f} != replay {values[-1]:.2f}")
+    peak, drawdown = result['starting_value'], 0.0
+    for v in values:
+        peak = max(peak, v)
+        drawdown = min(drawdown, v / peak - 1)
+    if abs(result['max_drawdown'] - drawdown) > 1e-9:
+        problems.append(f"max drawdown {result['max_drawdown']:.6f} != replay {drawdown:.6f}")
+    print(f"  realized {result['realized_pnl']:.2f}, unrealized {result['unrealized_pnl']:.2f}, "
+          f"TWR {result['time_weighted_return']:.4f}, vol {result['volatility']:.4f}, "
+          f"max DD {result['max_drawdown']:.4f}, Sharpe {result['sharpe_ratio']:.2f}")
+
+    if not args.skip_db:
+        _, cold_time, warm_time = bench_database(timestamps, symbols, signed, prices, cash, avg_prices, last_prices)
+        print(f"  end to end (SQLite):  {cold_time * 1000:9.1f} ms cold, {warm_time * 1000:.3f} ms cached")
+
+    if problems:
+        print("MISMATCH:")
+        for p in problems:
+            print("  " + p)
+        sys.exit(1)
+    print("  results match the replay")
+
+
+if __name__ == '__main__':
+    main()
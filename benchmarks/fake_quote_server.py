@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Yahoo's quote endpoint.
+
+Serves GET /v7/finance/quote?symbols=AAPL,MSFT with the same response shape
+as Yahoo, using a deterministic random walk per symbol. Point the app at it
+with QUOTE_API_URL=http://127.0.0.1:8765/v7/finance/quote
+
+Usage: python benchmarks/fake_quote_server.py [--port 8765] [--latency 0.05] [--error-rate 0.1]
+       [--slow-rate 0.05 --slow-latency 1.0]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops SYNs under load, adding 1 s connect stalls
+    request_queue_size = 128
+
+
+class FakeQuoteServer:
+    """Threaded stub quote server that can also be started in-process"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, seed=0,
+                 slow_rate=0.0, slow_latency=1.0):
+        # All of these can be changed while the server runs, e.g. to stage an outage
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self.symbols_served = 0
+        self._prices = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = _Server((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}/v7/finance/quote'
+
+    def price(self, symbol):
+        with self._lock:
+            if symbol not in self._prices:
+                self._prices[symbol] = 20 + (sum(map(ord, symbol)) * 7) % 480
+            else:
+                self._prices[symbol] = round(self._prices[symbol] * self._rng.uniform(0.995, 1.005), 2)
+            return self._prices[symbol]
+
+    def _handle(self, handler):
+        with self._lock:
+            self.requests += 1
+            fail = self._rng.random() < self.error_rate
+            slow = self._rng.random() < self.slow_rate
+        if self.latency or slow:
+            time.sleep(self.latency + (self.slow_latency if slow else 0.0))
+        if fail:
+            handler.send_response(503)
+            handler.end_headers()
+            return
+        query = parse_qs(urlparse(handler.path).query)
+        symbols = [s for s in ','.join(query.get('symbols', [''])).split(',') if s]
+        with self._lock:
+            self.symbols_served += len(symbols)
+        result = [{'symbol': s, 'regularMarketPrice': self.price(s), 'shortName': s} for s in symbols]
+        body = json.dumps({'quoteResponse': {'result': result, 'error': None}}).encode()
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local fake Yahoo quote server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='fraction of requests delayed by --slow-latency')
+    parser.add_argument('--slow-latency', type=float, default=1.0)
+    args = parser.parse_args()
+
+    server = FakeQuoteServer(args.host, args.port, args.latency, args.error_rate,
+                             slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+    print(f"Serving fake quotes at {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
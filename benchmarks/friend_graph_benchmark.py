@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark friends-of-friends suggestions.
+
+Builds a random friendship graph with a set of well-connected "hub" users,
+then times FriendGraph.suggestions() for hubs and ordinary users against
+the equivalent SQL (the user's friends joined back to the edge table in
+both directions, grouped by candidate) on an in-memory SQLite copy of the
+same edges.
+
+Usage: python benchmarks/friend_graph_benchmark.py [--users 100000] [--degree 20] [--hub-degree 500]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from friends import FriendGraph, canonical_edge
+
+SUGGESTIONS_SQL = """
+WITH mine(f) AS (
+    SELECT friend_id FROM friendship WHERE user_id = :u
+    UNION SELECT user_id FROM friendship WHERE friend_id = :u
+),
+fof(c) AS (
+    SELECT e.friend_id FROM mine JOIN friendship AS e ON e.user_id = mine.f
+    UNION ALL SELECT e.user_id FROM mine JOIN friendship AS e ON e.friend_id = mine.f
+)
+SELECT c, COUNT(*) AS mutual FROM fof
+WHERE c != :u AND c NOT IN (SELECT f FROM mine)
+GROUP BY c
+ORDER BY mutual DESC, c
+LIMIT 10
+"""
+
+
+def generate(users, degree, hubs, hub_degree, seed=0):
+    rng = random.Random(seed)
+    edges = set()
+    for _ in range(users * degree // 2):
+        a, b = rng.randint(1, users), rng.randint(1, users)
+        if a != b:
+            edges.add(canonical_edge(a, b))
+    for hub in range(1, hubs + 1):
+        for friend in rng.sample(range(1, users + 1), hub_degree):
+            if friend != hub:
+                edges.add(canonical_edge(hub, friend))
+    return sorted(edges)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def bench(fn, user_ids):
+    samples = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        fn(user_id)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Friend suggestion benchmark')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--degree', type=int, default=20, help='average friends per user')
+    parser.add_argument('--hubs', type=int, default=50)
+    parser.add_argument('--hub-degree', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--sql-queries', type=int, default=50)
+    args = parser.parse_args()
+
+    edges = generate(args.users, args.degree, args.hubs, args.hub_degree)
+    print(f"{args.users} users, {len(edges)} edges, {args.hubs} hubs with {args.hub_degree}+ friends")
+
+    graph = FriendGraph(ttl=None)
+    start = time.perf_counter()
+    graph.load(edges)
+    print(f"  load graph:            {(time.perf_counter() - start) * 1000:9.1f} ms  {graph.stats()}")
+
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE friendship (user_id INTEGER, friend_id INTEGER)')
+    conn.executemany('INSERT INTO friendship VALUES (?, ?)', edges)
+    conn.execute('CREATE UNIQUE INDEX uq_friendship_user_friend ON friendship (user_id, friend_id)')
+    conn.execute('CREATE INDEX ix_friendship_friend_id ON friendship (friend_id)')
+
+    rng = random.Random(1)
+    hubs = [rng.randint(1, args.hubs) for _ in range(args.queries)]
+    ordinary = [rng.randint(args.hubs + 1, args.users) for _ in range(args.queries)]
+
+    for label, ids in (('hub users', hubs), ('ordinary users', ordinary)):
+        p50, p99 = bench(graph.suggestions, ids)
+        print(f"  {label + ', graph:':22} p50 {p50 * 1000:7.2f} ms   p99 {p99 * 1000:7.2f} ms")
+        sql_p50, sql_p99 = bench(lambda u: conn.execute(SUGGESTIONS_SQL, {'u': u}).fetchall(), ids[:args.sql_queries])
+        print(f"  {label + ', SQL:':22} p50 {sql_p50 * 1000:7.2f} ms   p99 {sql_p99 * 1000:7.2f} ms")
+
+    # Both must rank the same candidates
+    for user_id in hubs[:5] + ordinary[:5]:
+        expected = [tuple(row) for row in conn.execute(SUGGESTIONS_SQL, {'u': user_id})]
+        if graph.suggestions(user_id) != expected:
+            print(f"MISMATCH for user {user_id}")
+            sys.exit(1)
+    print("  suggestions match the SQL ranking")
+
+
+if __name__ == '__main__':
+    main()
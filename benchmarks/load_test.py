@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Load test: bulk-generate a realistic dataset, then replay a mixed workload
+against the app over HTTP and report throughput and latency per endpoint.
+
+Dataset: users with holdings, matching BUY transactions, extra round-trip
+trades and canonical friendships, written by the bulk seeder (seeding.py,
+via app.seed_users()).
+
+Workload: ``--clients`` threads each log in as a random generated user and
+pick weighted actions (dashboard, trade, leaderboard, refresh, quotes,
+search, friends, analytics, re-login) until ``--duration`` runs out. Quotes
+come from an in-process fake quote server. By default the app is served
+in-process by werkzeug's threaded server; pass ``--url`` to hit a running
+deployment (generate against the same DATABASE_URL, or reuse a previous
+run's users with ``--reuse-prefix``).
+
+``--json`` writes the results; ``--baseline`` compares against an earlier
+file and exits non-zero if throughput dropped or any endpoint's p99 grew by
+more than ``--tolerance``, or if the error rate exceeds ``--max-error-rate``.
+
+Usage: python benchmarks/load_test.py [--users 100000] [--clients 16] [--duration 30]
+       python benchmarks/load_test.py --users 2000 --duration 10 --json run.json --baseline main.json
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'load.db'))
+os.environ.setdefault('LEADERBOARD_REFRESHER', '0')
+
+import requests
+
+from fake_quote_server import FakeQuoteServer
+from seeding import SYMBOLS
+
+PASSWORD = 'loadtest123'
+
+# action -> relative weight
+WORKLOAD = {
+    'dashboard': 25,
+    'trade': 15,
+    'leaderboard': 15,
+    'quotes': 15,
+    'refresh': 8,
+    'search': 8,
+    'friends': 6,
+    'analytics': 5,
+    'login': 3,
+}
+
+
+# --- dataset -----------------------------------------------------------------
+
+def generate_dataset(users, holdings, transactions, friends, seed=0):
+    """Bulk-seed a dataset with seeding.Seeder; returns ``(username prefix, users created)``"""
+    import app as investify
+
+    prefix = f'lt{int(time.time())}_'
+    with investify.app.app_context():
+        investify.init_database()
+        report = investify.seed_users(
+            [f'{prefix}{i}' for i in range(users)], password=PASSWORD,
+            friends=(0, friends), holdings=(0, 2 * holdings), round_trips=(0, 2 * transactions), seed=seed,
+        )
+    for phase, seconds in report['timings'].items():
+        print(f"  {phase:24} {seconds:7.2f} s")
+    print(f"  {report['users']:,} users, {report['holdings']:,} holdings, "
+          f"{report['transactions']:,} transactions, {report['friendships']:,} friendships")
+    return prefix, report['users']
+
+
+# --- workload ----------------------------------------------------------------
+
+class VirtualUser:
+    """One client session replaying weighted actions and timing every request"""
+
+    def __init__(self, base_url, username, seed, results):
+        self.base_url = base_url
+        self.username = username
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+        self.results = results      # endpoint -> {'latencies': [...], 'errors': n}
+
+    def call(self, name, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        entry = self.results[name]
+        entry['latencies'].append(time.perf_counter() - start)
+        if not ok:
+            entry['errors'] += 1
+        return response
+
+    def login(self):
+        response = self.call('POST /login', 'POST', '/login', json={'username': self.username, 'password': PASSWORD})
+        return response is not None and response.ok and response.json().get('success')
+
+    def act(self, action):
+        rng = self.rng
+        if action == 'dashboard':
+            self.call('GET /dashboard', 'GET', '/dashboard')
+            self.call('GET /get_portfolio_data', 'GET', '/get_portfolio_data')
+        elif action == 'trade':
+            self.call('POST /execute_trade', 'POST', '/execute_trade', json={
+                'symbol': rng.choice(SYMBOLS), 'action': rng.choice(('BUY', 'BUY', 'SELL')),
+                'shares': rng.randint(1, 5), 'price': 100.0})
+        elif action == 'leaderboard':
+            self.call('GET /get_leaderboard', 'GET', f'/get_leaderboard?page={rng.randint(1, 5)}')
+        elif action == 'quotes':
+            self.call('GET /get_quotes', 'GET', '/get_quotes?symbols=' + ','.join(rng.sample(SYMBOLS, 5)))
+        elif action == 'refresh':
+            self.call('POST /refresh_prices', 'POST', '/refresh_prices')
+        elif action == 'search':
+            self.call('GET /search', 'GET', '/search?q=' + rng.choice(SYMBOLS)[:rng.randint(1, 3)].lower())
+        elif action == 'friends':
+            self.call('GET /get_friends_rankings', 'GET', '/get_friends_rankings')
+        elif action == 'analytics':
+            self.call('GET /get_portfolio_analytics', 'GET', '/get_portfolio_analytics')
+        elif action == 'login':
+            self.login()
+
+    def run(self, deadline):
+        if not self.login():
+            return
+        actions, weights = list(WORKLOAD), list(WORKLOAD.values())
+        while time.perf_counter() < deadline:
+            self.act(self.rng.choices(actions, weights)[0])
+
+
+def serve_in_process():
+    from werkzeug.serving import make_server
+    import app as investify
+    # Per-request access logs and slow-request warnings would drown the report
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('instrumentation').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, investify.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def run_workload(base_url, prefix, user_count, clients, duration, seed=0):
+    rng = random.Random(seed)
+    per_client = [defaultdict(lambda: {'latencies': [], 'errors': 0}) for _ in range(clients)]
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=VirtualUser(base_url, f'{prefix}{rng.randrange(user_count)}',
+                                                   seed + i, per_client[i]).run, args=(deadline,))
+               for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    merged = defaultdict(lambda: {'latencies': [], 'errors': 0})
+    for results in per_client:
+        for name, entry in results.items():
+            merged[name]['latencies'].extend(entry['latencies'])
+            merged[name]['errors'] += entry['errors']
+    return merged, elapsed
+
+
+def summarize(merged, elapsed):
+    def pct(sorted_samples, q):
+        return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * q))]
+
+    endpoints = {}
+    for name, entry in sorted(merged.items()):
+        samples = sorted(entry['latencies'])
+        endpoints[name] = {
+            'requests': len(samples),
+            'errors': entry['errors'],
+            'rps': len(samples) / elapsed,
+            'p50_ms': statistics.median(samples) * 1000,
+            'p95_ms': pct(samples, 0.95) * 1000,
+            'p99_ms': pct(samples, 0.99) * 1000,
+            'max_ms': samples[-1] * 1000,
+        }
+    total = sum(e['requests'] for e in endpoints.values())
+    errors = sum(e['errors'] for e in endpoints.values())
+    return {'elapsed': elapsed, 'requests': total, 'errors': errors,
+            'rps': total / elapsed, 'endpoints': endpoints}
+
+
+def report(summary):
+    print(f"  {'endpoint':28} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, e in summary['endpoints'].items():
+        print(f"  {name:28} {e['requests']:>8} {e['errors']:>6} {e['rps']:>8.1f} "
+              f"{e['p50_ms']:>8.1f} {e['p95_ms']:>8.1f} {e['p99_ms']:>8.1f} {e['max_ms']:>8.1f}")
+    print(f"  {'total':28} {summary['requests']:>8} {summary['errors']:>6} {summary['rps']:>8.1f}")
+
+
+def compare(summary, baseline, tolerance, max_error_rate):
+    """Regressions against ``baseline`` (a previous --json file), as messages"""
+    problems = []
+    if summary['requests'] and summary['errors'] / summary['requests'] > max_error_rate:
+        problems.append(f"error rate {summary['errors'] / summary['requests']:.2%} > {max_error_rate:.2%}")
+    if baseline is None:
+        return problems
+    if summary['rps'] < baseline['rps'] * (1 - tolerance):
+        problems.append(f"throughput {summary['rps']:.1f} req/s < baseline {baseline['rps']:.1f}")
+    for name, e in summary['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if before and e['p99_ms'] > before['p99_ms'] * (1 + tolerance):
+            problems.append(f"{name} p99 {e['p99_ms']:.1f} ms > baseline {before['p99_ms']:.1f} ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk dataset + mixed-workload load test')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--holdings', type=int, default=3, help='average holdings per user')
+    parser.add_argument('--transactions', type=int, default=10, help='average round-trip trades per user')
+    parser.add_argument('--friends', type=int, default=10, help='max friendships started per user')
+    parser.add_argument('--reuse-prefix', help='skip generation and log in as users from an earlier run')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of load')
+    parser.add_argument('--url', help='target a running app instead of serving it in-process')
+    parser.add_argument('--quote-latency', type=float, default=0.02, help='fake quote server latency (s)')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='fail on regressions against this earlier --json file')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    args = parser.parse_args()
+
+    quotes = FakeQuoteServer(latency=args.quote_latency).start()
+    os.environ['QUOTE_API_URL'] = quotes.url
+
+    if args.reuse_prefix:
+        import app as investify
+        with investify.app.app_context():
+            user_count = investify.User.query.filter(investify.User.username.like(f'{args.reuse_prefix}%')).count()
+        prefix = args.reuse_prefix
+    else:
+        print(f"Generating {args.users:,} users ({os.environ['DATABASE_URL'].split(':')[0]})")
+        prefix, user_count = generate_dataset(args.users, args.holdings, args.transactions, args.friends)
+    if not user_count:
+        sys.exit("No users to log in as")
+
+    server = None
+    base_url = args.url.rstrip('/') if args.url else None
+    if base_url is None:
+        server, base_url = serve_in_process()
+    print(f"{args.clients} clients for {args.duration:.0f}s against {base_url} (user prefix {prefix})")
+    merged, elapsed = run_workload(base_url, prefix, user_count, args.clients, args.duration)
+    if server is not None:
+        server.shutdown()
+    quotes.stop()
+
+    summary = summarize(merged, elapsed)
+    summary['config'] = {k: v for k, v in vars(args).items() if k not in ('json', 'baseline')}
+    report(summary)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    problems = compare(summary, baseline, args.tolerance, args.max_error_rate)
+    if problems:
+        print("REGRESSIONS:")
+        for p in problems:
+            print("  " + p)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
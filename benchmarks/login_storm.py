@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark trade latency under a concurrent login storm.
+
+Serves the app in-process behind ``--slots`` request slots (standing in for
+gunicorn sync workers: a request waits for a free slot, then holds it until
+it answers). A few clients trade continuously while ``--storm`` clients log
+in as fast as they can. Each mode runs once without and once with the storm:
+
+  inline  password KDFs run in the request thread, as before
+  pool    KDFs run on PasswordHasher's process pool, shedding with 503 past
+          ``--pool-workers + --pool-queue`` in-flight jobs
+
+Usage: python benchmarks/login_storm.py [--slots 4] [--storm 32] [--duration 10]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'storm.db'))
+os.environ.setdefault('LEADERBOARD_REFRESHER', '0')
+
+import requests
+
+from fake_quote_server import FakeQuoteServer
+
+PASSWORD = 'storm123'
+
+
+class Slots:
+    """WSGI middleware admitting at most ``n`` requests at a time"""
+
+    def __init__(self, app, n):
+        self.app = app
+        self.slots = threading.BoundedSemaphore(n)
+
+    def __call__(self, environ, start_response):
+        with self.slots:
+            return list(self.app(environ, start_response))
+
+
+def serve(app, slots):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('instrumentation').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, Slots(app, slots), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def login(session, base_url, username):
+    return session.post(f'{base_url}/login', json={'username': username, 'password': PASSWORD}, timeout=60)
+
+
+def trader(base_url, username, deadline, latencies, errors):
+    session = requests.Session()
+    login(session, base_url, username)
+    action = 'BUY'
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = session.post(f'{base_url}/execute_trade', timeout=60,
+                                json={'symbol': 'AAPL', 'action': action, 'shares': 1, 'price': 100})
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200 or not response.json().get('success'):
+            errors.append(response.status_code)
+        action = 'SELL' if action == 'BUY' else 'BUY'
+
+
+def stormer(base_url, username, deadline, outcomes):
+    session = requests.Session()
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        status = login(session, base_url, username).status_code
+        outcomes.append((status, time.perf_counter() - start))
+
+
+def p(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))] * 1000 if samples else float('nan')
+
+
+def run(base_url, traders, storm, duration):
+    deadline = time.perf_counter() + duration
+    latencies, errors, outcomes = [], [], []
+    threads = [threading.Thread(target=trader, args=(base_url, f'storm_trader_{i}', deadline, latencies, errors))
+               for i in range(traders)]
+    threads += [threading.Thread(target=stormer, args=(base_url, f'storm_user_{i}', deadline, outcomes))
+                for i in range(storm)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors, outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trade latency under a login storm')
+    parser.add_argument('--slots', type=int, default=4, help='concurrent requests admitted (sync workers)')
+    parser.add_argument('--traders', type=int, default=2)
+    parser.add_argument('--storm', type=int, default=32, help='clients logging in continuously')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--pool-workers', type=int, default=1)
+    parser.add_argument('--pool-queue', type=int, default=2)
+    args = parser.parse_args()
+
+    quotes = FakeQuoteServer().start()
+    os.environ['QUOTE_API_URL'] = quotes.url
+    import app as investify
+    from passwords import PasswordHasher
+
+    with investify.app.app_context():
+        investify.init_database()
+        investify.seed_users([f'storm_trader_{i}' for i in range(args.traders)] +
+                             [f'storm_user_{i}' for i in range(args.storm)],
+                             password=PASSWORD, friends=(0, 0), holdings=(1, 1), round_trips=(0, 0), seed=0)
+        investify.db.session.execute(investify.update(investify.User).values(cash_balance=1e9))
+        investify.db.session.commit()
+    investify.user_cache.clear()
+    server, base_url = serve(investify.app, args.slots)
+
+    modes = {
+        'inline': PasswordHasher(workers=0),
+        'pool': PasswordHasher(workers=args.pool_workers, max_queue=args.pool_queue),
+    }
+    print(f"{args.slots} slots, {args.traders} traders, {args.storm} login clients, {args.duration:.0f}s per run")
+    print(f"  {'mode':8} {'storm':6} {'trades':>7} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'logins ok':>10} {'shed 503':>9} {'login p50':>10}")
+    for name, hasher in modes.items():
+        investify.password_hasher = hasher
+        hasher.start()  # fork the pool outside the measurement, as gunicorn's post_fork does
+        for storm in (0, args.storm):
+            latencies, errors, outcomes = run(base_url, args.traders, storm, args.duration)
+            ok = [seconds for status, seconds in outcomes if status == 200]
+            shed = sum(1 for status, _ in outcomes if status == 503)
+            login_p50 = f"{statistics.median(ok) * 1000:8.0f}ms" if ok else f"{'-':>10}"
+            print(f"  {name:8} {'on' if storm else 'off':6} {len(latencies):7} {p(latencies, 0.5):8.1f} "
+                  f"{p(latencies, 0.99):8.1f} {len(ok):10} {shed:9} {login_p50}"
+                  + (f"  ({len(errors)} failed trades)" if errors else ''))
+        hasher.shutdown()
+
+    server.shutdown()
+    quotes.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark dashboard polling of the versioned JSON endpoints.
+
+Seeds one user with ``--holdings`` positions and ``--round-trips`` trades
+per position, then times ``--polls`` requests to each endpoint through the
+test client in three ways:
+
+  rebuild       the user's data_version moves before every poll, so each
+                response is built from the database (the old behaviour)
+  memoized      plain polls of an unchanged version: the body comes from
+                the payload cache
+  304           polls sending the last ETag in If-None-Match
+
+SQL statements per poll are counted alongside the latency.
+
+Usage: python benchmarks/poll_benchmark.py [--holdings 20] [--round-trips 50] [--polls 300]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'poll.db'))
+os.environ.setdefault('LEADERBOARD_REFRESHER', '0')
+os.environ.setdefault('QUOTE_API_URL', 'http://127.0.0.1:1/quote')
+
+import app as investify
+from sqlalchemy import event, update
+
+ENDPOINTS = ('/get_user_data', '/get_portfolio_data', '/get_transactions?limit=50')
+
+
+def bump(user_id):
+    with investify.app.app_context():
+        investify.db.session.execute(update(investify.User).where(investify.User.id == user_id)
+                                     .values(data_version=investify.User.data_version + 1))
+        investify.db.session.commit()
+    investify.user_cache.invalidate(user_id)
+
+
+def measure(client, path, polls, statements, before=None, conditional=False):
+    etag = client.get(path).headers['ETag']
+    latencies, queries = [], 0
+    for _ in range(polls):
+        if before:
+            before()
+        statements[0] = 0
+        start = time.perf_counter()
+        response = client.get(path, headers={'If-None-Match': etag} if conditional else {})
+        latencies.append(time.perf_counter() - start)
+        queries += statements[0]
+        assert response.status_code == (304 if conditional else 200), response.status_code
+    return statistics.median(latencies) * 1000, queries / polls
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Versioned JSON endpoint polling benchmark')
+    parser.add_argument('--holdings', type=int, default=20)
+    parser.add_argument('--round-trips', type=int, default=50, help='buy/sell pairs per holding')
+    parser.add_argument('--polls', type=int, default=300)
+    args = parser.parse_args()
+
+    with investify.app.app_context():
+        investify.init_database()
+        report = investify.seed_users(['poller'], password='poll123', friends=(0, 0), seed=0,
+                                      holdings=(args.holdings, args.holdings),
+                                      round_trips=(args.round_trips, args.round_trips))
+        user_id = investify.User.query.filter_by(username='poller').one().id
+    print(f"1 user, {report['holdings']} holdings, {report['transactions']} transactions, {args.polls} polls each")
+
+    client = investify.app.test_client()
+    client.post('/login', json={'username': 'poller', 'password': 'poll123'})
+    statements = [0]
+
+    @event.listens_for(investify.Engine, 'before_cursor_execute')
+    def count(*_):
+        statements[0] += 1
+
+    print(f"  {'endpoint':28} {'rebuild':>18} {'memoized':>18} {'304':>18}")
+    for path in ENDPOINTS:
+        cells = []
+        for options in ({'before': lambda: bump(user_id)}, {}, {'conditional': True}):
+            median, queries = measure(client, path, args.polls, statements, **options)
+            cells.append(f"{median:7.2f} ms {queries:4.1f} q")
+        print(f"  {path:28} " + ' '.join(f"{cell:>18}" for cell in cells))
+    print(f"  payload cache: {investify.payload_cache.stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark QuoteClient against the fake quote server under injected faults.
+
+Scenarios, each run by ``--clients`` threads making ``--fetches`` calls:
+
+  healthy  one-shot requests.get per call (the old fetcher) vs the pooled
+           keep-alive client
+  tail     --slow-rate of responses delayed by 1 s; no hedging vs hedging
+  flaky    --error-rate of responses are 503s; no retries vs retries
+  outage   every response fails; shows the breaker opening (fail-fast
+           latency) and closing again once the server recovers
+
+Usage: python benchmarks/quote_client_benchmark.py [--clients 8] [--fetches 200]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from fake_quote_server import FakeQuoteServer
+from quote_client import CircuitBreaker, QuoteClient, parse_quote_response
+
+SYMBOLS = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA']
+
+
+def one_shot(url):
+    """The previous fetcher: a new connection per call and a 6 s timeout"""
+    def fetch(symbols):
+        r = requests.get(url, params={'symbols': ','.join(symbols)}, timeout=6)
+        r.raise_for_status()
+        return parse_quote_response(r.json())
+    return fetch
+
+
+def drive(fetch, clients, fetches):
+    latencies, failures = [], [0]
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(fetches // clients):
+            start = time.perf_counter()
+            try:
+                ok = bool(fetch(SYMBOLS))
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                failures[0] += not ok
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    return {
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'max': latencies[-1] * 1000,
+        'failed': failures[0] / len(latencies),
+    }
+
+
+def show(label, result, extra=''):
+    print(f"  {label:34} p50 {result['p50']:7.1f} ms  p99 {result['p99']:7.1f} ms  "
+          f"max {result['max']:7.1f} ms  failed {result['failed']:6.1%}  {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quote client fault-injection benchmark')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--fetches', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.01, help='base server latency (s)')
+    parser.add_argument('--slow-rate', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.3)
+    args = parser.parse_args()
+
+    server = FakeQuoteServer(latency=args.latency).start()
+    url = server.url
+
+    def client(**options):
+        options.setdefault('breaker', CircuitBreaker(failure_threshold=10 ** 9))
+        return QuoteClient(url=url, **options)
+
+    print("healthy")
+    show('one-shot requests.get', drive(one_shot(url), args.clients, args.fetches))
+    show('pooled QuoteClient', drive(client().fetch, args.clients, args.fetches))
+
+    print(f"tail: {args.slow_rate:.0%} of responses +1 s")
+    server.slow_rate = args.slow_rate
+    show('pooled, no hedging', drive(client(hedge_after=0, retries=0).fetch, args.clients, args.fetches))
+    hedged = client(hedge_after=0.1)
+    show('pooled, hedge after 100 ms', drive(hedged.fetch, args.clients, args.fetches),
+         f"hedges {hedged.stats['hedges']}, won {hedged.stats['hedge_wins']}")
+    server.slow_rate = 0.0
+
+    print(f"flaky: {args.error_rate:.0%} of responses are 503")
+    server.error_rate = args.error_rate
+    show('pooled, no retries', drive(client(retries=0).fetch, args.clients, args.fetches))
+    retried = client(retries=3, backoff=0.02)
+    show('pooled, 3 jittered retries', drive(retried.fetch, args.clients, args.fetches),
+         f"retries {retried.stats['retries']}")
+
+    print("outage: every response fails")
+    server.error_rate = 1.0
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=1.0)
+    guarded = client(breaker=breaker, retries=1, backoff=0.02)
+    show('no breaker', drive(client(retries=1, backoff=0.02).fetch, args.clients, args.fetches))
+    show('breaker (5 failures, 1 s reset)', drive(guarded.fetch, args.clients, args.fetches),
+         f"short-circuited {guarded.stats['short_circuited']}, upstream attempts {guarded.stats['attempts']}")
+    server.error_rate = 0.0
+    time.sleep(breaker.reset_timeout)
+    guarded.fetch(SYMBOLS)
+    print(f"  after recovery + reset timeout: breaker {breaker.state}")
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-trade ranking cost as the user base grows.
+
+Compares the incremental RankIndex (move one user, read one rank) against the
+old approach of re-sorting and re-numbering every user on each trade.
+
+Usage: python benchmarks/rank_benchmark.py [--sizes 1000,10000,100000,1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rankings import RankIndex
+
+
+def full_rerank(values):
+    """What update_user_rankings() used to do, minus the database round-trip"""
+    ordered = sorted(values.items(), key=lambda kv: kv[1], reverse=True)
+    return {user_id: i for i, (user_id, _) in enumerate(ordered, 1)}
+
+
+def bench_incremental(n, trades):
+    values = {user_id: random.uniform(8000, 15000) for user_id in range(1, n + 1)}
+    index = RankIndex(ttl=None)
+    index.load(values.items())
+    movers = [random.randint(1, n) for _ in range(trades)]
+    start = time.perf_counter()
+    for user_id in movers:
+        index.update(user_id, values[user_id] * random.uniform(0.95, 1.05))
+        index.rank(user_id)
+    return (time.perf_counter() - start) / trades
+
+
+def bench_full(n, trades):
+    values = {user_id: random.uniform(8000, 15000) for user_id in range(1, n + 1)}
+    movers = [random.randint(1, n) for _ in range(trades)]
+    start = time.perf_counter()
+    for user_id in movers:
+        values[user_id] *= random.uniform(0.95, 1.05)
+        full_rerank(values)
+    return (time.perf_counter() - start) / trades
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000')
+    parser.add_argument('--trades', type=int, default=2000)
+    parser.add_argument('--full-max', type=int, default=100000,
+                        help='skip the full re-rank baseline above this many users')
+    args = parser.parse_args()
+
+    random.seed(42)
+    print(f"{'users':>10}  {'incremental us/trade':>22}  {'full re-rank us/trade':>22}")
+    for n in (int(s) for s in args.sizes.split(',')):
+        inc = bench_incremental(n, args.trades)
+        if n <= args.full_max:
+            full = bench_full(n, max(1, min(args.trades, 2_000_000 // n)))
+            full_str = f"{full * 1e6:22.1f}"
+        else:
+            full_str = f"{'skipped':>22}"
+        print(f"{n:>10}  {inc * 1e6:22.2f}  {full_str}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark worker boot: import time and time to first request.
+
+Each cold run is a fresh interpreter that imports the app and then serves
+its first requests through the test client, the way a gunicorn worker
+without ``--preload`` boots. The preload runs import the app once, run
+``warm_up()`` and fork a child per run, the way gunicorn.conf.py's
+preload_app does; the child only pays for its first requests.
+
+The schema is created once up front (``init_database()``, what ``flask
+init-db`` runs), so the timings cover booting against an existing database.
+
+Usage: python benchmarks/startup_benchmark.py [--runs 5] [--modules 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import textwrap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Two page renders and a login attempt (one user lookup on the database)
+FIRST_REQUESTS = '''
+client.get('/')
+client.get('/login')
+client.post('/login', json={'username': 'nobody', 'password': 'x'})
+'''
+
+COLD = f"""
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {ROOT!r})
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+{FIRST_REQUESTS}
+served = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'first_request': served - imported,
+                  'modules': len(sys.modules)}}))
+"""
+
+PRELOAD = f"""
+import json, os, sys, time
+sys.path.insert(0, {ROOT!r})
+import app
+app.warm_up()
+for _ in range(int(sys.argv[1])):
+    start = time.perf_counter()
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        client = app.app.test_client()
+{textwrap.indent(FIRST_REQUESTS, ' ' * 8)}
+        os.write(write, json.dumps({{'first_request': time.perf_counter() - start}}).encode())
+        os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as pipe:
+        print(pipe.read(), flush=True)
+    os.waitpid(pid, 0)
+"""
+
+
+def run(code, env, *args):
+    out = subprocess.run([sys.executable, '-c', code, *args], env=env, capture_output=True, text=True, check=True)
+    return [json.loads(line) for line in out.stdout.splitlines() if line.startswith('{')]
+
+
+def slowest_imports(env, limit):
+    """Cumulative import time of each module app.py imports directly, from ``-X importtime``"""
+    err = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], env=env, cwd=ROOT,
+                         capture_output=True, text=True, check=True).stderr
+    children = []
+    for line in err.splitlines():
+        fields = line.split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0:
+            # A module is reported after everything it imported
+            if name.strip() == 'app':
+                break
+            children = []
+        elif depth == 1:
+            children.append((name.strip(), int(fields[1])))
+    return sorted(children, key=lambda item: -item[1])[:limit]
+
+
+def summary(samples):
+    return f"median {statistics.median(samples) * 1000:7.1f} ms  min {min(samples) * 1000:7.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker boot time benchmark')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--modules', type=int, default=10, help='show the N slowest imports (0 to skip)')
+    args = parser.parse_args()
+
+    env = dict(os.environ, LEADERBOARD_REFRESHER='0', QUOTE_API_URL='http://127.0.0.1:1/quote')
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'startup.db'))
+    subprocess.run([sys.executable, '-c', 'import app\nwith app.app.app_context(): app.init_database()'],
+                   env=env, cwd=ROOT, check=True, capture_output=True)
+
+    cold = [run(COLD, env)[0] for _ in range(args.runs)]
+    print(f"cold boot ({args.runs} runs, {cold[0]['modules']} modules loaded)")
+    print(f"  import app                 {summary([r['import'] for r in cold])}")
+    print(f"  first requests             {summary([r['first_request'] for r in cold])}")
+    print(f"  import + first requests    {summary([r['import'] + r['first_request'] for r in cold])}")
+    forked = run(PRELOAD, env, str(args.runs))
+    print("preloaded (fork after import)")
+    print(f"  fork + first requests      {summary([r['first_request'] for r in forked])}")
+
+    if args.modules:
+        print("slowest imports from app.py (cumulative)")
+        for name, micros in slowest_imports(env, args.modules):
+            print(f"  {name:26} {micros / 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Multi-threaded trade stress test for the atomic trade engine.
+
+Many threads hammer a handful of users with random BUY/SELL orders at the
+same time, then the ledger is checked:
+
+* no user has negative cash and no holding has negative shares
+* cash_balance == starting cash - sum(BUY cost) + sum(SELL proceeds)
+* holding.shares == sum(BUY shares) - sum(SELL shares) per symbol
+
+Runs against a throwaway SQLite file unless DATABASE_URL is set.
+
+Usage: python benchmarks/trade_stress.py [--threads 16] [--trades 200] [--users 4]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stress.db'))
+os.environ.setdefault('LEADERBOARD_REFRESHER', '0')
+
+from app import app, db, User, Holding, Transaction, init_database, trade_engine
+
+SYMBOLS = ['AAPL', 'MSFT', 'TSLA']
+STARTING_CASH = 10000.0
+
+
+def setup_users(count):
+    users = []
+    for i in range(count):
+        user = User(username=f'stress_{i}_{time.time_ns()}', email=f'stress_{i}_{time.time_ns()}@example.com',
+                    password_hash='x', cash_balance=STARTING_CASH, portfolio_value=STARTING_CASH)
+        db.session.add(user)
+        users.append(user)
+    db.session.commit()
+    return [u.id for u in users]
+
+
+def worker(user_ids, trades, seed, counters, lock):
+    rng = random.Random(seed)
+    with app.app_context():
+        for _ in range(trades):
+            action = rng.choice(('BUY', 'BUY', 'SELL'))
+            shares = rng.randint(1, 20)
+            price = round(rng.uniform(50, 400), 2)
+            try:
+                result = trade_engine.execute(rng.choice(user_ids), rng.choice(SYMBOLS), action, shares, price)
+                if result.success:
+                    db.session.commit()
+                outcome = 'ok' if result.success else 'rejected'
+            except Exception:
+                db.session.rollback()
+                outcome = 'error'
+            with lock:
+                counters[outcome] += 1
+        db.session.remove()
+
+
+def check_invariants(user_ids):
+    problems = []
+    for user_id in user_ids:
+        user = db.session.get(User, user_id)
+        expected_cash = STARTING_CASH
+        expected_shares = defaultdict(int)
+        for t in Transaction.query.filter_by(user_id=user_id):
+            if t.action == 'BUY':
+                expected_cash -= t.shares * t.price
+                expected_shares[t.symbol] += t.shares
+            else:
+                expected_cash += t.shares * t.price
+                expected_shares[t.symbol] -= t.shares
+        if user.cash_balance < -1e-6:
+            problems.append(f'user {user_id}: negative cash {user.cash_balance:.2f}')
+        if abs(user.cash_balance - expected_cash) > 1e-4:
+            problems.append(f'user {user_id}: cash {user.cash_balance:.2f} != ledger {expected_cash:.2f}')
+        for h in Holding.query.filter_by(user_id=user_id):
+            if h.shares < 0:
+                problems.append(f'user {user_id} {h.symbol}: negative shares {h.shares}')
+            if h.shares != expected_shares[h.symbol]:
+                problems.append(f'user {user_id} {h.symbol}: shares {h.shares} != ledger {expected_shares[h.symbol]}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent trade stress test')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--trades', type=int, default=200, help='trades per thread')
+    parser.add_argument('--users', type=int, default=4, help='users shared by all threads')
+    args = parser.parse_args()
+
+    with app.app_context():
+        init_database()
+        user_ids = setup_users(args.users)
+
+    counters = defaultdict(int)
+    lock = threading.Lock()
+    threads = [threading.Thread(target=worker, args=(user_ids, args.trades, i, counters, lock))
+               for i in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    total = sum(counters.values())
+    print(f"{args.threads} threads x {args.trades} trades on {args.users} users "
+          f"({app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0]})")
+    print(f"  executed {counters['ok']}, rejected {counters['rejected']}, errors {counters['error']}")
+    print(f"  {total / elapsed:.1f} trades/sec")
+
+    with app.app_context():
+        problems = check_invariants(user_ids)
+    if problems:
+        print("INVARIANTS VIOLATED:")
+        for p in problems:
+            print("  " + p)
+        sys.exit(1)
+    print("  invariants hold")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Versioned JSON responses: ETags, 304s and a memo of serialized payloads.
+
+Each user row has a ``data_version`` counter. It is bumped in the same
+transaction as any change to what that user's JSON endpoints return:
+trades, price updates, profile edits, rank moves and friend/achievement
+counters. A response's ETag is built from the version, so a poll whose
+``If-None-Match`` still matches is answered with 304 after a single
+primary-key read, without loading holdings or transactions.
+
+When a body is needed, it is memoized per (endpoint, user, query string),
+tagged with the version it was built from. Another tab polling the same
+version gets the serialized bytes back, and a newer version replaces the
+entry. The memo is bounded by total payload size, least recently used
+first.
+"""
+import threading
+from collections import OrderedDict
+
+
+class PayloadCache:
+    """Per-worker LRU of serialized JSON bodies, each valid for a single data version"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (version, body)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'evictions': 0, 'bytes': 0}
+
+    def get(self, key, version, build):
+        """The body for ``key`` at ``version``, calling ``build()`` (returning str or bytes) on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[1]
+            self.stats['misses'] += 1
+        body = build()
+        if isinstance(body, str):
+            body = body.encode()
+        if len(body) <= self.max_bytes:
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._size -= len(old[1])
+                self._entries[key] = (version, body)
+                self._size += len(body)
+                while self._size > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self._size -= len(evicted)
+                    self.stats['evictions'] += 1
+                self.stats['bytes'] = self._size
+        return body
+
+    def not_modified(self):
+        with self._lock:
+            self.stats['not_modified'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.stats['bytes'] = 0
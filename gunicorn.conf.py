@@ -0,0 +1,60 @@
+# Gunicorn settings, picked up automatically by `gunicorn app:app`.
+#
+# Live price streams (/stream) hold a connection open per browser tab, so the
+# default worker is gevent: each idle stream is a cheap greenlet instead of
+# a whole sync worker. Set WEB_WORKER_CLASS=sync to go back to plain workers.
+#
+# The app is imported once in the master and forked (preload_app), so a new
+# or restarted worker is serving within milliseconds instead of re-importing
+# everything. Workers never create tables: run `flask init-db` first (the
+# Procfile's release step). Set WEB_PRELOAD=0 to import the app per worker,
+# e.g. to pick up new code on a HUP.
+import os
+
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gevent')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 2000))
+# Streams send a keepalive every 15s; don't let the sync/gthread timeout kill them
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+preload_app = os.environ.get('WEB_PRELOAD', '1') != '0'
+
+if preload_app and worker_class == 'gevent':
+    # The gevent worker patches the stdlib after the fork, which is too late
+    # for modules the preloaded app has already imported; patch them first
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded, before any worker forks
+    if preload_app:
+        from app import warm_up
+        warm_up()
+
+
+def post_fork(server, worker):
+    # psycopg2 blocks the whole event loop while waiting on Postgres unless it
+    # is told to yield to gevent
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            pass
+        else:
+            patch_psycopg()
+    if preload_app:
+        # Pooled connections the master may have opened belong to the master
+        from app import app, db, password_hasher
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+        # Fork the password-hashing processes while this worker is still single-threaded
+        password_hasher.start()
+
+
+def post_worker_init(worker):
+    # Without preload the app (and gevent's patching) only arrives in the worker;
+    # this still runs before it serves a request or starts a thread
+    if not preload_app:
+        from app import password_hasher
+        password_hasher.start()
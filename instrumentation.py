@@ -0,0 +1,354 @@
+"""
+Request-level instrumentation: latency histograms, SQL and outbound HTTP
+accounting, Prometheus exposition, N+1 detection and an opt-in sampling
+profiler for slow requests.
+
+Every request gets a ``RequestStats`` in a context variable. SQLAlchemy
+cursor events and wrapped outbound calls add their time to whichever
+request is current, so a request's total splits into database, upstream
+HTTP and everything else. Work done outside a request (background threads)
+still lands in the global query and HTTP histograms.
+
+Metrics live in this process; with several gunicorn workers each one
+serves its own ``/metrics``.
+
+The profiler samples ``sys._current_frames()`` for threads currently
+serving a request and writes collapsed stacks (``frame;frame;frame count``,
+the input format of flamegraph.pl and speedscope) for each request slower
+than the threshold. Greenlets share one OS thread, so profile under sync or
+gthread workers.
+"""
+import functools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_current = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """What one request spent its time on"""
+
+    def __init__(self, route, method):
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = Counter()     # SQL text -> times issued
+        self.http_calls = 0
+        self.http_time = 0.0
+        self.samples = Counter()        # collapsed stack -> profiler samples
+
+
+def current_request():
+    """The ``RequestStats`` of the request being served, or None"""
+    return _current.get()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)    # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """A small Prometheus-style registry of counters and histograms"""
+
+    def __init__(self, namespace='investify'):
+        self.namespace = namespace
+        self._help = {}
+        self._types = {}
+        self._buckets = {}
+        self._series = {}       # name -> {label tuple: value or Histogram}
+        self._collectors = []   # (prefix, callable returning a dict of numbers)
+        self._lock = threading.Lock()
+
+    def counter(self, name, help):
+        self._define(name, help, 'counter')
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        self._buckets[self._define(name, help, 'histogram')] = buckets
+
+    def _define(self, name, help, kind):
+        name = f'{self.namespace}_{name}'
+        self._help[name] = help
+        self._types[name] = kind
+        self._series.setdefault(name, {})
+        return name
+
+    def inc(self, metric, amount=1, **labels):
+        name = f'{self.namespace}_{metric}'
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, metric, value, **labels):
+        name = f'{self.namespace}_{metric}'
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._buckets[name])
+            histogram.observe(value)
+
+    def register_collector(self, prefix, collect):
+        """Export ``collect()``'s numeric values as gauges named ``<namespace>_<prefix>_<key>``"""
+        self._collectors.append((prefix, collect))
+
+    def render(self):
+        """The Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted(self._series):
+                lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} {self._types[name]}')
+                for labels, value in sorted(self._series[name].items()):
+                    if not isinstance(value, Histogram):
+                        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets + ('+Inf',), value.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {value.sum!r}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        for prefix, collect in self._collectors:
+            try:
+                values = collect()
+            except Exception:
+                logger.exception("Metrics collector %s failed", prefix)
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f'{self.namespace}_{prefix}_{re.sub(r"[^a-zA-Z0-9_]", "_", key)}'
+                lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads that are serving a request"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._active = {}       # thread ident -> RequestStats
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def attach(self, stats):
+        with self._lock:
+            self._active[threading.get_ident()] = stats
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+
+    def detach(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for ident, stats in active:
+                frame = frames.get(ident)
+                if frame is not None:
+                    stats.samples[collapse(frame)] += 1
+
+
+def collapse(frame):
+    """Root-first ``func (file:line);...`` stack, one entry per function rather than per line"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+class Instrumentation:
+    """Flask hooks plus SQLAlchemy and outbound-call accounting feeding one ``Metrics`` registry"""
+
+    def __init__(self, metrics=None, n_plus_one_threshold=20, slow_request_seconds=1.0,
+                 profile_dir=None, profile_interval=0.005):
+        self.metrics = metrics or Metrics()
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.slow_request_seconds = slow_request_seconds
+        self.profile_dir = profile_dir
+        self.profiler = SamplingProfiler(profile_interval) if profile_dir else None
+
+        m = self.metrics
+        m.counter('http_requests_total', 'Requests served, by route, method and status')
+        m.histogram('http_request_duration_seconds', 'Request latency by route')
+        m.histogram('http_request_db_queries', 'SQL statements issued per request', QUERY_COUNT_BUCKETS)
+        m.counter('http_request_db_seconds_total', 'Time spent in SQL, by route')
+        m.counter('http_request_outbound_seconds_total', 'Time spent in outbound HTTP calls, by route')
+        m.counter('http_slow_requests_total', 'Requests slower than the slow-request threshold')
+        m.counter('http_n_plus_one_requests_total', 'Requests issuing more SQL statements than the N+1 threshold')
+        m.histogram('db_query_duration_seconds', 'SQL statement latency')
+        m.histogram('outbound_request_duration_seconds', 'Outbound HTTP call latency, by target')
+        m.counter('outbound_request_errors_total', 'Outbound HTTP calls that raised, by target')
+        m.histogram('function_duration_seconds', 'Latency of instrumented functions')
+
+    # --- Flask -------------------------------------------------------------
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        from flask import g, request
+        rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        stats = RequestStats(rule, request.method)
+        g._instrumentation_token = _current.set(stats)
+        if self.profiler is not None:
+            self.profiler.attach(stats)
+
+    def _after_request(self, response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        m = self.metrics
+        m.inc('http_requests_total', route=stats.route, method=stats.method, status=response.status_code)
+        if response.is_streamed:
+            # Long-lived streams (SSE) would swamp the latency histogram
+            return response
+        elapsed = time.perf_counter() - stats.started
+        m.observe('http_request_duration_seconds', elapsed, route=stats.route, method=stats.method)
+        m.observe('http_request_db_queries', stats.queries, route=stats.route)
+        m.inc('http_request_db_seconds_total', stats.sql_time, route=stats.route)
+        m.inc('http_request_outbound_seconds_total', stats.http_time, route=stats.route)
+
+        if stats.queries > self.n_plus_one_threshold:
+            m.inc('http_n_plus_one_requests_total', route=stats.route)
+            statement, repeats = stats.statements.most_common(1)[0]
+            logger.warning("Possible N+1: %s %s issued %d SQL statements; most repeated (%dx): %s",
+                           stats.method, stats.route, stats.queries, repeats, ' '.join(statement.split())[:300])
+        if elapsed >= self.slow_request_seconds:
+            m.inc('http_slow_requests_total', route=stats.route)
+            logger.warning("Slow request: %s %s took %.0f ms (sql %.0f ms in %d statements, outbound %.0f ms in %d calls)",
+                           stats.method, stats.route, elapsed * 1000, stats.sql_time * 1000, stats.queries,
+                           stats.http_time * 1000, stats.http_calls)
+            if self.profiler is not None:
+                self.profiler.detach()
+                self._dump_profile(stats, elapsed)
+        return response
+
+    def _teardown_request(self, exc):
+        from flask import g
+        if self.profiler is not None:
+            self.profiler.detach()
+        token = g.pop('_instrumentation_token', None)
+        if token is not None:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # Torn down from another context (e.g. after a streamed response)
+                _current.set(None)
+
+    def _dump_profile(self, stats, elapsed):
+        if not stats.samples:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        slug = re.sub(r'[^a-zA-Z0-9]+', '_', stats.route).strip('_') or 'root'
+        path = os.path.join(self.profile_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{slug}-{elapsed * 1000:.0f}ms.folded')
+        with open(path, 'w') as f:
+            for stack, count in stats.samples.most_common():
+                f.write(f'{stack} {count}\n')
+        logger.warning("Profile for slow %s %s written to %s", stats.method, stats.route, path)
+
+    # --- SQLAlchemy --------------------------------------------------------
+
+    def watch_sql(self, target):
+        """Count and time every statement run on ``target`` (an Engine, or the Engine class for all of them)"""
+        from sqlalchemy import event
+        event.listen(target, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(target, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_instrumentation_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('_instrumentation_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        self.metrics.observe('db_query_duration_seconds', elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_time += elapsed
+            stats.statements[statement] += 1
+
+    # --- outbound calls and hot functions -----------------------------------
+
+    def outbound(self, target, fn):
+        """Wrap an outbound HTTP call so its time is recorded against ``target`` and the current request"""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                self.metrics.inc('outbound_request_errors_total', target=target)
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                self.metrics.observe('outbound_request_duration_seconds', elapsed, target=target)
+                stats = _current.get()
+                if stats is not None:
+                    stats.http_calls += 1
+                    stats.http_time += elapsed
+        return wrapper
+
+    def timed(self, name):
+        """Decorator recording a function's latency as ``function_duration_seconds{name=...}``"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.metrics.observe('function_duration_seconds', time.perf_counter() - started, name=name)
+            return wrapper
+        return decorator
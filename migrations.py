@@ -0,0 +1,181 @@
+"""
+Minimal, forward-only schema migrations.
+
+``db.create_all()`` only creates missing tables; it never adds indexes or
+constraints to tables that already exist. Each migration below is applied
+once, in order, and recorded in the ``schema_migrations`` table. All DDL
+uses ``IF NOT EXISTS`` so a migration is also a no-op on a database that
+``create_all()`` just built from the current models.
+
+Works on SQLite and PostgreSQL. Run with ``flask db-upgrade``; verify the
+hot query paths with ``flask check-indexes``.
+"""
+import json
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+
+def _dedupe(conn, table, columns):
+    """Delete duplicate rows on ``columns``, keeping the lowest id"""
+    cols = ', '.join(columns)
+    conn.execute(text(
+        f'DELETE FROM "{table}" WHERE id NOT IN '
+        f'(SELECT MIN(id) FROM "{table}" GROUP BY {cols})'
+    ))
+
+
+def _merge_duplicate_holdings(conn):
+    """Fold duplicate (user_id, symbol) holdings into the lowest-id row"""
+    groups = conn.execute(text(
+        'SELECT user_id, symbol FROM holding GROUP BY user_id, symbol HAVING COUNT(*) > 1'
+    )).fetchall()
+    for user_id, symbol in groups:
+        rows = conn.execute(text(
+            'SELECT id, shares, avg_price, last_price FROM holding '
+            'WHERE user_id = :u AND symbol = :s ORDER BY id'
+        ), {'u': user_id, 's': symbol}).fetchall()
+        shares = sum(r.shares or 0 for r in rows)
+        cost = sum((r.shares or 0) * (r.avg_price or 0.0) for r in rows)
+        last_price = next((r.last_price for r in reversed(rows) if r.last_price), 0.0)
+        keep = rows[0].id
+        conn.execute(text(
+            'UPDATE holding SET shares = :shares, avg_price = :avg, last_price = :last WHERE id = :id'
+        ), {'shares': shares, 'avg': cost / shares if shares else 0.0, 'last': last_price, 'id': keep})
+        conn.execute(text(
+            'DELETE FROM holding WHERE user_id = :u AND symbol = :s AND id != :id'
+        ), {'u': user_id, 's': symbol, 'id': keep})
+
+
+def _0001_hot_path_indexes(conn):
+    _merge_duplicate_holdings(conn)
+    _dedupe(conn, 'friendship', ['user_id', 'friend_id'])
+    _dedupe(conn, 'user_achievement', ['user_id', 'achievement_id'])
+    for statement in (
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_holding_user_symbol ON holding (user_id, symbol)',
+        'CREATE INDEX IF NOT EXISTS ix_holding_symbol ON holding (symbol)',
+        'CREATE INDEX IF NOT EXISTS ix_transaction_user_timestamp ON "transaction" (user_id, timestamp, id)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_friendship_user_friend ON friendship (user_id, friend_id)',
+        'CREATE INDEX IF NOT EXISTS ix_friendship_friend_id ON friendship (friend_id)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_user_achievement ON user_achievement (user_id, achievement_id)',
+        'CREATE INDEX IF NOT EXISTS ix_user_portfolio_value ON "user" (portfolio_value)',
+    ):
+        conn.execute(text(statement))
+
+
+def _0002_canonical_friendships(conn):
+    """Store each friendship once, as (lower id, higher id)"""
+    conn.execute(text('DELETE FROM friendship WHERE user_id = friend_id'))
+    # Pairs stored in both directions keep the canonical row
+    conn.execute(text(
+        'DELETE FROM friendship WHERE user_id > friend_id AND EXISTS ('
+        'SELECT 1 FROM friendship f WHERE f.user_id = friendship.friend_id AND f.friend_id = friendship.user_id)'
+    ))
+    conn.execute(text(
+        'UPDATE friendship SET user_id = friend_id, friend_id = user_id WHERE user_id > friend_id'
+    ))
+    conn.execute(text(
+        'UPDATE "user" SET friends_count = (SELECT COUNT(*) FROM friendship '
+        'WHERE friendship.user_id = "user".id OR friendship.friend_id = "user".id)'
+    ))
+
+
+def _0003_user_data_version(conn):
+    """Per-user counter behind the JSON endpoints' ETags (SQLite has no ADD COLUMN IF NOT EXISTS)"""
+    if 'data_version' not in {column['name'] for column in inspect(conn).get_columns('user')}:
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0'))
+
+
+# (version, description, function) - append only, never reorder
+MIGRATIONS = [
+    (1, 'hot path indexes and uniqueness constraints', _0001_hot_path_indexes),
+    (2, 'canonical (lower id, higher id) friendship edges', _0002_canonical_friendships),
+    (3, 'user data_version counter', _0003_user_data_version),
+]
+
+
+def applied_versions(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at TIMESTAMP)'
+    ))
+    return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def upgrade(engine):
+    """Apply every pending migration, each in its own transaction. Returns the versions applied."""
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            # Another process may have applied it since we looked
+            if version in applied_versions(conn):
+                continue
+            migrate(conn)
+            conn.execute(text(
+                'INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)'
+            ), {'v': version, 'd': description, 't': datetime.utcnow()})
+        applied.append(version)
+    return applied
+
+
+# Hot lookups that must be served by an index, as (name, sql, params, ordered_scan_ok).
+# ordered_scan_ok marks ORDER BY ... LIMIT queries where walking an index in
+# order is the intended plan; everything else must be a keyed index search.
+HOT_QUERIES = [
+    ('holding by user and symbol',
+     'SELECT * FROM holding WHERE user_id = :u AND symbol = :s', {'u': 1, 's': 'AAPL'}, False),
+    ('holdings by symbol',
+     'SELECT user_id FROM holding WHERE symbol = :s', {'s': 'AAPL'}, False),
+    ('transactions by user, newest first',
+     'SELECT * FROM "transaction" WHERE user_id = :u ORDER BY timestamp DESC, id DESC LIMIT 50', {'u': 1}, False),
+    ('friendship by pair',
+     'SELECT id FROM friendship WHERE user_id = :u AND friend_id = :f', {'u': 1, 'f': 2}, False),
+    ('friendship reverse edge',
+     'SELECT user_id FROM friendship WHERE friend_id = :f', {'f': 2}, False),
+    ('user achievement by pair',
+     'SELECT id FROM user_achievement WHERE user_id = :u AND achievement_id = :a', {'u': 1, 'a': 1}, False),
+    ('users by portfolio value',
+     'SELECT id FROM "user" ORDER BY portfolio_value DESC LIMIT 50', {}, True),
+]
+
+
+def _sqlite_uses_index(conn, sql, params, ordered_scan_ok):
+    plan = [row[-1] for row in conn.execute(text('EXPLAIN QUERY PLAN ' + sql), params)]
+    searches = [step for step in plan if step.startswith('SEARCH')]
+    scans = [step for step in plan if step.startswith('SCAN')]
+    if ordered_scan_ok:
+        ok = all('INDEX' in step for step in scans) and bool(scans or searches)
+    else:
+        ok = bool(searches) and not scans and 'TEMP B-TREE' not in ' '.join(plan)
+    return ok, plan
+
+
+def _postgres_uses_index(conn, sql, params, ordered_scan_ok):
+    # Tiny tables make a seq scan the cheapest plan; ask whether an index *can* serve it
+    conn.execute(text('SET LOCAL enable_seqscan = off'))
+    plan = conn.execute(text('EXPLAIN (FORMAT JSON) ' + sql), params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    node_types = []
+    stack = [plan[0]['Plan']]
+    while stack:
+        node = stack.pop()
+        node_types.append(node['Node Type'])
+        stack.extend(node.get('Plans', []))
+    uses_index = any('Index' in t for t in node_types)
+    return uses_index and 'Seq Scan' not in node_types, node_types
+
+
+def explain_hot_queries(engine):
+    """Return ``[(name, uses_index, plan)]`` for every query in HOT_QUERIES"""
+    check = _postgres_uses_index if engine.dialect.name == 'postgresql' else _sqlite_uses_index
+    results = []
+    for name, sql, params, ordered_scan_ok in HOT_QUERIES:
+        with engine.begin() as conn:
+            ok, plan = check(conn, sql, params, ordered_scan_ok)
+        results.append((name, ok, plan))
+    return results
@@ -0,0 +1,137 @@
+"""
+Password hashing and verification off the request thread.
+
+The KDFs behind werkzeug's ``generate_password_hash`` / ``check_password_hash``
+are deliberately slow (scrypt by default: ~0.1-0.3 s of CPU and 32 MB).
+Run inline, every concurrent login holds a worker and a core for that long,
+so a burst of logins starves everything else. PasswordHasher runs them on a
+small process pool instead and bounds the backlog: once ``workers +
+max_queue`` jobs are in flight, new ones fail fast with PasswordPoolBusy
+(the routes answer 503 + Retry-After) instead of queueing behind the storm.
+
+``method`` is any werkzeug method string (``scrypt:32768:8:1``,
+``pbkdf2:sha256:600000``). Hashes made with different parameters still
+verify; ``needs_rehash()`` tells the login route to upgrade them.
+
+The pool's processes are forked from the server worker, so they must be
+forked before that worker starts any threads (a thread holding a lock at
+fork time leaves it locked forever in the child). gunicorn.conf.py calls
+``start()`` right after each worker forks, before it serves a request. On
+the gevent worker only the pool's result thread becomes a greenlet; the
+children just run the KDF and talk to the worker over pipes.
+"""
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class PasswordPoolBusy(Exception):
+    """The hashing pool is saturated (or timed out); retry later"""
+
+
+def canonical_method(method):
+    """Spell out werkzeug's defaults so stored hashes can be compared with ``method``"""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        defaults = ['32768', '8', '1']
+    elif name == 'pbkdf2':
+        defaults = ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        return method
+    return ':'.join([name] + args + defaults[len(args):])
+
+
+class PasswordHasher:
+    """Bounded process pool for password KDFs.
+
+    ``workers=0`` runs everything inline in the calling thread (CLI
+    commands, tests). Call ``start()`` in each server worker before it
+    starts threads; otherwise the pool is created on first use.
+    """
+
+    def __init__(self, method='scrypt', salt_length=16, workers=2, max_queue=8, timeout=10.0):
+        self.method = canonical_method(method)
+        self.salt_length = salt_length
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.stats = {'hashed': 0, 'verified': 0, 'rehashed': 0, 'rejected': 0, 'timeouts': 0, 'pending': 0}
+
+    def hash(self, password):
+        self._count('hashed')
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        self._count('verified')
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when the stored hash was made with other parameters than ``method``"""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def rehashed(self):
+        self._count('rehashed')
+
+    def start(self):
+        """Create the pool and fork all of its processes now"""
+        if self.workers <= 0:
+            return
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._new_pool()
+            pool = self._pool
+        # Processes are forked on the first submit
+        pool.submit(len, '').result()
+
+    def _new_pool(self):
+        # The platform default start method: spawn would re-import the server's
+        # __main__ (and with it the whole app) in every child
+        return ProcessPoolExecutor(self.workers)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.stats['rejected'] += 1
+                raise PasswordPoolBusy('password hashing is saturated')
+            self._pending += 1
+            self.stats['pending'] = self._pending
+            if self._pool is None:
+                # Not started, or restarted after a child died
+                self._pool = self._new_pool()
+            pool = self._pool
+        try:
+            future = pool.submit(fn, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                future.cancel()
+                self._count('timeouts')
+                raise PasswordPoolBusy('password hashing timed out') from None
+        except BrokenProcessPool:
+            # A child died (e.g. OOM-killed); start a fresh pool on the next call
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False)
+            raise PasswordPoolBusy('password hashing pool restarted') from None
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.stats['pending'] = self._pending
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Background market-data ingestion worker.
+
+Polls quotes for every symbol anyone holds and revalues all portfolios in
+bulk, so portfolio values (and the leaderboard) stay current for users who
+never press "refresh".
+
+Per batch of symbols it issues one set-based UPDATE of holding.last_price
+and one aggregate UPDATE of user.portfolio_value for the affected users.
+After each pass every portfolio value is sampled into the history series
+(see timeseries.py), so run it at the minute resolution's interval.
+
+A failing batch (quote fetch or database write) is rolled back and logged,
+and so is a failing cycle or history pass; the worker carries on with the
+next one rather than exiting.
+
+Usage:
+    python price_worker.py                      # poll Yahoo every 60s
+    python price_worker.py --once --source fake # single pass with fake prices
+    python price_worker.py --source replay --replay-file ticks.jsonl
+"""
+import argparse
+import logging
+import time
+
+from sqlalchemy import case, func, select, update
+
+from app import app, db, User, Holding, portfolio_history, user_cache
+from quotes import FakeQuoteSource, ReplayQuoteSource, YahooQuoteSource
+
+logger = logging.getLogger('price_worker')
+
+
+def held_symbols():
+    """Distinct symbols with at least one open position"""
+    rows = db.session.execute(
+        select(Holding.symbol).where(Holding.shares > 0).distinct().order_by(Holding.symbol)
+    )
+    return [row[0] for row in rows]
+
+
+def apply_prices(prices):
+    """Write ``{symbol: price}`` to every holding and revalue the affected users.
+
+    Returns ``(holdings_updated, users_revalued)``. Runs as two statements
+    regardless of how many holdings or users are involved. The revalued
+    users' cached principals are invalidated once the change commits
+    (immediately in the shared cache, so web workers see it within their
+    own short TTL).
+    """
+    if not prices:
+        return 0, 0
+    symbols = list(prices)
+
+    holdings_result = db.session.execute(
+        update(Holding)
+        .where(Holding.symbol.in_(symbols))
+        .values(last_price=case(prices, value=Holding.symbol))
+        .execution_options(synchronize_session=False)
+    )
+
+    stocks_value = (
+        select(func.coalesce(func.sum(
+            Holding.shares * func.coalesce(func.nullif(Holding.last_price, 0), Holding.avg_price)
+        ), 0.0))
+        .where(Holding.user_id == User.id)
+        .scalar_subquery()
+    )
+    affected_users = select(Holding.user_id).where(Holding.symbol.in_(symbols), Holding.shares > 0)
+    revalued = db.session.execute(
+        update(User)
+        .where(User.id.in_(affected_users))
+        .values(portfolio_value=User.cash_balance + stocks_value, data_version=User.data_version + 1)
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    user_cache.invalidate_after_commit(db.session, *revalued)
+    db.session.commit()
+    return holdings_result.rowcount, len(revalued)
+
+
+def run_cycle(source, batch_size=100):
+    """One pass over every held symbol; returns throughput metrics"""
+    started = time.perf_counter()
+    symbols = held_symbols()
+    priced = 0
+    holdings_updated = 0
+    users_revalued = 0
+    failed = 0
+    for i in range(0, len(symbols), batch_size):
+        batch = symbols[i:i + batch_size]
+        try:
+            prices = source.fetch(batch)
+            prices = {s: p for s, p in prices.items() if p and p > 0}
+            h, u = apply_prices(prices)
+        except Exception:
+            db.session.rollback()
+            failed += 1
+            logger.exception("Pricing failed for a batch of %d symbols", len(batch))
+            continue
+        priced += len(prices)
+        holdings_updated += h
+        users_revalued += u
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    return {
+        'symbols': len(symbols),
+        'symbols_priced': priced,
+        'holdings_updated': holdings_updated,
+        'users_revalued': users_revalued,
+        'batches_failed': failed,
+        'seconds': elapsed,
+        'symbols_per_sec': priced / elapsed,
+        'users_per_sec': users_revalued / elapsed,
+    }
+
+
+def build_source(args):
+    if args.source == 'fake':
+        return FakeQuoteSource()
+    if args.source == 'replay':
+        return ReplayQuoteSource(args.replay_file)
+    return YahooQuoteSource(url=args.quote_url)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Poll quotes and revalue every portfolio')
+    parser.add_argument('--source', choices=('yahoo', 'fake', 'replay'), default='yahoo')
+    parser.add_argument('--replay-file', help='JSON-lines file of {symbol: price} frames (for --source replay)')
+    parser.add_argument('--quote-url', help='override QUOTE_API_URL for the yahoo source')
+    parser.add_argument('--interval', type=float, default=60.0, help='seconds between passes')
+    parser.add_argument('--batch-size', type=int, default=100, help='symbols per upstream call and UPDATE')
+    parser.add_argument('--once', action='store_true', help='run a single pass and exit')
+    parser.add_argument('--no-history', action='store_true', help='skip recording portfolio history samples')
+    args = parser.parse_args()
+    if args.source == 'replay' and not args.replay_file:
+        parser.error('--source replay needs --replay-file')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+    source = build_source(args)
+    with app.app_context():
+        while True:
+            cycle_started = time.perf_counter()
+            try:
+                stats = run_cycle(source, args.batch_size)
+                logger.info(
+                    "priced %d/%d symbols, %d holdings, %d users in %.3fs "
+                    "(%.1f symbols/sec, %.1f users revalued/sec, %d failed batches)",
+                    stats['symbols_priced'], stats['symbols'], stats['holdings_updated'],
+                    stats['users_revalued'], stats['seconds'],
+                    stats['symbols_per_sec'], stats['users_per_sec'], stats['batches_failed'],
+                )
+            except Exception:
+                db.session.rollback()
+                logger.exception("Pricing cycle failed")
+            if not args.no_history:
+                started = time.perf_counter()
+                try:
+                    sampled = portfolio_history.record()
+                    rolled = portfolio_history.maintain()
+                    logger.info("recorded %d portfolio samples, rolled up %d values in %.3fs",
+                                sampled, rolled, time.perf_counter() - started)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Recording portfolio history failed")
+            if args.once:
+                break
+            time.sleep(max(0.0, args.interval - (time.perf_counter() - cycle_started)))
+
+
+if __name__ == '__main__':
+    main()
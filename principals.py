@@ -0,0 +1,281 @@
+"""
+Cached user principals for Flask-Login.
+
+``load_user()`` runs on every authenticated request, and a dashboard load
+makes three of them. UserCache keeps a snapshot of each user's columns
+(never the password hash) in a per-worker LRU with a TTL, optionally in
+front of a cache shared by every worker on the host, and hands out
+UserPrincipal objects built from it, so most requests never touch the
+user table.
+
+A principal is read-only. Code that writes asks for the ORM row with
+``record()``, which is loaded on first use (or is already attached when the
+snapshot was just built from it). Anything that changes a cached column
+invalidates the user; within a flush, use ``invalidate_after_commit`` so a
+concurrent request can't re-cache the old row before the commit lands.
+Changes made by other workers reach this worker's LRU within its TTL.
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import set_committed_value
+
+logger = logging.getLogger(__name__)
+
+
+class UserPrincipal(UserMixin):
+    """Stands in for the User row as ``current_user``; attribute reads come from the snapshot.
+
+    Once ``record()`` has loaded the row, reads go to the row instead, so
+    values written during the request are seen by the rest of it.
+    """
+
+    def __init__(self, fields, loader, row=None):
+        self._fields = fields
+        self._loader = loader
+        self._row = row
+        self._overrides = {}
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._row is not None:
+            return getattr(self._row, name)
+        try:
+            return self._fields[name]
+        except KeyError:
+            # Not snapshotted (relationships, new columns): read it from the row
+            return getattr(self.record(), name)
+
+    def __setattr__(self, name, value):
+        if not name.startswith('_'):
+            raise AttributeError(f"can't set {name!r} on a cached user; write to record() instead")
+        object.__setattr__(self, name, value)
+
+    def __repr__(self):
+        return f'<UserPrincipal {self._fields.get("id")} {self._fields.get("username")!r}>'
+
+    @property
+    def is_active(self):
+        return bool(self.__getattr__('is_active'))
+
+    def set_committed(self, name, value):
+        """Replace a value for this request only, without marking the row dirty (e.g. a computed rank)"""
+        self._overrides[name] = value
+        self._fields = dict(self._fields, **{name: value})
+        if self._row is not None:
+            set_committed_value(self._row, name, value)
+
+    def record(self):
+        """The user's ORM row in the current session, for writes"""
+        if self._row is None:
+            row = self._loader(self._fields['id'])
+            for name, value in self._overrides.items():
+                set_committed_value(row, name, value)
+            self._row = row
+        return self._row
+
+
+class SharedUserCache:
+    """Host-wide snapshot store in a local SQLite file, shared by every worker process.
+
+    Lookups are a primary-key read on a local file, which is cheaper than a
+    round trip to a remote database. Invalidation leaves a timestamped
+    tombstone, so a worker that read the row before the invalidation can't
+    put the old snapshot back. Failures (e.g. a briefly locked file) count
+    as misses; the database stays the source of truth.
+
+    Connections are opened per thread on first use and never cross a fork,
+    so the cache can be built in a preloading gunicorn master.
+    """
+
+    def __init__(self, path, ttl=300.0):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=0.05, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS user_cache (user_id INTEGER PRIMARY KEY, '
+                         'expires REAL NOT NULL, invalidated_at REAL NOT NULL DEFAULT 0, fields BLOB)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, user_id):
+        try:
+            row = self._connect().execute(
+                'SELECT fields FROM user_cache WHERE user_id = ? AND expires > ?', (user_id, time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            logger.warning("Shared user cache read failed", exc_info=True)
+            return None
+        return pickle.loads(row[0]) if row and row[0] is not None else None
+
+    def set(self, user_id, fields, read_at):
+        """Store a snapshot read from the database at ``read_at`` (wall clock), unless invalidated since"""
+        try:
+            self._connect().execute(
+                'INSERT INTO user_cache (user_id, expires, fields) VALUES (?, ?, ?) '
+                'ON CONFLICT (user_id) DO UPDATE SET expires = excluded.expires, fields = excluded.fields '
+                'WHERE user_cache.invalidated_at < ?',
+                (user_id, time.time() + self.ttl, pickle.dumps(fields, pickle.HIGHEST_PROTOCOL), read_at),
+            )
+        except sqlite3.Error:
+            logger.warning("Shared user cache write failed", exc_info=True)
+
+    def delete(self, user_ids):
+        try:
+            now = time.time()
+            self._connect().executemany(
+                'INSERT INTO user_cache (user_id, expires, invalidated_at) VALUES (?, 0, ?) '
+                'ON CONFLICT (user_id) DO UPDATE SET expires = 0, invalidated_at = excluded.invalidated_at, fields = NULL',
+                [(user_id, now) for user_id in user_ids],
+            )
+        except sqlite3.Error:
+            # A stale entry left behind here lives until its TTL; say so loudly
+            logger.error("Shared user cache invalidation failed for %s", list(user_ids), exc_info=True)
+
+    def clear(self):
+        try:
+            self._connect().execute('DELETE FROM user_cache')
+        except sqlite3.Error:
+            logger.error("Shared user cache clear failed", exc_info=True)
+
+
+class _Miss:
+    """One in-flight load; only the latest miss for a user may fill the cache"""
+    __slots__ = ('started',)
+
+    def __init__(self):
+        self.started = time.time()
+
+
+class UserCache:
+    """Per-worker LRU + TTL of user snapshots, optionally backed by a SharedUserCache.
+
+    ``fields`` names the columns to snapshot. A ``ttl`` of 0 disables
+    caching: every request loads the row, as before.
+    """
+
+    SESSION_KEY = 'invalidate_users'
+
+    def __init__(self, fields, ttl=10.0, max_entries=10000, shared=None):
+        self.fields = tuple(fields)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries = OrderedDict()   # user_id -> (cached_at, fields)
+        self._loading = {}              # user_id -> token of the miss allowed to fill it
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def principal(self, user_id, loader):
+        """A UserPrincipal for ``user_id``, or None if there is no such user.
+
+        ``loader(user_id)`` returns the ORM row; it is called on a miss and
+        later by ``record()``.
+        """
+        if self.ttl <= 0:
+            row = loader(user_id)
+            return None if row is None else UserPrincipal(self.snapshot(row), loader, row)
+        fields, miss = self._lookup(user_id)
+        if fields is not None:
+            return UserPrincipal(fields, loader)
+        try:
+            row = loader(user_id)
+        except Exception:
+            self._abandon(user_id, miss)
+            raise
+        if row is None:
+            self._abandon(user_id, miss)
+            return None
+        fields = self.snapshot(row)
+        self._fill(user_id, fields, miss)
+        return UserPrincipal(fields, loader, row)
+
+    def snapshot(self, row):
+        return {name: getattr(row, name) for name in self.fields}
+
+    def _lookup(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(user_id)
+                self.stats['hits'] += 1
+                return entry[1], None
+            miss = self._loading[user_id] = _Miss()
+        if self.shared is not None:
+            fields = self.shared.get(user_id)
+            if fields is not None:
+                with self._lock:
+                    self.stats['shared_hits'] += 1
+                    self._store(user_id, fields, miss)
+                return fields, None
+        with self._lock:
+            self.stats['misses'] += 1
+        return None, miss
+
+    def _fill(self, user_id, fields, miss):
+        with self._lock:
+            stored = self._store(user_id, fields, miss)
+        if stored and self.shared is not None:
+            self.shared.set(user_id, fields, miss.started)
+
+    def _abandon(self, user_id, miss):
+        with self._lock:
+            if self._loading.get(user_id) is miss:
+                del self._loading[user_id]
+
+    def _store(self, user_id, fields, miss):
+        # An invalidation since the miss means the loaded row may predate it
+        if self._loading.get(user_id) is not miss:
+            return False
+        del self._loading[user_id]
+        self._entries[user_id] = (time.monotonic(), fields)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return True
+
+    def invalidate(self, *user_ids):
+        """Drop cached snapshots; call after the change has been committed"""
+        with self._lock:
+            for user_id in user_ids:
+                self._loading.pop(user_id, None)
+                if self._entries.pop(user_id, None) is not None:
+                    self.stats['invalidations'] += 1
+        if self.shared is not None and user_ids:
+            self.shared.delete(user_ids)
+
+    def invalidate_after_commit(self, session, *user_ids):
+        """Invalidate once ``session`` commits (or rolls back); see ``watch()``"""
+        session.info.setdefault(self.SESSION_KEY, set()).update(user_ids)
+
+    def watch(self, session):
+        """Run the invalidations queued on ``session`` (a Session, class or scoped_session)"""
+        @event.listens_for(session, 'after_commit')
+        @event.listens_for(session, 'after_soft_rollback')
+        def _flush_invalidations(session, *args):
+            user_ids = session.info.pop(self.SESSION_KEY, None)
+            if user_ids:
+                self.invalidate(*user_ids)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loading.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
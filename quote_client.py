@@ -0,0 +1,244 @@
+"""
+Resilient HTTP client for the upstream quote API.
+
+One keep-alive ``requests.Session`` per client, with at most
+``max_connections`` requests in flight to the host. Each fetch has an
+overall ``deadline``: attempts that fail with a transient error (connection
+error, timeout, 429, 5xx) are retried with full-jitter exponential backoff
+while the deadline allows, and an attempt still unanswered after
+``hedge_after`` seconds gets a duplicate racing it (first answer wins).
+
+A circuit breaker watches consecutive failed attempts. Once it opens,
+fetches fail immediately with QuoteUnavailable for ``reset_timeout``
+seconds instead of tying up workers; then a single probe decides whether
+to close it again. Callers (QuoteCache) serve stale or last-known prices
+meanwhile.
+
+``requests`` is imported when the first fetch opens the session, so web
+workers that never fetch a quote don't pay for it at boot.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+YAHOO_QUOTE_URL = 'https://query1.finance.yahoo.com/v7/finance/quote'
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+
+class QuoteUnavailable(Exception):
+    """Upstream quotes can't be had right now (breaker open, deadline passed, or errors)"""
+
+
+class TransientError(Exception):
+    """An attempt failed in a way worth retrying"""
+
+
+def parse_quote_response(data):
+    """``{symbol: price}`` from a Yahoo ``/v7/finance/quote`` response body"""
+    prices = {}
+    for item in (data.get('quoteResponse') or {}).get('result') or []:
+        price = float(item.get('regularMarketPrice', 0) or 0)
+        if item.get('symbol') and price > 0:
+            prices[item['symbol']] = price
+    return prices
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a request may go upstream now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class QuoteClient:
+    """Pooled, deadline-bounded quote fetcher; call it like ``fetch(symbols) -> {symbol: price}``.
+
+    ``url`` defaults to QUOTE_API_URL (read per call, so tests and benchmarks
+    can point a running app at a stub server). ``metrics`` is an optional
+    instrumentation.Metrics receiving per-attempt latency.
+    """
+
+    def __init__(self, url=None, connect_timeout=1.0, read_timeout=2.0, deadline=3.0, retries=2,
+                 backoff=0.1, hedge_after=0.5, max_connections=16, breaker=None, metrics=None):
+        self.url = url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.histogram('quote_attempt_duration_seconds', 'Upstream quote API attempt latency, by outcome')
+        self.max_connections = max_connections
+        self._session = None
+        # The executor's size is the per-host concurrency limit; extra attempts queue here
+        self._executor = ThreadPoolExecutor(max_connections, thread_name_prefix='quote-client')
+        self._lock = threading.Lock()
+        self.stats = {'fetches': 0, 'attempts': 0, 'errors': 0, 'retries': 0, 'hedges': 0,
+                      'hedge_wins': 0, 'short_circuited': 0, 'deadline_exceeded': 0}
+
+    @property
+    def session(self):
+        """The keep-alive session, opened on first use"""
+        if self._session is None:
+            try:
+                import requests
+                from requests.adapters import HTTPAdapter
+            except ImportError:
+                raise RuntimeError('requests library not installed. Run: pip install requests') from None
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_connections, max_retries=0)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def __call__(self, symbols):
+        return self.fetch(symbols)
+
+    def breaker_stats(self):
+        return {'state': {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}[self.breaker.state],
+                'consecutive_failures': self.breaker.failures, 'opened': self.breaker.opened}
+
+    def fetch(self, symbols):
+        self._count('fetches')
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise QuoteUnavailable('quote API circuit is open')
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                prices = self._hedged(symbols, deadline)
+            except TransientError as e:
+                self.breaker.failure()
+                attempt += 1
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                if attempt > self.retries or time.monotonic() + delay >= deadline:
+                    raise QuoteUnavailable(str(e)) from e
+                time.sleep(delay)
+                if not self.breaker.allow():
+                    self._count('short_circuited')
+                    raise QuoteUnavailable('quote API circuit is open') from e
+                self._count('retries')
+                continue
+            except Exception:
+                # Upstream answered (e.g. a 4xx): a caller problem, not an outage
+                self.breaker.success()
+                raise
+            self.breaker.success()
+            return prices
+
+    def _hedged(self, symbols, deadline):
+        """One logical attempt: the request, plus a duplicate if it is slow to answer"""
+        first = self._executor.submit(self._get, symbols, deadline)
+        try:
+            return first.result(timeout=min(self.hedge_after or self.deadline, max(0.0, deadline - time.monotonic())))
+        except FutureTimeout:
+            pass
+        if self.hedge_after and time.monotonic() < deadline:
+            self._count('hedges')
+            pending = {first, self._executor.submit(self._get, symbols, deadline)}
+        else:
+            pending = {first}
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = future.exception()
+        if error is not None and not isinstance(error, TransientError):
+            raise error
+        if error is None:
+            self._count('deadline_exceeded')
+        raise error or TransientError('quote API deadline exceeded')
+
+    def _get(self, symbols, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TransientError('quote API deadline exceeded while queued')
+        session = self.session
+        from requests import RequestException
+        self._count('attempts')
+        url = self.url or os.environ.get('QUOTE_API_URL', YAHOO_QUOTE_URL)
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            try:
+                response = session.get(url, params={'symbols': ','.join(symbols)},
+                                            timeout=(self.connect_timeout, min(self.read_timeout, remaining)))
+            except RequestException as e:
+                raise TransientError(f'quote API request failed: {e}') from e
+            if response.status_code == 429 or response.status_code >= 500:
+                raise TransientError(f'quote API answered {response.status_code}')
+            response.raise_for_status()
+            try:
+                prices = parse_quote_response(response.json())
+            except ValueError as e:
+                raise TransientError(f'quote API sent an unreadable body: {e}') from e
+            outcome = 'ok'
+            return prices
+        except Exception:
+            self._count('errors')
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe('quote_attempt_duration_seconds', time.perf_counter() - started,
+                                     outcome=outcome)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._session is not None:
+            self._session.close()
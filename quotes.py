@@ -0,0 +1,270 @@
+"""
+Server-side quote cache shared by every request in a worker.
+
+Quotes are cached per symbol with a TTL and LRU eviction. Concurrent misses
+for the same symbol wait on a single in-flight fetch, and misses from
+different requests that arrive within a short batch window are merged into
+one upstream call. Typeahead prefetches run on a small shared executor,
+at most ``max_prefetch`` symbols outstanding.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from quote_client import QuoteClient
+
+logger = logging.getLogger(__name__)
+
+
+class QuoteSource:
+    """Pluggable source of prices: ``fetch(symbols) -> {symbol: price}``.
+
+    Instances are callable so they can be handed straight to QuoteCache as
+    its fetcher.
+    """
+
+    def fetch(self, symbols):
+        raise NotImplementedError
+
+    def __call__(self, symbols):
+        return self.fetch(symbols)
+
+
+class YahooQuoteSource(QuoteSource):
+    """Yahoo's batch quote endpoint (or a stub server via ``url``) through a pooled QuoteClient"""
+
+    def __init__(self, url=None, **client_options):
+        self.client = QuoteClient(url=url, **client_options)
+
+    def fetch(self, symbols):
+        return self.client.fetch(symbols)
+
+
+class ReplayQuoteSource(QuoteSource):
+    """Replays recorded price frames, advancing one frame per fetch.
+
+    ``frames`` is a list of ``{symbol: price}`` dicts, or a path to a file
+    holding one JSON frame per line. Replay wraps around at the end, and
+    symbols missing from a frame keep their last replayed price.
+    """
+
+    def __init__(self, frames):
+        if isinstance(frames, str):
+            with open(frames) as f:
+                frames = [json.loads(line) for line in f if line.strip()]
+        if not frames:
+            raise ValueError('ReplayQuoteSource needs at least one frame')
+        self._frames = frames
+        self._position = 0
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, symbols):
+        with self._lock:
+            self._last.update(self._frames[self._position % len(self._frames)])
+            self._position += 1
+            return {s: float(self._last[s]) for s in symbols if s in self._last}
+
+
+class FakeQuoteSource(QuoteSource):
+    """Deterministic random walk for every symbol asked for"""
+
+    def __init__(self, seed=0, volatility=0.005):
+        self._rng = random.Random(seed)
+        self._volatility = volatility
+        self._prices = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, symbols):
+        with self._lock:
+            for s in symbols:
+                if s not in self._prices:
+                    self._prices[s] = float(20 + (sum(map(ord, s)) * 7) % 480)
+                else:
+                    step = self._rng.uniform(-self._volatility, self._volatility)
+                    self._prices[s] = round(self._prices[s] * (1 + step), 2)
+            return {s: self._prices[s] for s in symbols}
+
+
+class QuoteCache:
+    """TTL + LRU quote cache with request coalescing and batched upstream fetches.
+
+    When upstream fails, symbols are served from the cache regardless of
+    age, then from ``fallback(symbols) -> {symbol: price}`` (e.g. the last
+    valuation price stored with holdings) for anything never cached.
+    """
+
+    def __init__(self, fetcher=None, ttl=15.0, max_entries=5000,
+                 batch_window=0.02, max_batch=50, fallback=None, prefetch_workers=2, max_prefetch=200):
+        self._fetcher = fetcher or YahooQuoteSource()
+        self._fallback = fallback
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._entries = OrderedDict()   # symbol -> (price, fetched_at)
+        self._inflight = {}             # symbol -> Future shared by all waiters
+        self._pending = []              # symbols queued for the next batch
+        self._prefetching = set()       # symbols claimed by a queued or running prefetch
+        self._prefetcher = None         # created on first use, i.e. after any fork
+        self.prefetch_workers = prefetch_workers
+        self.max_prefetch = max_prefetch
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'upstream_calls': 0, 'errors': 0,
+                      'stale_served': 0, 'fallback_served': 0, 'prefetch_dropped': 0}
+
+    def _store(self, symbol, price, now):
+        self._entries[symbol] = (price, now)
+        self._entries.move_to_end(symbol)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def peek(self, symbol):
+        """Cached price regardless of age, or None"""
+        with self._lock:
+            entry = self._entries.get(symbol)
+            return entry[0] if entry else None
+
+    def peek_many(self, symbols):
+        """Cached prices regardless of age, without ever touching upstream"""
+        with self._lock:
+            return {s: self._entries[s][0] for s in symbols if s in self._entries}
+
+    def prefetch(self, symbols):
+        """Warm the cache for symbols that are stale and not already being fetched, without waiting.
+
+        Symbols beyond ``max_prefetch`` outstanding are dropped, not queued.
+        """
+        now = time.monotonic()
+        with self._lock:
+            missing = [s for s in dict.fromkeys(symbols) if s and s not in self._inflight
+                       and s not in self._prefetching
+                       and not (s in self._entries and now - self._entries[s][1] <= self.ttl)]
+            room = max(0, self.max_prefetch - len(self._prefetching))
+            self.stats['prefetch_dropped'] += max(0, len(missing) - room)
+            missing = missing[:room]
+            if not missing:
+                return
+            self._prefetching.update(missing)
+            if self._prefetcher is None:
+                self._prefetcher = ThreadPoolExecutor(self.prefetch_workers, thread_name_prefix='quote-prefetch')
+        self._prefetcher.submit(self._prefetch, missing)
+
+    def _prefetch(self, symbols):
+        try:
+            self.get_many(symbols)
+        except Exception:
+            logger.exception("Quote prefetch failed for %d symbols", len(symbols))
+        finally:
+            with self._lock:
+                self._prefetching.difference_update(symbols)
+
+    def get(self, symbol, timeout=10, stale_ok=True):
+        return self.get_many([symbol], timeout=timeout, stale_ok=stale_ok).get(symbol)
+
+    def get_many(self, symbols, timeout=10, stale_ok=True):
+        """Return ``{symbol: price}`` for every symbol that could be priced.
+
+        Fresh entries are served from memory. Misses join an existing
+        in-flight fetch if there is one, otherwise they are queued for the
+        next batch. If upstream fails, stale cached prices are returned,
+        then fallback prices; with ``stale_ok=False`` (prices that will be
+        traded at) those symbols are left out instead.
+        """
+        now = time.monotonic()
+        prices = {}
+        waiting = {}
+        lead = False
+        with self._lock:
+            for symbol in dict.fromkeys(s for s in symbols if s):
+                entry = self._entries.get(symbol)
+                if entry and now - entry[1] <= self.ttl:
+                    self._entries.move_to_end(symbol)
+                    prices[symbol] = entry[0]
+                    self.stats['hits'] += 1
+                    continue
+                self.stats['misses'] += 1
+                future = self._inflight.get(symbol)
+                if future is not None:
+                    self.stats['coalesced'] += 1
+                else:
+                    future = Future()
+                    self._inflight[symbol] = future
+                    if not self._pending:
+                        lead = True
+                    self._pending.append(symbol)
+                waiting[symbol] = future
+
+        if lead:
+            self._run_batch()
+
+        degraded = []
+        for symbol, future in waiting.items():
+            try:
+                price = future.result(timeout=timeout)
+            except Exception:
+                if not stale_ok:
+                    continue
+                price = self.peek(symbol)
+                if price is None:
+                    degraded.append(symbol)
+                else:
+                    self.stats['stale_served'] += 1
+            if price is not None:
+                prices[symbol] = price
+        if degraded and self._fallback is not None:
+            try:
+                last_known = self._fallback(degraded)
+            except Exception:
+                logger.exception("Quote fallback failed for %d symbols", len(degraded))
+                last_known = {}
+            self.stats['fallback_served'] += len(last_known)
+            prices.update(last_known)
+        return prices
+
+    def _run_batch(self):
+        """Leader side: wait out the batch window, then fetch everything queued"""
+        deadline = time.monotonic() + self.batch_window
+        while True:
+            with self._lock:
+                if len(self._pending) >= self.max_batch or time.monotonic() >= deadline:
+                    batch, self._pending = self._pending, []
+                    break
+            time.sleep(min(0.002, max(0.0, deadline - time.monotonic())))
+
+        for i in range(0, len(batch), self.max_batch):
+            self._fetch_chunk(batch[i:i + self.max_batch])
+
+    def _fetch_chunk(self, chunk):
+        try:
+            with self._lock:
+                self.stats['upstream_calls'] += 1
+            fetched = self._fetcher(chunk)
+            error = None
+        except Exception as e:
+            fetched = {}
+            error = e
+        now = time.monotonic()
+        with self._lock:
+            if error is not None:
+                self.stats['errors'] += 1
+            for symbol in chunk:
+                price = fetched.get(symbol)
+                if price is not None:
+                    self._store(symbol, price, now)
+                future = self._inflight.pop(symbol, None)
+                if future is None:
+                    continue
+                # Waiters fall back to stale prices on errors, not on unknown symbols
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(price)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
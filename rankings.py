@@ -0,0 +1,239 @@
+"""
+In-memory ranking structures.
+
+RankIndex keeps every user ordered by portfolio value so a trade only has to
+move the one user whose value changed, and a rank lookup is a binary search
+instead of a full-table ORDER BY plus an N-row UPDATE.
+
+FriendsRankingCache holds each user's ranked friends list and drops exactly
+the lists a user appears on when their value or friendships change.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from reloading import BackgroundReload
+
+
+class _BucketedSortedList:
+    """Sorted list split into bounded buckets so inserts and deletes stay cheap at 1M+ entries.
+
+    A single flat list pays an O(N) memmove per insert/delete; here only one
+    bucket of at most ``2 * load`` items is shifted. Bucket sizes are kept in
+    a Fenwick tree so counting the entries ahead of a bucket is O(log B).
+    """
+
+    def __init__(self, items=(), load=1000):
+        self._load = load
+        items = sorted(items)
+        self._buckets = [items[i:i + load] for i in range(0, len(items), load)]
+        self._maxes = [b[-1] for b in self._buckets]
+        self._len = len(items)
+        self._rebuild_tree()
+
+    def _rebuild_tree(self):
+        tree = [0] + [len(b) for b in self._buckets]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, pos, delta):
+        i = pos + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _tree_prefix(self, pos):
+        """Total size of buckets [0, pos)"""
+        total = 0
+        i = pos
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def __len__(self):
+        return self._len
+
+    def add(self, key):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            self._rebuild_tree()
+            return
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            pos -= 1
+        bucket = self._buckets[pos]
+        insort(bucket, key)
+        self._maxes[pos] = bucket[-1]
+        self._len += 1
+        if len(bucket) > 2 * self._load:
+            half = bucket[self._load:]
+            del bucket[self._load:]
+            self._buckets.insert(pos + 1, half)
+            self._maxes[pos] = bucket[-1]
+            self._maxes.insert(pos + 1, half[-1])
+            self._rebuild_tree()
+        else:
+            self._tree_add(pos, 1)
+
+    def discard(self, key):
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            return
+        bucket = self._buckets[pos]
+        i = bisect_left(bucket, key)
+        if i == len(bucket) or bucket[i] != key:
+            return
+        del bucket[i]
+        self._len -= 1
+        if bucket:
+            self._maxes[pos] = bucket[-1]
+            self._tree_add(pos, -1)
+        else:
+            del self._buckets[pos]
+            del self._maxes[pos]
+            self._rebuild_tree()
+
+    def index(self, key):
+        """Number of entries strictly less than ``key``"""
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            return self._len
+        return self._tree_prefix(pos) + bisect_left(self._buckets[pos], key)
+
+
+class RankIndex(BackgroundReload):
+    """Ordered (portfolio_value desc, user_id asc) index with O(log N) rank lookups.
+
+    The index is per-process. ``loader`` returns ``(user_id, portfolio_value)``
+    pairs and is used to build the index on first access and to rebuild it
+    in the background every ``ttl`` seconds (see ``reloading``), so changes
+    made by other gunicorn workers are picked up with bounded staleness.
+    ``ttl=None`` disables the periodic rebuild.
+    """
+
+    def __init__(self, loader=None, ttl=60.0):
+        self._keys = _BucketedSortedList()  # (-value, user_id), best first
+        self._by_user = {}   # user_id -> key currently stored in _keys
+        self._lock = threading.RLock()
+        self._init_reload(loader, ttl)
+
+    def __len__(self):
+        return len(self._keys)
+
+    @staticmethod
+    def _key(user_id, value):
+        return (-float(value or 0.0), user_id)
+
+    @staticmethod
+    def _move(by_user, keys, user_id, key):
+        """Re-file ``user_id`` under ``key`` (None removes them)"""
+        old_key = by_user.pop(user_id, None)
+        if old_key is not None:
+            keys.discard(old_key)
+        if key is not None:
+            keys.add(key)
+            by_user[user_id] = key
+
+    def _build(self, pairs):
+        by_user = {user_id: self._key(user_id, value) for user_id, value in pairs}
+        return by_user, _BucketedSortedList(by_user.values())
+
+    def _replay(self, built, change):
+        self._move(*built, *change)
+
+    def _install(self, built):
+        self._by_user, self._keys = built
+
+    def update(self, user_id, value):
+        """Move a single user to their new portfolio value and return their rank"""
+        self._ensure_fresh()
+        new_key = self._key(user_id, value)
+        with self._lock:
+            self._move(self._by_user, self._keys, user_id, new_key)
+            self._track((user_id, new_key))
+            return self._keys.index(new_key) + 1
+
+    def remove(self, user_id):
+        """Drop a user from the index"""
+        with self._lock:
+            self._move(self._by_user, self._keys, user_id, None)
+            self._track((user_id, None))
+
+    def rank(self, user_id):
+        """1-based global rank of a user, or None if the user is not indexed"""
+        self._ensure_fresh()
+        with self._lock:
+            key = self._by_user.get(user_id)
+            if key is None:
+                return None
+            return self._keys.index(key) + 1
+
+
+class FriendsRankingCache:
+    """Per-user friends leaderboards with member-level invalidation.
+
+    Each entry remembers whose values it contains, so ``invalidate(user_id)``
+    drops that user's own board and every cached board they appear on. The
+    TTL bounds staleness from changes made elsewhere (other workers, the
+    price worker).
+    """
+
+    def __init__(self, ttl=30.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # owner -> (built_at, members, value)
+        self._appears_on = {}           # member -> owners whose cached board lists them
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, owner):
+        with self._lock:
+            entry = self._entries.get(owner)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(owner)
+                self.stats['hits'] += 1
+                return entry[2]
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, owner, members, value):
+        with self._lock:
+            self._drop(owner)
+            members = frozenset(members)
+            self._entries[owner] = (time.monotonic(), members, value)
+            for member in members:
+                self._appears_on.setdefault(member, set()).add(owner)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, user_id):
+        """``user_id``'s value or friend set changed"""
+        with self._lock:
+            owners = self._appears_on.get(user_id, set()) | {user_id}
+            for owner in owners:
+                if owner in self._entries:
+                    self.stats['invalidations'] += 1
+                self._drop(owner)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._appears_on.clear()
+
+    def _drop(self, owner):
+        entry = self._entries.pop(owner, None)
+        if entry is None:
+            return
+        for member in entry[1]:
+            owners = self._appears_on.get(member)
+            if owners is not None:
+                owners.discard(owner)
+                if not owners:
+                    del self._appears_on[member]
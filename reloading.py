@@ -0,0 +1,84 @@
+"""
+Background reloads for per-process in-memory indexes.
+
+RankIndex and FriendGraph are built from a full table scan and then kept
+current by this worker's own edits. Changes made by other workers are
+picked up by rebuilding every ``ttl`` seconds. The rebuild must not stall
+the requests reading the index, so it runs in a background thread into a
+new structure. Readers keep the old one until the new one is swapped in,
+and edits made in the meantime are replayed onto the new one first.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundReload:
+    """Mixin: loader-driven rebuilds that never block readers.
+
+    The class sets ``self._lock`` (guarding its structure) and calls
+    ``_init_reload()``. It implements ``_build(data)`` (runs outside the
+    lock), ``_replay(built, change)`` and ``_install(built)`` (both under
+    the lock). It calls ``_ensure_fresh()`` before taking the lock and
+    ``_track(change)`` under the lock for every edit it makes.
+    """
+
+    def _init_reload(self, loader, ttl):
+        self._loader = loader
+        self._ttl = ttl
+        self._loaded_at = None
+        self._stale = False
+        self._changes = None        # edits made while a rebuild runs, replayed in order
+        self._first_load = threading.Lock()
+
+    def load(self, data):
+        """Replace the contents with ``data`` (what the loader returns)"""
+        built = self._build(data)
+        with self._lock:
+            for change in self._changes or ():
+                self._replay(built, change)
+            self._install(built)
+            self._loaded_at = time.monotonic()
+            self._stale = False
+
+    def invalidate(self):
+        """Rebuild from the loader on next access"""
+        with self._lock:
+            self._stale = True
+
+    def _track(self, change):
+        if self._changes is not None:
+            self._changes.append(change)
+
+    def _ensure_fresh(self):
+        """Load on first use; afterwards start a background rebuild when stale. Call without the lock held."""
+        if self._loader is None:
+            return
+        if self._loaded_at is None:
+            # Nothing to serve yet: the first caller loads, the others wait for it
+            with self._first_load:
+                if self._loaded_at is None:
+                    self.load(self._loader())
+            return
+        with self._lock:
+            if self._changes is not None or not (
+                self._stale or (self._ttl is not None and time.monotonic() - self._loaded_at > self._ttl)
+            ):
+                return
+            self._changes = []
+        threading.Thread(target=self._rebuild, name=f'{type(self).__name__}-rebuild', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.load(self._loader())
+        except Exception:
+            logger.exception("%s rebuild failed; serving the previous copy", type(self).__name__)
+            with self._lock:
+                # Retry after another ttl rather than on every request
+                self._loaded_at = time.monotonic()
+                self._stale = False
+        finally:
+            with self._lock:
+                self._changes = None
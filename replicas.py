@@ -0,0 +1,89 @@
+"""
+Read-replica routing for the Flask-SQLAlchemy session.
+
+Views marked ``@router.read_only`` send their SELECTs to one of the replica
+engines, configured as SQLALCHEMY_BINDS entries and picked once per request
+so the request reads a single consistent replica. Everything else goes to
+the primary: other views, background threads and CLI commands, flushes and
+DML, ``SELECT ... FOR UPDATE`` and raw SQL. Should a read-only view write,
+it reads from the primary for the rest of the request.
+
+Read-your-writes: after a client makes a POST (a trade, a profile edit, a
+login), its requests read from the primary for ``sticky_seconds``, which
+should exceed normal replica lag. The deadline is kept in the signed session
+cookie, so it applies on every worker.
+
+Replicas are only ever read; ``flask init-db`` and migrations run against
+the primary alone.
+"""
+import random
+import threading
+import time
+
+from flask import current_app, request, session as http_session
+from flask_sqlalchemy.session import Session
+
+REPLICA_KEY = 'replica_bind'
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+
+
+class RoutingSession(Session):
+    """Sends plain SELECTs to the replica bind named in ``info[REPLICA_KEY]``, if the request set one"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get(REPLICA_KEY)
+        if replica is not None and bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False) or getattr(clause, '_for_update_arg', None):
+                # The request writes: from here on it reads what it wrote
+                del self.info[REPLICA_KEY]
+            elif getattr(clause, 'is_select', False):
+                return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Picks the engine for each request's reads. With no replicas, every request uses the primary.
+
+    ``replicas`` are SQLALCHEMY_BINDS keys; the extension's session must be a
+    RoutingSession (``SQLAlchemy(session_options={'class_': RoutingSession})``).
+    """
+
+    STICKY_KEY = '_primary_until'
+
+    def __init__(self, replicas=(), sticky_seconds=5.0):
+        self.replicas = list(replicas)
+        self.sticky_seconds = sticky_seconds
+        self.db = None
+        self._lock = threading.Lock()
+        self.stats = {'replica_requests': 0, 'sticky_requests': 0}
+
+    def init_app(self, app, db):
+        self.db = db
+        app.before_request(self._route)
+        app.after_request(self._stick)
+
+    def read_only(self, view):
+        """Mark a view as safe to serve from a replica"""
+        view.replica_reads = True
+        return view
+
+    def _route(self):
+        if not self.replicas:
+            return
+        view = current_app.view_functions.get(request.endpoint)
+        if not getattr(view, 'replica_reads', False):
+            return
+        if http_session.get(self.STICKY_KEY, 0) > time.time():
+            self._count('sticky_requests')
+            return
+        self.db.session.info[REPLICA_KEY] = random.choice(self.replicas)
+        self._count('replica_requests')
+
+    def _stick(self, response):
+        if self.replicas and request.method not in SAFE_METHODS:
+            http_session[self.STICKY_KEY] = time.time() + self.sticky_seconds
+        return response
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
@@ -0,0 +1,252 @@
+"""
+Bulk seeding of users, holdings, transactions and friendships.
+
+Everything is generated in memory and written in chunks: COPY on
+PostgreSQL, multi-row INSERTs elsewhere. Nothing is checked per row.
+Existing usernames and friendships are loaded once into sets and
+skipped. Every seeded user shares one precomputed hash of the default
+password.
+
+The rows bypass the ORM, so the counter hooks don't fire and nothing is
+ranked. Callers follow up with set-based statements: see ``seed_users()``
+in app.py, which repairs counters and rebuilds the leaderboard in
+aggregate.
+"""
+import io
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from friends import canonical_edge
+
+DEFAULT_PASSWORD = 'password123'
+STARTING_CASH = 10000.0
+CHUNK = 10000
+
+DEMO_USERNAMES = [
+    "alex_trader", "sarah_invests", "mike_wallstreet", "emma_stocks", "james_market",
+    "lisa_portfolio", "david_trades", "olivia_finance", "chris_investor", "sophia_wealth",
+    "ryan_trading", "mia_stocks", "noah_market", "ava_invests", "ethan_portfolio",
+    "isabella_trader", "lucas_finance", "amelia_stocks", "henry_market", "charlotte_invests",
+    "benjamin_trades", "harper_portfolio", "mason_finance", "ella_stocks", "jackson_market",
+    "luna_invests", "aiden_trader", "zoe_portfolio", "carter_finance",
+]
+
+SYMBOLS = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA', 'META', 'TSLA', 'BRK-B', 'JPM', 'V',
+           'UNH', 'XOM', 'JNJ', 'WMT', 'MA', 'PG', 'HD', 'CVX', 'KO', 'PEP',
+           'COST', 'ABBV', 'MRK', 'AVGO', 'ORCL', 'ADBE', 'CRM', 'NFLX', 'AMD', 'INTC',
+           'DIS', 'NKE', 'PFE', 'BAC', 'CSCO', 'T', 'VZ', 'QCOM', 'IBM', 'SBUX']
+
+AVATAR_COLORS = ['#00b8ff', '#9d4edd', '#00ff88', '#ff6b6b', '#ffd700', '#ff8c00']
+
+
+def reference_price(symbol):
+    """Stable per-symbol starting price (the same walk origin as the fake quote sources)"""
+    return float(20 + (sum(map(ord, symbol)) * 7) % 480)
+
+
+# --- bulk writes ---------------------------------------------------------------
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _with_defaults(table, rows):
+    """Fill in the columns' Python-side defaults, which COPY (unlike INSERT) never applies"""
+    defaults = {}
+    for column in table.columns:
+        if column.primary_key or column.default is None:
+            continue
+        if column.default.is_scalar:
+            defaults[column.name] = column.default.arg
+        elif column.default.is_callable:
+            defaults[column.name] = column.default.arg(None)
+    return [dict(defaults, **row) for row in rows]
+
+
+def _copy(session, table, rows):
+    preparer = session.get_bind().dialect.identifier_preparer
+    columns = list(rows[0])
+    sql = (f'COPY {preparer.format_table(table)} ({", ".join(preparer.quote(c) for c in columns)}) '
+           'FROM STDIN')
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(row[c]) for c in columns))
+        buffer.write('\n')
+    cursor = session.connection().connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):     # psycopg2
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+        else:                                   # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+
+
+def bulk_insert(session, model, rows, chunk=CHUNK):
+    """Write ``rows`` (dicts) into ``model``'s table in chunks; COPY on PostgreSQL"""
+    if not rows:
+        return 0
+    table = model.__table__
+    use_copy = session.get_bind().dialect.name == 'postgresql'
+    if use_copy:
+        rows = _with_defaults(table, rows)
+    for i in range(0, len(rows), chunk):
+        if use_copy:
+            _copy(session, table, rows[i:i + chunk])
+        else:
+            session.execute(insert(table), rows[i:i + chunk])
+    return len(rows)
+
+
+# --- generation ----------------------------------------------------------------
+
+class Seeder:
+    """Generates and bulk-writes demo users with portfolios and friendships"""
+
+    def __init__(self, db, User, Friendship, Holding, Transaction, chunk=CHUNK):
+        self.db = db
+        self.User = User
+        self.Friendship = Friendship
+        self.Holding = Holding
+        self.Transaction = Transaction
+        self.chunk = chunk
+
+    def _portfolio(self, rng, now, holdings, round_trips):
+        """One user's generated holdings and trade history, plus their cash and portfolio value"""
+        cash, value = STARTING_CASH, 0.0
+        positions, trades = [], []
+        for symbol in rng.sample(SYMBOLS, min(len(SYMBOLS), rng.randint(*holdings))):
+            price = reference_price(symbol)
+            shares = min(max(1, int(rng.uniform(300, 2500) / price)), int(cash // price))
+            if shares < 1:
+                break
+            last_price = round(price * rng.uniform(0.8, 1.25), 2)
+            positions.append({'symbol': symbol, 'company_name': symbol, 'shares': shares,
+                              'avg_price': price, 'last_price': last_price})
+            trades.append({'symbol': symbol, 'action': 'BUY', 'shares': shares, 'price': price,
+                           'timestamp': now - timedelta(days=rng.randint(1, 300), seconds=rng.randint(0, 86400))})
+            cash -= shares * price
+            value += shares * last_price
+        # Closed round trips fill in the rest of the history. Each buys no more
+        # than the cash left, so even a total loss can't take cash below zero.
+        for _ in range(rng.randint(*round_trips)):
+            symbol = rng.choice(SYMBOLS)
+            buy = round(reference_price(symbol) * rng.uniform(0.8, 1.2), 2)
+            sell = round(reference_price(symbol) * rng.uniform(0.8, 1.2), 2)
+            shares = min(rng.randint(1, 10), int(cash // buy))
+            if shares < 1:
+                continue
+            opened = now - timedelta(days=rng.randint(2, 365), seconds=rng.randint(0, 86400))
+            trades.append({'symbol': symbol, 'action': 'BUY', 'shares': shares, 'price': buy, 'timestamp': opened})
+            trades.append({'symbol': symbol, 'action': 'SELL', 'shares': shares, 'price': sell,
+                           'timestamp': opened + timedelta(days=1)})
+            cash += shares * (sell - buy)
+        return positions, trades, cash, cash + value
+
+    def seed(self, usernames, password_hash, friends=(2, 5), holdings=(0, 4), round_trips=(0, 3),
+             seed=None, progress=None):
+        """Create every user in ``usernames`` that doesn't exist yet, with portfolios and friendships.
+
+        ``friends``, ``holdings`` and ``round_trips`` are inclusive per-user
+        ranges. Each new user befriends random users from the whole table.
+        Returns counts and per-phase timings; the caller commits.
+        """
+        rng = random.Random(seed)
+        session = self.db.session
+        User = self.User
+        now = datetime.utcnow()
+        report = {'users': 0, 'holdings': 0, 'transactions': 0, 'friendships': 0, 'timings': {}}
+
+        def phase(name, started):
+            report['timings'][name] = time.perf_counter() - started
+            if progress:
+                progress(name, report)
+
+        started = time.perf_counter()
+        taken_names, taken_emails = set(), set()
+        for name, email in session.execute(select(User.username, User.email)):
+            taken_names.add(name)
+            taken_emails.add(email)
+        usernames = [name for name in dict.fromkeys(usernames)
+                     if name not in taken_names and f'{name}@example.com' not in taken_emails]
+        phase('existing users', started)
+
+        started = time.perf_counter()
+        new_ids = []
+        for i in range(0, len(usernames), self.chunk):
+            names = usernames[i:i + self.chunk]
+            portfolios = {name: self._portfolio(rng, now, holdings, round_trips) for name in names}
+            bulk_insert(session, User, [{
+                'username': name,
+                'email': f'{name}@example.com',
+                'password_hash': password_hash,
+                'cash_balance': portfolios[name][2],
+                'portfolio_value': portfolios[name][3],
+                'avatar_color': rng.choice(AVATAR_COLORS),
+                'created_at': now - timedelta(days=rng.randint(1, 365)),
+                'login_count': rng.randint(5, 50),
+                'trades_made': len(portfolios[name][1]),
+                'total_trades_value': sum(t['shares'] * t['price'] for t in portfolios[name][1]),
+                'profile_views': rng.randint(0, 100),
+                'tutorial_completed': rng.random() < 0.5,
+                'is_active': True,
+            } for name in names], self.chunk)
+            ids = dict(session.execute(select(User.username, User.id).where(User.username.in_(names))).all())
+            holding_rows, transaction_rows = [], []
+            for name in names:
+                user_id = ids[name]
+                positions, trades, _, _ = portfolios[name]
+                holding_rows.extend(dict(p, user_id=user_id) for p in positions)
+                transaction_rows.extend(dict(t, user_id=user_id) for t in trades)
+            # Oldest first keeps (user_id, timestamp) inserts roughly in index order
+            transaction_rows.sort(key=lambda t: (t['user_id'], t['timestamp']))
+            report['holdings'] += bulk_insert(session, self.Holding, holding_rows, self.chunk)
+            report['transactions'] += bulk_insert(session, self.Transaction, transaction_rows, self.chunk)
+            report['users'] += len(names)
+            new_ids.extend(ids[name] for name in names)
+        phase('users and portfolios', started)
+
+        started = time.perf_counter()
+        report['friendships'] = self._befriend(rng, now, new_ids, friends)
+        phase('friendships', started)
+        return report
+
+    def _befriend(self, rng, now, user_ids, friends):
+        """Give each of ``user_ids`` random friends from the whole user table, skipping pairs that exist"""
+        if not user_ids:
+            return 0
+        session = self.db.session
+        Friendship = self.Friendship
+        pool = list(session.execute(select(self.User.id)).scalars())
+        if len(pool) < 2:
+            return 0
+        # Pairs packed into one int keep a million-user edge set compact
+        shift = max(pool).bit_length()
+        seen = {a << shift | b for a, b in session.execute(select(Friendship.user_id, Friendship.friend_id))}
+        rows, created = [], 0
+        for user_id in user_ids:
+            for _ in range(min(rng.randint(*friends), len(pool) - 1)):
+                other = rng.choice(pool)
+                if other == user_id:
+                    continue
+                a, b = canonical_edge(user_id, other)
+                key = a << shift | b
+                if key in seen:
+                    continue
+                seen.add(key)
+                rows.append({'user_id': a, 'friend_id': b, 'created_at': now - timedelta(days=rng.randint(1, 30))})
+            if len(rows) >= self.chunk:
+                created += bulk_insert(session, Friendship, rows, self.chunk)
+                rows = []
+        return created + bulk_insert(session, Friendship, rows, self.chunk)
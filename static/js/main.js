@@ -9,6 +9,36 @@ function showMessage(message, type = 'info') {
     console.log(`${type.toUpperCase()}: ${message}`);
 }
 
+// Subscribe to live prices and portfolio value pushed from /stream (Server-Sent Events).
+// handlers: { prices: ({symbol: price}) => ..., portfolio: ({portfolio_value, cash_balance,
+// stocks_value, holdings_changed}) => ... }. The browser reconnects dropped streams itself;
+// a refused stream (server busy) is retried here.
+function openLiveStream(symbols, handlers) {
+    if (!window.EventSource) return null;
+    const query = symbols && symbols.length ? `?symbols=${encodeURIComponent(symbols.join(','))}` : '';
+    const source = new EventSource(`/stream${query}`);
+    if (handlers.prices) {
+        source.addEventListener('prices', e => handlers.prices(JSON.parse(e.data)));
+    }
+    if (handlers.portfolio) {
+        source.addEventListener('portfolio', e => handlers.portfolio(JSON.parse(e.data)));
+    }
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(() => openLiveStream(symbols, handlers), 10000);
+        }
+    };
+    return source;
+}
+
+// Reprice a /get_portfolio_data holding in place from a live price
+function applyLivePrice(holding, price) {
+    holding.current_price = price;
+    holding.total_value = price * holding.shares;
+    holding.gain_loss = (price - holding.avg_price) * holding.shares;
+    holding.gain_loss_percent = holding.avg_price ? ((price - holding.avg_price) / holding.avg_price) * 100 : 0;
+}
+
 // Add any global JavaScript functionality here
 document.addEventListener('DOMContentLoaded', function() {
     console.log('DOM loaded, Investify ready!');
@@ -0,0 +1,267 @@
+"""
+Server-Sent Events fan-out for live prices and portfolio values.
+
+One broadcaster thread per worker polls prices for the union of every
+connected client's symbols (through the shared quote cache, so one
+upstream call serves all connections) and fans changed prices out to the
+subscribers of each symbol.
+
+Slow clients never block the broadcaster and never buffer unboundedly:
+each subscriber keeps only the latest undelivered price per symbol, so a
+client that falls behind just skips intermediate ticks. Portfolio values
+are recomputed on the client's own connection, from the positions it was
+subscribed with, only when a held symbol moved.
+
+Positions change when the user trades, possibly in another worker. Each
+tick, the broadcaster reads the ``data_version`` of every watching user in
+one batch and reloads the positions of those whose version moved, so every
+worker's streams catch up within one interval.
+
+Each idle connection is a blocked ``Event.wait``; run the web workers with
+gevent (see gunicorn.conf.py) so thousands of them cost a greenlet each
+rather than a thread or a whole sync worker.
+"""
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def sse(event, data):
+    """Format one Server-Sent Event"""
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+class Subscriber:
+    """One open stream: its symbols, its owner's positions and the undelivered ticks"""
+
+    def __init__(self, user_id, symbols, positions, cash, prices):
+        self.user_id = user_id
+        self.symbols = set(symbols)
+        self.positions = dict(positions)
+        self.cash = cash
+        self.prices = dict(prices)
+        self.coalesced = 0          # ticks overwritten before the client read them
+        self.closed = False
+        self._pending = {}          # symbol -> latest undelivered price
+        self._positions_changed = False
+        self._last_value = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._wake.set()            # first drain sends the opening portfolio value
+
+    def offer(self, ticks):
+        """Called by the broadcaster; never blocks on the client"""
+        with self._lock:
+            self.coalesced += len(self._pending.keys() & ticks.keys())
+            self._pending.update(ticks)
+        self._wake.set()
+
+    def set_positions(self, cash, positions, prices):
+        with self._lock:
+            self.cash = cash
+            self.positions = dict(positions)
+            for symbol, price in prices.items():
+                # Streamed prices are fresher than the stored ones the caller has
+                self.prices.setdefault(symbol, price)
+            self._positions_changed = True
+        self._wake.set()
+
+    def portfolio_value(self):
+        return self.cash + sum(shares * self.prices.get(symbol, 0.0) for symbol, shares in self.positions.items())
+
+    def drain(self, timeout):
+        """Wait up to ``timeout`` seconds and return the SSE messages now due (possibly none)"""
+        self._wake.wait(timeout)
+        with self._lock:
+            self._wake.clear()
+            pending, self._pending = self._pending, {}
+            positions_changed, self._positions_changed = self._positions_changed, False
+        self.prices.update(pending)
+
+        messages = []
+        if pending:
+            messages.append(sse('prices', pending))
+        if positions_changed or self._last_value is None or self.positions.keys() & pending.keys():
+            value = self.portfolio_value()
+            if positions_changed or self._last_value is None or abs(value - self._last_value) >= 0.005:
+                self._last_value = value
+                messages.append(sse('portfolio', {
+                    'portfolio_value': round(value, 2),
+                    'cash_balance': round(self.cash, 2),
+                    'stocks_value': round(value - self.cash, 2),
+                    'holdings_changed': positions_changed,
+                }))
+        return messages
+
+
+class PriceStream:
+    """Per-worker broadcaster: one upstream poll loop, per-symbol subscriber sets"""
+
+    def __init__(self, fetcher, interval=5.0, heartbeat=15.0, max_subscribers=5000, versions=None, reload=None):
+        """``versions(user_ids)`` returns ``{user_id: data_version}`` and
+        ``reload(user_ids)`` returns ``{user_id: (cash, positions, prices)}``;
+        without them, streams only follow trades made through this worker.
+        """
+        self._fetcher = fetcher
+        self._versions = versions
+        self._reload = reload
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.max_subscribers = max_subscribers
+        self._by_symbol = {}        # symbol -> set of Subscriber
+        self._by_user = {}          # user_id -> set of Subscriber
+        self._synced = {}           # user_id -> data_version its streams' positions reflect
+        self._last = {}             # symbol -> last broadcast price
+        self._count = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {'ticks': 0, 'upstream_polls': 0, 'deliveries': 0, 'rejected': 0, 'errors': 0, 'resyncs': 0}
+
+    # --- subscriptions -----------------------------------------------------
+
+    def subscribe(self, user_id, symbols, positions, cash, prices, version=None):
+        """Register a new stream, or return None if this worker is at capacity.
+
+        ``version`` is the user's ``data_version`` read before ``positions``.
+        """
+        subscriber = Subscriber(user_id, set(symbols) | set(positions), positions, cash, prices)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                self.stats['rejected'] += 1
+                return None
+            self._count += 1
+            self._by_user.setdefault(user_id, set()).add(subscriber)
+            # An older stream of the same user may be behind; keep its version so it gets reloaded
+            self._synced.setdefault(user_id, version)
+            for symbol in subscriber.symbols:
+                self._by_symbol.setdefault(symbol, set()).add(subscriber)
+        self.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Drop a stream (idempotent)"""
+        with self._lock:
+            if subscriber.closed:
+                return
+            subscriber.closed = True
+            self._count -= 1
+            streams = self._by_user.get(subscriber.user_id)
+            if streams is not None:
+                streams.discard(subscriber)
+                if not streams:
+                    del self._by_user[subscriber.user_id]
+                    self._synced.pop(subscriber.user_id, None)
+            for symbol in subscriber.symbols:
+                subscribers = self._by_symbol.get(symbol)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._by_symbol[symbol]
+                        self._last.pop(symbol, None)
+
+    def is_watching(self, user_id):
+        return user_id in self._by_user
+
+    def update_positions(self, user_id, cash, positions, prices):
+        """Re-sync every open stream of ``user_id`` in this worker after a trade"""
+        with self._lock:
+            subscribers = list(self._by_user.get(user_id, ()))
+            for subscriber in subscribers:
+                for symbol in set(positions) - subscriber.symbols:
+                    subscriber.symbols.add(symbol)
+                    self._by_symbol.setdefault(symbol, set()).add(subscriber)
+        for subscriber in subscribers:
+            subscriber.set_positions(cash, positions, prices)
+
+    def resync(self):
+        """Reload the positions of watching users whose data_version moved since their last sync"""
+        if self._versions is None:
+            return 0
+        with self._lock:
+            synced = dict(self._synced)
+        if not synced:
+            return 0
+        current = self._versions(list(synced))
+        changed = [user_id for user_id, version in current.items() if version != synced[user_id]]
+        if not changed:
+            return 0
+        for user_id, (cash, positions, prices) in self._reload(changed).items():
+            self.update_positions(user_id, cash, positions, prices)
+            with self._lock:
+                if user_id in self._synced:
+                    # Read before the reload, so a trade in between is picked up next tick
+                    self._synced[user_id] = current[user_id]
+        self.stats['resyncs'] += len(changed)
+        return len(changed)
+
+    def events(self, subscriber):
+        """SSE body generator for one subscriber; unsubscribes when the client goes away"""
+        try:
+            yield f'retry: {int(self.interval * 1000)}\n\n'
+            if subscriber.prices:
+                yield sse('prices', {s: p for s, p in subscriber.prices.items() if s in subscriber.symbols})
+            while True:
+                messages = subscriber.drain(self.heartbeat)
+                if messages:
+                    yield ''.join(messages)
+                else:
+                    # Keeps proxies from timing out idle streams and surfaces dead clients
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+    # --- broadcaster -------------------------------------------------------
+
+    def start(self):
+        """Start the broadcaster thread (idempotent; runs in whichever worker subscribes first)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='price-stream', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception:
+                self.stats['errors'] += 1
+                logger.exception("Price stream tick failed")
+
+    def tick(self):
+        """Poll once for every subscribed symbol and fan out the prices that changed"""
+        try:
+            self.resync()
+        except Exception:
+            # Prices still go out; positions catch up on a later tick
+            self.stats['errors'] += 1
+            logger.exception("Price stream position re-sync failed")
+        with self._lock:
+            symbols = list(self._by_symbol)
+        if not symbols:
+            return 0
+        self.stats['upstream_polls'] += 1
+        prices = self._fetcher(symbols)
+
+        deliveries = {}
+        with self._lock:
+            for symbol, price in prices.items():
+                if not price or self._last.get(symbol) == price or symbol not in self._by_symbol:
+                    continue
+                self._last[symbol] = price
+                for subscriber in self._by_symbol[symbol]:
+                    deliveries.setdefault(subscriber, {})[symbol] = price
+        for subscriber, ticks in deliveries.items():
+            subscriber.offer(ticks)
+        self.stats['ticks'] += 1
+        self.stats['deliveries'] += len(deliveries)
+        return len(deliveries)
+
+    def snapshot_stats(self):
+        with self._lock:
+            return dict(self.stats, subscribers=self._count, symbols=len(self._by_symbol))
@@ -0,0 +1,117 @@
+"""
+Offline symbol / company-name index for stock search typeahead.
+
+Loaded once from a bundled CSV (``symbol,name``) into sorted arrays so every
+lookup is a handful of binary searches:
+
+* ticker prefix:      ``AA`` -> AAPL, AAL
+* company word prefix: ``micro`` -> Microsoft, Micron, Advanced Micro Devices
+* one-typo tickers:   ``APPL`` -> AAPL (deletion-neighbourhood lookup)
+"""
+import csv
+import os
+import re
+from bisect import bisect_left
+
+DEFAULT_SYMBOLS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'symbols.csv')
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def _deletes(term):
+    """Every string obtained by removing one character from ``term``"""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a, b):
+    """True if ``a`` becomes ``b`` with at most one insertion, deletion or substitution"""
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > 1:
+        return False
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+
+class SymbolIndex:
+    def __init__(self, rows):
+        # Deduplicate on symbol, keeping the first name seen
+        entries = {}
+        for symbol, name in rows:
+            symbol = (symbol or '').strip().upper()
+            if symbol and symbol not in entries:
+                entries[symbol] = (name or '').strip()
+        self.symbols = sorted(entries)
+        self.names = [entries[s] for s in self.symbols]
+
+        # (word, position) for every word of every company name
+        self._words = sorted(
+            (word, i) for i, name in enumerate(self.names) for word in set(_WORD.findall(name.lower()))
+        )
+        self._word_keys = [w for w, _ in self._words]
+
+        # deletion variant -> positions, for edit-distance-1 ticker matches
+        self._typos = {}
+        for i, symbol in enumerate(self.symbols):
+            for variant in _deletes(symbol) | {symbol}:
+                self._typos.setdefault(variant, []).append(i)
+
+    @classmethod
+    def from_csv(cls, path=DEFAULT_SYMBOLS_FILE):
+        with open(path, newline='', encoding='utf-8') as f:
+            return cls((row.get('symbol'), row.get('name')) for row in csv.DictReader(f))
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def _symbol_prefix(self, prefix):
+        i = bisect_left(self.symbols, prefix)
+        while i < len(self.symbols) and self.symbols[i].startswith(prefix):
+            yield i
+            i += 1
+
+    def _word_prefix(self, prefix):
+        i = bisect_left(self._word_keys, prefix)
+        while i < len(self._word_keys) and self._word_keys[i].startswith(prefix):
+            yield self._words[i][1]
+            i += 1
+
+    def _fuzzy_symbol(self, query):
+        # Sharing a deletion variant also admits some pairs two edits apart; keep true one-typo matches
+        for variant in _deletes(query) | {query}:
+            for i in self._typos.get(variant, ()):
+                if _within_one_edit(query, self.symbols[i]):
+                    yield i
+
+    def search(self, query, limit=8):
+        """Return up to ``limit`` ``{'symbol', 'name'}`` matches, best first.
+
+        Order: exact ticker, ticker prefix, company-name word prefix (all
+        query words must match), then one-typo tickers.
+        """
+        query = (query or '').strip()
+        if not query:
+            return []
+        ticker = query.upper()
+        words = _WORD.findall(query.lower())
+        seen = []
+
+        def take(positions):
+            for i in positions:
+                if len(seen) >= limit:
+                    return
+                if i not in seen:
+                    seen.append(i)
+
+        take(self._symbol_prefix(ticker))
+        if words and len(seen) < limit:
+            # The longest word drives the scan; every word must prefix some word of the name
+            take(i for i in self._word_prefix(max(words, key=len))
+                 if all(any(n.startswith(w) for n in _WORD.findall(self.names[i].lower())) for w in words))
+        if len(ticker) >= 3 and len(seen) < limit:
+            take(self._fuzzy_symbol(ticker))
+        return [{'symbol': self.symbols[i], 'name': self.names[i]} for i in seen]
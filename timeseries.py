@@ -0,0 +1,318 @@
+"""
+Per-user portfolio value history, stored as packed float32 arrays.
+
+Each ``portfolio_series`` row holds one fixed-length chunk of one user's
+series at one resolution: slot ``i`` is the value at
+``chunk_start + i * step`` (epoch seconds, UTC), NaN where nothing was
+written. The minute series is sparse: a sample is only stored when it
+differs from the user's previous one in the chunk, and readers carry the
+last value forward, so a portfolio that didn't move costs one write per
+hour rather than one per minute. Rollups write every period, and a year
+of daily values is two rows.
+
+Values are float32, so below $131,072 they are stored in steps finer than
+a cent; above that the step doubles with every power of two ($0.0625
+around $1M, $1 around $10M). That is plenty for charts, but the history is
+not a ledger: exact balances live on the user row.
+
+==========  ======  =================  =================
+resolution  step    chunk              default retention
+==========  ======  =================  =================
+minute      1 min   1 hour (60 slots)  2 days
+hour        1 hour  1 week (168)       90 days
+day         1 day   366 days           5 years
+==========  ======  =================  =================
+
+``record()`` samples every user's current ``portfolio_value`` into the
+minute series, a batch of users at a time. ``maintain()`` rolls completed hours and days up from the
+finer series (closing value) and drops chunks past retention. How far each
+resolution has been rolled up is kept in the ``portfolio_rollup`` table, so
+a run (from the price worker or a cron job) only rolls up periods that
+completed since the previous one. ``points()``
+reads a range from the finest resolution that still covers it and
+downsamples to a few hundred points for charting.
+"""
+import math
+import sys
+import time
+from array import array
+
+from sqlalchemy import delete, insert, select
+
+# name -> (step in seconds, slots per chunk). Each coarser step must fit
+# inside one chunk of the finer series it is rolled up from.
+RESOLUTIONS = {
+    'minute': (60, 60),
+    'hour': (3600, 168),
+    'day': (86400, 366),
+}
+ROLLUPS = (('minute', 'hour'), ('hour', 'day'))
+DEFAULT_RETENTION = {'minute': 2 * 86400, 'hour': 90 * 86400, 'day': 5 * 366 * 86400}
+
+
+def pack(values):
+    chunk = array('f', values)
+    if sys.byteorder == 'big':
+        chunk.byteswap()
+    return chunk.tobytes()
+
+
+def unpack(blob):
+    chunk = array('f')
+    chunk.frombytes(blob)
+    if sys.byteorder == 'big':
+        chunk.byteswap()
+    return chunk
+
+
+def empty_chunk(resolution):
+    return array('f', [math.nan]) * RESOLUTIONS[resolution][1]
+
+
+def chunk_start(resolution, ts):
+    step, slots = RESOLUTIONS[resolution]
+    ts = int(ts)
+    return ts - ts % (step * slots)
+
+
+def slot(resolution, ts):
+    step, slots = RESOLUTIONS[resolution]
+    return (int(ts) % (step * slots)) // step
+
+
+def last_value(chunk, i):
+    """The value in effect at slot ``i``: the latest non-NaN slot up to it, or None"""
+    return next((v for v in reversed(chunk[:i + 1]) if not math.isnan(v)), None)
+
+
+def downsample(points, max_points):
+    """Largest-triangle-three-buckets: keep the ``max_points`` that best preserve the line's shape"""
+    n = len(points)
+    if max_points >= n or max_points < 3:
+        return points
+    sampled = [points[0]]
+    every = (n - 2) / (max_points - 2)
+    anchor = 0
+    for i in range(max_points - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        following = points[end:min(int((i + 2) * every) + 1, n)] or points[-1:]
+        avg_x = sum(p[0] for p in following) / len(following)
+        avg_y = sum(p[1] for p in following) / len(following)
+        ax, ay = points[anchor]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        anchor = best
+    sampled.append(points[-1])
+    return sampled
+
+
+class PortfolioHistory:
+    def __init__(self, db, User, PortfolioSeries, PortfolioRollup, retention=None, batch_size=5000):
+        self.db = db
+        self.User = User
+        self.PortfolioSeries = PortfolioSeries
+        self.PortfolioRollup = PortfolioRollup
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.batch_size = batch_size
+        self._pruned_at = 0.0
+
+    # --- storage -------------------------------------------------------------
+
+    def _load(self, resolution, start, user_ids=None):
+        """``{user_id: array}`` for each user's chunk of ``resolution`` starting at ``start``.
+
+        ``user_ids`` is an inclusive ``(first, last)`` id range; by default every user.
+        """
+        Series = self.PortfolioSeries
+        query = select(Series.user_id, Series.data).where(Series.resolution == resolution,
+                                                          Series.chunk_start == start)
+        if user_ids is not None:
+            query = query.where(Series.user_id.between(*user_ids))
+        return {user_id: unpack(data) for user_id, data in self.db.session.execute(query)}
+
+    def _save(self, resolution, start, chunks):
+        if not chunks:
+            return
+        Series = self.PortfolioSeries
+        session = self.db.session
+        rows = [{'user_id': user_id, 'resolution': resolution, 'chunk_start': start, 'data': pack(chunk)}
+                for user_id, chunk in chunks.items()]
+        dialect = session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            stmt = dialect_insert(Series)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id', 'resolution', 'chunk_start'],
+                set_={'data': stmt.excluded.data},
+            )
+            session.execute(stmt, rows)
+            return
+        session.execute(
+            delete(Series).where(Series.resolution == resolution, Series.chunk_start == start,
+                                 Series.user_id.in_(list(chunks)))
+            .execution_options(synchronize_session=False)
+        )
+        session.execute(insert(Series), rows)
+
+    # --- writing -------------------------------------------------------------
+
+    def record(self, now=None):
+        """Sample every user's current portfolio value into the minute series. Returns users sampled.
+
+        Users are read ``batch_size`` at a time in id order, each batch with
+        its chunks. Only users whose value differs from their last sample in
+        the current chunk (or who have no chunk yet this hour) are written.
+        """
+        now = time.time() if now is None else now
+        start, i = chunk_start('minute', now), slot('minute', now)
+        User = self.User
+        sampled, after = 0, None
+        while True:
+            query = select(User.id, User.portfolio_value).order_by(User.id).limit(self.batch_size)
+            if after is not None:
+                query = query.where(User.id > after)
+            values = self.db.session.execute(query).all()
+            if not values:
+                break
+            after = values[-1][0]
+            chunks = self._load('minute', start, (values[0][0], after))
+            # Round through float32 first so an unchanged value compares equal to the stored one
+            sample = array('f', [value or 0.0 for _, value in values])
+            changed = {}
+            for (user_id, _), value in zip(values, sample):
+                chunk = chunks.get(user_id)
+                if chunk is None:
+                    chunk = empty_chunk('minute')
+                elif last_value(chunk, i) == value:
+                    continue
+                chunk[i] = value
+                changed[user_id] = chunk
+            self._save('minute', start, changed)
+            self.db.session.commit()
+            sampled += len(values)
+        return sampled
+
+    def _rollup_period(self, source, target, period):
+        """Write each user's closing ``source`` value in ``[period, period + target step)`` to ``target``"""
+        source_step = RESOLUTIONS[source][0]
+        first = slot(source, period)
+        count = RESOLUTIONS[target][0] // source_step
+        sources = self._load(source, chunk_start(source, period))
+        if not sources:
+            return 0
+        start, i = chunk_start(target, period), slot(target, period)
+        targets = self._load(target, start)
+        changed = {}
+        for user_id, chunk in sources.items():
+            # An hour spans a whole sparse minute chunk, so its last stored sample is the close
+            close = next((v for v in reversed(chunk[first:first + count]) if not math.isnan(v)), None)
+            if close is None:
+                continue
+            target_chunk = targets.get(user_id) or empty_chunk(target)
+            target_chunk[i] = close
+            changed[user_id] = target_chunk
+        self._save(target, start, changed)
+        return len(changed)
+
+    def rollup(self, since, now=None):
+        """Roll up every complete hour and day from ``since`` to ``now``.
+
+        Idempotent; periods before the stored watermark are skipped, and the
+        watermark moves in the same transaction as the values it covers.
+        Returns the number of rolled-up values written.
+        """
+        now = time.time() if now is None else now
+        Rollup = self.PortfolioRollup
+        session = self.db.session
+        rolled = dict(session.execute(select(Rollup.resolution, Rollup.rolled_until)).all())
+        written = 0
+        for source, target in ROLLUPS:
+            step = RESOLUTIONS[target][0]
+            period = int(since) - int(since) % step
+            period = max(period, rolled.get(target, period))
+            complete = int(now) - int(now) % step
+            while period < complete:
+                written += self._rollup_period(source, target, period)
+                period += step
+            if rolled.get(target) != period:
+                session.merge(Rollup(resolution=target, rolled_until=period))
+        session.commit()
+        return written
+
+    def prune(self, now=None):
+        """Delete chunks that end before their resolution's retention window. Returns rows deleted."""
+        now = time.time() if now is None else now
+        Series = self.PortfolioSeries
+        deleted = 0
+        for resolution, (step, slots) in RESOLUTIONS.items():
+            cutoff = now - self.retention[resolution] - step * slots
+            deleted += self.db.session.execute(
+                delete(Series).where(Series.resolution == resolution, Series.chunk_start < cutoff)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        self.db.session.commit()
+        self._pruned_at = now
+        return deleted
+
+    def maintain(self, now=None):
+        """Roll up finished periods (catching up after a restart) and prune at most hourly"""
+        now = time.time() if now is None else now
+        written = self.rollup(now - self.retention['minute'], now)
+        if now - self._pruned_at >= 3600:
+            self.prune(now)
+        return written
+
+    # --- reading -------------------------------------------------------------
+
+    def resolution_for(self, start, now=None):
+        """Finest resolution whose retention still covers ``start``"""
+        now = time.time() if now is None else now
+        for resolution in RESOLUTIONS:
+            if start >= now - self.retention[resolution]:
+                return resolution
+        return 'day'
+
+    def points(self, user_id, start, end, max_points=300, now=None, resolution=None):
+        """``(resolution, [(ts, value), ...])`` for ``[start, end]``, downsampled to ``max_points``.
+
+        ``resolution`` defaults to the finest one that covers ``start``;
+        ``max_points=None`` returns every recorded point.
+        """
+        resolution = resolution or self.resolution_for(start, now)
+        step = RESOLUTIONS[resolution][0]
+        Series = self.PortfolioSeries
+        rows = self.db.session.execute(
+            select(Series.chunk_start, Series.data)
+            .where(Series.user_id == user_id, Series.resolution == resolution,
+                   Series.chunk_start >= chunk_start(resolution, start), Series.chunk_start <= end)
+            .order_by(Series.chunk_start)
+        )
+        now = time.time() if now is None else now
+        sparse = resolution == 'minute'
+        span = step * RESOLUTIONS[resolution][1]
+        points = []
+        last, last_chunk = None, None
+        for start_ts, data in rows:
+            if last_chunk is None or start_ts != last_chunk + span:
+                last = None     # a missing chunk is a gap, not "unchanged"
+            last_chunk = start_ts
+            for i, value in enumerate(unpack(data)):
+                ts = start_ts + i * step
+                if ts > end:
+                    break
+                if not math.isnan(value):
+                    last = value
+                elif not (sparse and last is not None and ts <= now):
+                    continue
+                if ts >= start:
+                    points.append((ts, round(last, 2)))
+        return resolution, points if max_points is None else downsample(points, max_points)
@@ -0,0 +1,228 @@
+"""
+Atomic trade execution.
+
+Every check-and-modify happens inside a single conditional UPDATE, so two
+concurrent trades for the same user (double-clicks, several tabs, several
+workers) can never overdraw cash or oversell shares:
+
+* BUY debits cash with ``UPDATE user ... WHERE cash_balance >= cost`` and
+  upserts the holding with ``INSERT ... ON CONFLICT (user_id, symbol)``.
+* SELL decrements shares with ``UPDATE holding ... WHERE shares >= n``.
+
+Both paths touch the user row first, so trades for one user always take
+row locks in the same order and cannot deadlock on PostgreSQL. The engine
+never commits; the caller owns the transaction.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+TradeResult = namedtuple('TradeResult', 'success message cash_balance portfolio_value')
+BatchResult = namedtuple('BatchResult', 'legs executed cash_balance portfolio_value')
+
+
+class TradeRejected(Exception):
+    """A trade failed validation; nothing was changed"""
+
+
+class TradeEngine:
+    def __init__(self, db, User, Holding, Transaction):
+        self.db = db
+        self.User = User
+        self.Holding = Holding
+        self.Transaction = Transaction
+
+    def _upsert_insert(self):
+        dialect = self.db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            return None
+        return dialect_insert(self.Holding)
+
+    def _buy_holding(self, user_id, symbol, company_name, shares, price):
+        Holding = self.Holding
+        session = self.db.session
+        cost = shares * price
+        stmt = self._upsert_insert()
+        if stmt is not None:
+            stmt = stmt.values(user_id=user_id, symbol=symbol, company_name=company_name,
+                               shares=shares, avg_price=price, last_price=price)
+            excluded_shares = Holding.shares + shares
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id', 'symbol'],
+                set_={
+                    'avg_price': (Holding.avg_price * Holding.shares + cost) / excluded_shares,
+                    'shares': excluded_shares,
+                    'last_price': price,
+                },
+            )
+            session.execute(stmt)
+            return
+
+        # Generic fallback: update, and insert if there was nothing to update
+        result = session.execute(
+            update(Holding)
+            .where(Holding.user_id == user_id, Holding.symbol == symbol)
+            .values(avg_price=(Holding.avg_price * Holding.shares + cost) / (Holding.shares + shares),
+                    shares=Holding.shares + shares, last_price=price)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            try:
+                with session.begin_nested():
+                    session.execute(insert(Holding).values(
+                        user_id=user_id, symbol=symbol, company_name=company_name,
+                        shares=shares, avg_price=price, last_price=price))
+            except IntegrityError:
+                # Lost the race to create the row; it exists now, so update it
+                self._buy_holding(user_id, symbol, company_name, shares, price)
+
+    def revalue(self, user_id):
+        """Recompute one user's portfolio_value in a single aggregate UPDATE, bumping their data_version"""
+        User, Holding = self.User, self.Holding
+        stocks_value = (
+            select(func.coalesce(func.sum(
+                Holding.shares * func.coalesce(func.nullif(Holding.last_price, 0), Holding.avg_price)
+            ), 0.0))
+            .where(Holding.user_id == User.id)
+            .scalar_subquery()
+        )
+        self.db.session.execute(
+            update(User).where(User.id == user_id)
+            .values(portfolio_value=User.cash_balance + stocks_value, data_version=User.data_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    def apply(self, user_id, symbol, action, shares, price, company_name=None):
+        """Apply one validated leg inside the current transaction, raising TradeRejected on failure"""
+        User, Holding = self.User, self.Holding
+        session = self.db.session
+        amount = shares * price
+
+        if action == 'BUY':
+            debited = session.execute(
+                update(User)
+                .where(User.id == user_id, User.cash_balance >= amount)
+                .values(cash_balance=User.cash_balance - amount,
+                        trades_made=func.coalesce(User.trades_made, 0) + 1,
+                        total_trades_value=func.coalesce(User.total_trades_value, 0.0) + amount)
+                .execution_options(synchronize_session=False)
+            )
+            if debited.rowcount == 0:
+                raise TradeRejected('Insufficient cash balance')
+            self._buy_holding(user_id, symbol, company_name or symbol, shares, price)
+        elif action == 'SELL':
+            # Lock the user row first, same order as BUY
+            session.execute(
+                update(User).where(User.id == user_id)
+                .values(cash_balance=User.cash_balance + amount,
+                        trades_made=func.coalesce(User.trades_made, 0) + 1,
+                        total_trades_value=func.coalesce(User.total_trades_value, 0.0) + amount)
+                .execution_options(synchronize_session=False)
+            )
+            sold = session.execute(
+                update(Holding)
+                .where(Holding.user_id == user_id, Holding.symbol == symbol, Holding.shares >= shares)
+                .values(shares=Holding.shares - shares,
+                        avg_price=case((Holding.shares == shares, 0.0), else_=Holding.avg_price),
+                        last_price=price)
+                .execution_options(synchronize_session=False)
+            )
+            if sold.rowcount == 0:
+                raise TradeRejected('Not enough shares to sell')
+        else:
+            raise TradeRejected('Invalid trade request')
+
+        session.execute(insert(self.Transaction).values(
+            user_id=user_id, symbol=symbol, action=action, shares=shares, price=price,
+            timestamp=datetime.utcnow()))
+
+    def execute(self, user_id, symbol, action, shares, price, company_name=None):
+        """Execute a single trade atomically. Does not commit.
+
+        On rejection the transaction is rolled back and a failed TradeResult
+        is returned; on success the caller must commit.
+        """
+        if not symbol or shares <= 0 or price <= 0 or action not in ('BUY', 'SELL'):
+            return TradeResult(False, 'Invalid trade request', None, None)
+        try:
+            self.apply(user_id, symbol, action, shares, price, company_name)
+        except TradeRejected as e:
+            self.db.session.rollback()
+            return TradeResult(False, str(e), None, None)
+        self.revalue(user_id)
+        cash_balance, portfolio_value = self.db.session.execute(
+            select(self.User.cash_balance, self.User.portfolio_value).where(self.User.id == user_id)
+        ).one()
+        return TradeResult(True, 'Trade executed successfully!', cash_balance, portfolio_value)
+
+    def execute_batch(self, user_id, legs, all_or_nothing=False):
+        """Validate and apply many legs against one snapshot, in one transaction. Does not commit.
+
+        ``legs`` is a list of dicts with symbol, action, shares, price and
+        optional company_name. Legs are checked in order against a single
+        read of the user's cash and holdings, so a SELL can use shares bought
+        earlier in the same batch. Rejected legs are skipped unless
+        ``all_or_nothing`` is set, in which case nothing is applied. The
+        conditional UPDATEs still guard every leg; if a concurrent trade
+        invalidates the snapshot, the whole batch is rolled back.
+        """
+        User, Holding = self.User, self.Holding
+        session = self.db.session
+        cash = session.execute(select(User.cash_balance).where(User.id == user_id)).scalar_one()
+        shares_held = dict(session.execute(
+            select(Holding.symbol, Holding.shares).where(Holding.user_id == user_id)
+        ).all())
+
+        results = []
+        accepted = []
+        for index, leg in enumerate(legs):
+            symbol, action = leg.get('symbol'), leg.get('action')
+            shares, price = leg.get('shares', 0), leg.get('price', 0)
+            result = {'index': index, 'symbol': symbol, 'action': action, 'shares': shares, 'price': price}
+            results.append(result)
+            if not symbol or shares <= 0 or price <= 0 or action not in ('BUY', 'SELL'):
+                result.update(success=False, message='Invalid trade request')
+                continue
+            amount = shares * price
+            if action == 'BUY':
+                if cash < amount:
+                    result.update(success=False, message='Insufficient cash balance')
+                    continue
+                cash -= amount
+                shares_held[symbol] = shares_held.get(symbol, 0) + shares
+            else:
+                if shares_held.get(symbol, 0) < shares:
+                    result.update(success=False, message='Not enough shares to sell')
+                    continue
+                cash += amount
+                shares_held[symbol] -= shares
+            result.update(success=True, message='Trade executed successfully!')
+            accepted.append((result, leg))
+
+        if all_or_nothing and len(accepted) < len(legs):
+            for result, _ in accepted:
+                result.update(success=False, message='Not executed: another leg in the batch was rejected')
+            accepted = []
+
+        try:
+            for result, leg in accepted:
+                self.apply(user_id, leg['symbol'], leg['action'], leg['shares'], leg['price'],
+                           leg.get('company_name'))
+        except TradeRejected as e:
+            session.rollback()
+            for result, _ in accepted:
+                result.update(success=False, message=f'Batch aborted by a concurrent trade: {e}')
+            accepted = []
+
+        if accepted:
+            self.revalue(user_id)
+        cash_balance, portfolio_value = session.execute(
+            select(User.cash_balance, User.portfolio_value).where(User.id == user_id)
+        ).one()
+        return BatchResult(results, len(accepted), cash_balance, portfolio_value)